@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+from clock import default_clock
+
+_KEY_SEPARATOR = '\x1f'
+
+
+class AlertSuppressor:
+    """Persistent index of sent alerts keyed by (keyword, normalized query)
+
+    A candidate is alerted again only after the cooldown has passed or when
+    its value reached realert_ratio times the last alerted value. Lookups
+    are a single dict access; state is a small JSON file rewritten
+    atomically.
+    """
+
+    def __init__(self, cooldown_hours=72, realert_ratio=2.0, retention_days=30, normalize=None, clock=default_clock.time):
+        self.cooldown = cooldown_hours * 3600
+        self.realert_ratio = realert_ratio
+        self.retention = retention_days * 86400
+        self.normalize = normalize or (lambda text: text)
+        self.clock = clock
+        self._entries = {}
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Load suppression state from path; starts empty if the file is missing"""
+        suppressor = cls(**kwargs)
+        if not path or not os.path.exists(path):
+            return suppressor
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                suppressor._entries = {key: tuple(entry) for key, entry in json.load(f).items()}
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"Failed to load alert state from {path}, starting fresh: {str(e)}")
+        return suppressor
+
+    def save(self, path):
+        """Write state, dropping entries older than the retention period"""
+        cutoff = self.clock() - self.retention
+        self._entries = {key: entry for key, entry in self._entries.items() if entry[0] >= cutoff}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, keyword, query):
+        return self.normalize(keyword) + _KEY_SEPARATOR + self.normalize(query)
+
+    @staticmethod
+    def _number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+
+    def should_alert(self, keyword, query, value):
+        entry = self._entries.get(self._key(keyword, query))
+        if entry is None:
+            return True
+        last_time, last_value = entry
+        if self.clock() - last_time >= self.cooldown:
+            return True
+        return last_value > 0 and self._number(value) >= last_value * self.realert_ratio
+
+    def filter(self, trends):
+        """Keep (keyword, query, value) candidates that are not suppressed
+
+        Duplicates within the same list (e.g. two spellings of one query)
+        are reduced to their first occurrence.
+        """
+        kept = []
+        seen = set()
+        for keyword, query, value in trends:
+            key = self._key(keyword, query)
+            if key in seen:
+                continue
+            seen.add(key)
+            if self.should_alert(keyword, query, value):
+                kept.append((keyword, query, value))
+        return kept
+
+    def record(self, trends):
+        """Remember alerts that were delivered"""
+        now = self.clock()
+        for keyword, query, value in trends:
+            self._entries[self._key(keyword, query)] = (now, self._number(value))
@@ -0,0 +1,184 @@
+import logging
+import os
+import numpy as np
+from clock import default_clock
+from result_table import TREND_TYPES
+
+_KEY_SEPARATOR = '\x1f'
+
+
+class EwmaDetector:
+    """Per (keyword, related query) EWMA/variance anomaly detector
+
+    State is three numeric arrays plus a key array, stored as a single
+    .npz file so it loads in milliseconds. Detection and updates are
+    vectorized over all rising rows of a ResultTable. Series not seen for
+    max_age_days are dropped on update so the state does not grow forever.
+    """
+
+    def __init__(self, alpha=0.3, z_threshold=3.0, min_samples=3, min_std=10.0,
+                 fallback_threshold=500, normalize=None, max_age_days=90, clock=default_clock.time):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.min_std = min_std
+        self.fallback_threshold = fallback_threshold
+        self.normalize = normalize or (lambda text: text)
+        self.max_age_days = max_age_days
+        self.clock = clock
+        self._keys = []
+        self._index = {}
+        self.mean = np.zeros(0)
+        self.var = np.zeros(0)
+        self.count = np.zeros(0, dtype=np.int32)
+        self.last_seen = np.zeros(0)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Load detector state from path; starts empty if the file is missing"""
+        detector = cls(**kwargs)
+        if not path or not os.path.exists(path):
+            return detector
+        try:
+            with np.load(path, allow_pickle=False) as state:
+                detector._keys = state['keys'].tolist()
+                detector.mean = state['mean'].astype(np.float64)
+                detector.var = state['var'].astype(np.float64)
+                detector.count = state['count'].astype(np.int32)
+                # 旧状态文件没有 last_seen，从加载时开始计算过期
+                if 'last_seen' in state.files:
+                    detector.last_seen = state['last_seen'].astype(np.float64)
+                else:
+                    detector.last_seen = np.full(len(detector._keys), float(detector.clock()))
+            detector._index = {key: i for i, key in enumerate(detector._keys)}
+            logging.info(f"Loaded anomaly state for {len(detector._keys)} series from {path}")
+        except Exception as e:
+            logging.warning(f"Failed to load anomaly state from {path}, starting fresh: {str(e)}")
+            detector = cls(**kwargs)
+        return detector
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=np.array(self._keys, dtype=str), mean=self.mean, var=self.var, count=self.count,
+                     last_seen=self.last_seen)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _rising_rows(self, table):
+        """Return row indices, series keys and values of rising rows with a numeric value"""
+        types = np.asarray(table.types, dtype=np.uint8)
+        values = np.asarray(table.values, dtype=np.float64)
+        # 缺失值（NaN）不参与检测，也不写入历史
+        rows = np.flatnonzero((types == TREND_TYPES.index('rising')) & np.isfinite(values))
+        values = values[rows]
+
+        keyword_keys = [self.normalize(keyword) for keyword in table.keywords]
+        query_keys = {}
+        keyword_ids = np.asarray(table.keyword_ids)[rows]
+        query_ids = np.asarray(table.query_ids)[rows]
+        keys = []
+        for keyword_id, query_id in zip(keyword_ids.tolist(), query_ids.tolist()):
+            query_key = query_keys.get(query_id)
+            if query_key is None:
+                query_key = query_keys[query_id] = self.normalize(table.queries[query_id])
+            keys.append(keyword_keys[keyword_id] + _KEY_SEPARATOR + query_key)
+        return rows, keys, values
+
+    def detect(self, table):
+        """Find rising rows that deviate significantly from their history
+
+        Series with fewer than min_samples observations fall back to the
+        static threshold so new queries can still alert.
+
+        Returns:
+            list: (keyword, related query, value) tuples, largest deviation first
+        """
+        rows, keys, values = self._rising_rows(table)
+        if not len(rows):
+            return []
+
+        idx = np.fromiter((self._index.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+        known = idx >= 0
+        safe_idx = np.where(known, idx, 0)
+        count = np.where(known, self.count[safe_idx] if len(self.count) else 0, 0)
+        mean = np.where(known, self.mean[safe_idx] if len(self.mean) else 0.0, 0.0)
+        std = np.sqrt(np.where(known, self.var[safe_idx] if len(self.var) else 0.0, 0.0))
+        std = np.maximum(std, self.min_std)
+
+        z = (values - mean) / std
+        warm = count >= self.min_samples
+        significant = np.where(warm, z >= self.z_threshold, values > self.fallback_threshold)
+        # 冷启动的序列按静态阈值的超出倍数参与排序
+        score = np.where(warm, z, values / max(self.fallback_threshold, 1))
+
+        alerts = []
+        for i in np.flatnonzero(significant)[np.argsort(-score[significant], kind='stable')]:
+            row = table.row(int(rows[i]))
+            value = row.value
+            alerts.append((row.keyword, row.query, int(value) if value.is_integer() else value))
+        return alerts
+
+    def update(self, table):
+        """Fold this run's rising values into the EWMA state"""
+        rows, keys, values = self._rising_rows(table)
+        if not len(rows):
+            return
+
+        idx = np.empty(len(keys), dtype=np.int64)
+        new_keys = []
+        for i, key in enumerate(keys):
+            series = self._index.get(key)
+            if series is None:
+                series = self._index[key] = len(self._keys)
+                self._keys.append(key)
+                new_keys.append(i)
+            idx[i] = series
+
+        if new_keys:
+            grow = len(self._keys) - len(self.mean)
+            self.mean = np.concatenate([self.mean, np.zeros(grow)])
+            self.var = np.concatenate([self.var, np.zeros(grow)])
+            self.count = np.concatenate([self.count, np.zeros(grow, dtype=np.int32)])
+            self.last_seen = np.concatenate([self.last_seen, np.zeros(grow)])
+
+        # 同一序列在一次运行中出现多次时先取平均，每次运行只更新一步；
+        # 花式索引赋值遇到重复下标只保留最后一个，因此用 np.add.at 聚合
+        series, inverse = np.unique(idx, return_inverse=True)
+        totals = np.zeros(len(series))
+        occurrences = np.zeros(len(series))
+        np.add.at(totals, inverse, values)
+        np.add.at(occurrences, inverse, 1)
+        values = totals / occurrences
+
+        first = self.count[series] == 0
+        delta = values - self.mean[series]
+        new_mean = np.where(first, values, self.mean[series] + self.alpha * delta)
+        new_var = np.where(first, 0.0, (1 - self.alpha) * (self.var[series] + self.alpha * delta ** 2))
+        self.mean[series] = new_mean
+        self.var[series] = new_var
+        self.count[series] += 1
+        self.last_seen[series] = self.clock()
+        self.prune()
+
+    def prune(self, now=None):
+        """Drop series not seen for max_age_days; returns how many were removed"""
+        if not self.max_age_days or not len(self._keys):
+            return 0
+        now = self.clock() if now is None else now
+        keep = self.last_seen >= now - self.max_age_days * 86400
+        removed = int(len(keep) - keep.sum())
+        if removed:
+            self._keys = [key for key, kept in zip(self._keys, keep.tolist()) if kept]
+            self._index = {key: i for i, key in enumerate(self._keys)}
+            self.mean = self.mean[keep]
+            self.var = self.var[keep]
+            self.count = self.count[keep]
+            self.last_seen = self.last_seen[keep]
+            logging.info(f"Pruned {removed} anomaly series not seen for {self.max_age_days} days")
+        return removed
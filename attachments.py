@@ -0,0 +1,193 @@
+import base64
+import fnmatch
+import gzip
+import logging
+import mimetypes
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import zipfile
+from urllib.parse import quote
+from config import NOTIFICATION_CONFIG, SERVICE_CONFIG, STORAGE_CONFIG
+
+CHUNK_SIZE = 64 * 1024
+# base64 每 57 字节输入对应一行 76 个字符，按整行读取可逐块编码
+_BASE64_CHUNK = 57 * 1024
+COMPRESSIONS = {'gzip': '.gz', 'zip': '.zip'}
+FILES_PATH = '/v1/files/'
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def compress_file(source, directory, compression):
+    """Compress source into directory in fixed-size chunks; returns the new path"""
+    name = os.path.basename(source)
+    target = os.path.join(directory, name + COMPRESSIONS[compression])
+    with open(source, 'rb') as src:
+        if compression == 'gzip':
+            # 不写入原文件名和时间，相同内容得到相同的压缩结果
+            with open(target, 'wb') as raw, gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0) as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        else:
+            with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive, \
+                    archive.open(name, 'w', force_zip64=True) as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    return target
+
+
+def iter_base64_lines(f):
+    """Base64-encode a binary file as 76-character CRLF lines, one chunk at a time"""
+    while True:
+        chunk = f.read(_BASE64_CHUNK)
+        if not chunk:
+            break
+        yield base64.encodebytes(chunk).replace(b'\n', b'\r\n')
+
+
+def service_base_url():
+    """Base URL of the local query service, or '' when it is not running"""
+    if not SERVICE_CONFIG.get('enabled', False):
+        return ''
+    host = SERVICE_CONFIG['host']
+    if host in ('', '0.0.0.0', '::'):
+        host = socket.getfqdn()
+    return f"http://{host}:{SERVICE_CONFIG['port']}"
+
+
+def servable(relative, patterns=None):
+    """Whether the query service may serve a file, by its path relative to the data directory"""
+    if patterns is None:
+        patterns = SERVICE_CONFIG.get('file_patterns', [])
+    relative = relative.replace(os.sep, '/')
+    return any(fnmatch.fnmatchcase(relative, pattern) for pattern in patterns)
+
+
+def file_link(path):
+    """Link to a data file through the query service, or its absolute path
+
+    NOTIFICATION_CONFIG['attachment_link_base'] overrides the service
+    address (e.g. behind a reverse proxy). Files outside the data directory
+    or not allowed by SERVICE_CONFIG['file_patterns'] are only reachable
+    by path.
+    """
+    absolute = os.path.abspath(path)
+    base = NOTIFICATION_CONFIG.get('attachment_link_base') or service_base_url()
+    root = os.path.abspath(os.path.dirname(STORAGE_CONFIG['data_dir_prefix']) or '.')
+    if base and os.path.commonpath([root, absolute]) == root:
+        relative = os.path.relpath(absolute, root).replace(os.sep, '/')
+        if servable(relative):
+            return f"{base.rstrip('/')}{FILES_PATH}{quote(relative)}"
+    return absolute
+
+
+class Attachment:
+    """A file ready for delivery: the original or a compressed temporary copy
+
+    Attributes:
+        path (str): Original file, e.g. the CSV report
+        delivery_path (str): File actually sent (path itself when not compressed)
+        filename (str): Name shown to recipients
+        size (int): Bytes sent; original_size is the uncompressed size
+    """
+
+    def __init__(self, path, delivery_path=None):
+        self.path = path
+        self.delivery_path = delivery_path or path
+        self.filename = os.path.basename(self.delivery_path)
+        self.original_size = os.path.getsize(path)
+        self.size = os.path.getsize(self.delivery_path)
+
+    @property
+    def content_type(self):
+        if self.delivery_path.endswith('.gz'):
+            return 'application/gzip'
+        return mimetypes.guess_type(self.filename)[0] or 'application/octet-stream'
+
+    @property
+    def link(self):
+        return file_link(self.path)
+
+    def open(self):
+        return open(self.delivery_path, 'rb')
+
+    def summary(self):
+        if self.size == self.original_size:
+            return f"{os.path.basename(self.path)} ({format_size(self.original_size)})"
+        return (f"{os.path.basename(self.path)} ({format_size(self.original_size)}, "
+                f"{format_size(self.size)} compressed)")
+
+
+class PreparedAttachments:
+    """Attachments of one notification, compressed once and shared by all deliveries
+
+    Compressed copies live in a temporary directory, removed when the last
+    holder calls release(); deliveries still running after a timeout keep
+    their files until they finish.
+    """
+
+    def __init__(self, paths, compression=None, compress_min_bytes=0):
+        if compression and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown attachment compression: {compression}")
+        self.items = []
+        self._directory = None
+        self._holders = 1
+        self._lock = threading.Lock()
+        for path in paths or []:
+            if not os.path.isfile(path):
+                logging.warning(f"Attachment not found, skipping: {path}")
+                continue
+            delivery_path = None
+            if compression and os.path.getsize(path) >= compress_min_bytes:
+                try:
+                    if self._directory is None:
+                        self._directory = tempfile.mkdtemp(prefix='trends_attachments_')
+                    delivery_path = compress_file(path, self._directory, compression)
+                except OSError as e:
+                    logging.warning(f"Failed to compress {path}, sending it uncompressed: {str(e)}")
+            self.items.append(Attachment(path, delivery_path))
+
+    def acquire(self):
+        with self._lock:
+            self._holders += 1
+
+    def release(self):
+        with self._lock:
+            self._holders -= 1
+            if self._holders > 0 or self._directory is None:
+                return
+            directory, self._directory = self._directory, None
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def prepare_attachments(paths):
+    """Compress the given files as configured in NOTIFICATION_CONFIG"""
+    return PreparedAttachments(
+        paths,
+        NOTIFICATION_CONFIG.get('attachment_compression'),
+        NOTIFICATION_CONFIG.get('attachment_compress_min_bytes', 0)
+    )
+
+
+def split_by_size(attachments, max_bytes):
+    """Split into (attachments to send, attachments to link) by delivered size"""
+    if not max_bytes:
+        return list(attachments), []
+    sendable = [a for a in attachments if a.size <= max_bytes]
+    linked = [a for a in attachments if a.size > max_bytes]
+    return sendable, linked
+
+
+def linked_attachments_html(attachments):
+    """Report body section replacing attachments that are too large to send"""
+    if not attachments:
+        return ''
+    items = ''.join(f'<li>{a.summary()}: <a href="{a.link}">{a.link}</a></li>\n' for a in attachments)
+    return f"\n<p>Attachments too large to send, available at:</p>\n<ul>\n{items}</ul>\n"
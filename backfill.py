@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from clock import default_clock
+from keyword_index import normalize_keyword
+
+
+def split_windows(start, end, window_days):
+    """Split an inclusive date range into consecutive windows
+
+    Args:
+        start (str): First day, 'YYYY-MM-DD'
+        end (str): Last day, 'YYYY-MM-DD'
+        window_days (int): Days per window; the last window may be shorter
+
+    Returns:
+        list: Timeframe strings like '2024-01-01 2024-01-07'
+    """
+    start_date = datetime.strptime(start, '%Y-%m-%d')
+    end_date = datetime.strptime(end, '%Y-%m-%d')
+    if end_date < start_date:
+        raise ValueError(f"Backfill end {end} is before start {start}")
+
+    windows = []
+    current = start_date
+    while current <= end_date:
+        window_end = min(current + timedelta(days=window_days - 1), end_date)
+        windows.append(f"{current.strftime('%Y-%m-%d')} {window_end.strftime('%Y-%m-%d')}")
+        current = window_end + timedelta(days=1)
+    return windows
+
+
+def window_day(timeframe):
+    """Storage day (YYYYMMDD) of a window: the day it ends"""
+    return timeframe.split()[-1].replace('-', '')
+
+
+def job_key(keyword, geo, timeframe):
+    return f"{geo}|{timeframe}|{normalize_keyword(keyword)}"
+
+
+class Checkpoint:
+    """Persistent set of finished backfill jobs
+
+    Finished keys are appended to ``<path>.journal``, one line each, so
+    marking a job costs one small write however many jobs are done. The
+    journal is folded into the JSON snapshot at ``path`` every
+    compact_every keys and on close(); after a crash the snapshot and the
+    journal are read together, ignoring a torn last line.
+    """
+
+    def __init__(self, path, compact_every=1000):
+        self.path = path
+        self.journal_path = path + '.journal' if path else None
+        self.compact_every = compact_every
+        self._done = set()
+        self._journal = None
+        self._journaled = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._done = set(json.load(f).get('done', []))
+            except (OSError, ValueError) as e:
+                logging.warning(f"Failed to load backfill checkpoint, starting fresh: {str(e)}")
+        if self.journal_path and os.path.exists(self.journal_path):
+            try:
+                with open(self.journal_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.endswith('\n'):
+                            self._done.add(line[:-1])
+                            self._journaled += 1
+            except OSError as e:
+                logging.warning(f"Failed to read backfill checkpoint journal: {str(e)}")
+
+    def __contains__(self, key):
+        return key in self._done
+
+    def __len__(self):
+        return len(self._done)
+
+    def mark_done(self, key):
+        if key in self._done:
+            return
+        self._done.add(key)
+        if not self.path:
+            return
+        if self._journal is None:
+            directory = os.path.dirname(self.journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal.write(key + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journaled += 1
+        if self._journaled >= self.compact_every:
+            self.save()
+
+    def save(self):
+        """Write the snapshot atomically and empty the journal"""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'done': sorted(self._done)}, f, ensure_ascii=False)
+        os.replace(self.path + '.tmp', self.path)
+        # 快照已包含日志中的所有任务，之后再清空日志
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journaled = 0
+
+    def close(self):
+        if self._journaled:
+            self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def stored_jobs(store, day):
+    """Job keys already present in the store for one storage day"""
+    keys = set()
+    try:
+        for record in store.records(day):
+            # 只有带 timeframe 的记录才能确认覆盖了某个窗口
+            if record.get('keyword') and record.get('timeframe'):
+                keys.add(job_key(record['keyword'], record.get('geo', ''), record['timeframe']))
+    except (OSError, ValueError) as e:
+        logging.warning(f"Failed to read stored results for {day}: {str(e)}")
+    return keys
+
+
+def plan_backfill(keywords, windows, geo='', checkpoint=None, store=None, max_requests=0):
+    """Plan (keyword x window) jobs, skipping ones already done or stored
+
+    Args:
+        keywords (list): Keywords to backfill
+        windows (list): Timeframe strings from split_windows
+        geo (str): Geographic location code
+        checkpoint (Checkpoint): Jobs finished by earlier backfill runs
+        store: Object with records(date), e.g. query_service.LocalStore
+        max_requests (int): Cap on jobs planned for this run, 0 for no cap
+
+    Returns:
+        tuple: (jobs to run as (keyword, timeframe), number of skipped jobs)
+    """
+    jobs = []
+    skipped = 0
+    for timeframe in windows:
+        stored = stored_jobs(store, window_day(timeframe)) if store is not None else set()
+        for keyword in keywords:
+            key = job_key(keyword, geo, timeframe)
+            if key in stored or (checkpoint is not None and key in checkpoint):
+                skipped += 1
+                continue
+            jobs.append((keyword, timeframe))
+    if max_requests and len(jobs) > max_requests:
+        logging.info(f"Backfill limited to {max_requests} of {len(jobs)} pending jobs for this run")
+        jobs = jobs[:max_requests]
+    return jobs, skipped
+
+
+def estimate_duration(job_count, avg_delay, max_per_hour, calls_per_request=1):
+    """Lower-bound run time in seconds given per-request delay and the hourly cap
+
+    Each job takes calls_per_request limiter slots against max_per_hour.
+    """
+    if not job_count:
+        return 0.0
+    paced = job_count * avg_delay
+    calls = job_count * calls_per_request
+    capped = (calls - 1) // max_per_hour * 3600 if max_per_hour else 0
+    return max(paced, capped)
+
+
+class Progress:
+    """Progress counter that logs completion and an ETA from observed throughput"""
+
+    def __init__(self, total, clock=default_clock.time, estimate=None):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.clock = clock
+        self.started = clock()
+        self.estimate = estimate
+
+    def eta(self):
+        remaining = self.total - self.done - self.failed
+        finished = self.done + self.failed
+        if finished:
+            return (self.clock() - self.started) / finished * remaining
+        if self.estimate is not None:
+            return self.estimate
+        return None
+
+    def update(self, success=True):
+        if success:
+            self.done += 1
+        else:
+            self.failed += 1
+        eta = self.eta()
+        eta_text = str(timedelta(seconds=int(eta))) if eta is not None else 'unknown'
+        logging.info(f"Backfill progress: {self.done + self.failed}/{self.total} "
+                     f"(failed {self.failed}), ETA {eta_text}")
@@ -0,0 +1,191 @@
+import gzip
+import json
+import logging
+import threading
+import time
+from collections import deque
+import requests
+from trends_errors import PermanentError
+from clock import FakeClock
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMissError(PermanentError):
+    """Replay found no recorded response for a request"""
+
+
+def _request_key(method, url, params):
+    return method, url, json.dumps(params, sort_keys=True, default=str)
+
+
+class _RecordingSession:
+    """Session proxy writing every request and its response or error to the cassette"""
+
+    def __init__(self, session, cassette):
+        self._session = session
+        self._cassette = cassette
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def get(self, url, params=None, **kwargs):
+        return self._call('GET', url, params, self._session.get, kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self._call('POST', url, data, self._session.post, kwargs)
+
+    def _call(self, method, url, params, send, kwargs):
+        started = time.time()
+        entry = {'t': round(started - self._cassette.started, 3), 'method': method, 'url': url, 'params': params}
+        try:
+            response = send(url, params, **kwargs)
+        except Exception as e:
+            entry['elapsed'] = round(time.time() - started, 3)
+            entry['error'] = {'type': type(e).__name__, 'message': str(e)}
+            self._cassette.append(entry)
+            raise
+        entry['elapsed'] = round(time.time() - started, 3)
+        entry['status'] = response.status_code
+        entry['content_type'] = response.headers.get('Content-Type', '')
+        entry['body'] = response.text
+        self._cassette.append(entry)
+        return response
+
+
+class _ReplaySession:
+    """Session stand-in answering requests from the cassette"""
+
+    def __init__(self, cassette):
+        self._cassette = cassette
+        self.proxies = {}
+        self.headers = {}
+
+    def get(self, url, params=None, **kwargs):
+        return self._cassette.replay('GET', url, params)
+
+    def post(self, url, data=None, **kwargs):
+        return self._cassette.replay('POST', url, data)
+
+
+class Cassette:
+    """Record the Trends HTTP traffic of a run to a gzip JSON-lines file, or replay it
+
+    Recording wraps the trendspy session, so every attempt (including the
+    client's internal retries, error statuses and network errors) is saved
+    with its timing. Replay answers each request with the recorded response
+    for the same method, URL and parameters, in recorded order; requests
+    whose parameters changed since recording (e.g. relative date ranges on
+    a later day) take the next unused response for the same URL.
+    """
+
+    def __init__(self, path, mode, speed=0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Invalid cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.clock = FakeClock(speed=speed)  # 回放时使用的模拟时钟
+        self.started = time.time()
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._by_key = {}
+        self._by_url = {}
+        self._last = {}
+
+        if mode == 'record':
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+            self._write({'version': CASSETTE_VERSION, 'recorded_at': self.started})
+        else:
+            self._load()
+
+    @classmethod
+    def record(cls, path):
+        return cls(path, 'record')
+
+    @classmethod
+    def replay_from(cls, path, speed=0):
+        return cls(path, 'replay', speed)
+
+    def wrap(self, session):
+        """Session to use for a Trends client"""
+        if self.mode == 'record':
+            return _RecordingSession(session, self)
+        return _ReplaySession(self)
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+        # 同步刷新，进程被终止时已记录的部分仍可读取
+        self._file.flush()
+
+    def append(self, entry):
+        with self._lock:
+            self._write(entry)
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _load(self):
+        entries = []
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if header.get('version') != CASSETTE_VERSION:
+                    raise ValueError(f"Unsupported cassette version: {header.get('version')}")
+                for line in f:
+                    entries.append(json.loads(line))
+        except (EOFError, json.JSONDecodeError):
+            # 录制被中断时文件末尾不完整，使用已完整写入的部分
+            logging.warning(f"Cassette {self.path} is truncated, replaying {len(entries)} complete entries")
+        for entry in entries:
+            self._by_key.setdefault(_request_key(entry['method'], entry['url'], entry['params']), deque()).append(entry)
+            self._by_url.setdefault((entry['method'], entry['url']), deque()).append(entry)
+        logging.info(f"Loaded {len(entries)} recorded requests from {self.path}")
+
+    def _take(self, method, url, params):
+        key = _request_key(method, url, params)
+        candidates = self._by_key.get(key)
+        while candidates:
+            entry = candidates.popleft()
+            if not entry.get('used'):
+                return key, entry
+        candidates = self._by_url.get((method, url))
+        while candidates:
+            entry = candidates.popleft()
+            if not entry.get('used'):
+                logging.debug(f"Replaying {url} by order, parameters differ from the recording")
+                return key, entry
+        # 录制时由缓存提供、回放时需要重新请求的情况，重复使用同一请求的最后一个响应
+        return key, self._last.get(key)
+
+    def replay(self, method, url, params):
+        with self._lock:
+            key, entry = self._take(method, url, params)
+            if entry is None:
+                self.misses += 1
+                raise CassetteMissError(f"No recorded response for {method} {url}")
+            entry['used'] = True
+            self._last[key] = entry
+            self.replayed += 1
+        self.clock.sleep(entry.get('elapsed', 0))
+
+        if 'error' in entry:
+            error_type = getattr(requests.exceptions, entry['error']['type'], requests.RequestException)
+            if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+                error_type = requests.RequestException
+            raise error_type(entry['error']['message'])
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = requests.status_codes._codes.get(entry['status'], ('',))[0].replace('_', ' ').upper()
+        response.headers['Content-Type'] = entry.get('content_type', '')
+        response._content = entry.get('body', '').encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = url
+        return response
@@ -0,0 +1,92 @@
+import threading
+import time
+from datetime import datetime
+
+
+class SystemClock:
+    """Real time and real sleeps"""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def now(self):
+        return datetime.now()
+
+
+class FakeClock(SystemClock):
+    """Simulated clock: sleep() advances the simulated time instead of waiting
+
+    With speed > 0 every sleep also waits seconds / speed of real time
+    (speed=1 keeps the real pacing); with speed 0 a simulation runs as fast
+    as the code allows. Sleeps of concurrent threads add up rather than
+    overlap. Callable, so it can be passed wherever a time.time-like
+    function is expected.
+    """
+
+    def __init__(self, start=None, speed=0):
+        self.start = time.time() if start is None else start
+        self.speed = speed
+        self._now = self.start
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self._now
+
+    def time(self):
+        return self._now
+
+    def monotonic(self):
+        return self._now
+
+    def sleep(self, seconds):
+        seconds = max(0.0, seconds)
+        with self._lock:
+            self._now += seconds
+        if self.speed > 0:
+            time.sleep(seconds / self.speed)
+
+    def now(self):
+        return datetime.fromtimestamp(self._now)
+
+    @property
+    def elapsed(self):
+        return self._now - self.start
+
+
+class _InstalledClock:
+    """Forwards to the clock installed with set_clock()
+
+    Components take default_clock.time / default_clock.sleep as defaults,
+    so installing a FakeClock later also applies to objects created at
+    import time (the global request limiter, circuit breaker, ...).
+    """
+
+    def time(self):
+        return _installed.time()
+
+    def monotonic(self):
+        return _installed.monotonic()
+
+    def sleep(self, seconds):
+        _installed.sleep(seconds)
+
+    def now(self):
+        return _installed.now()
+
+
+_installed = SystemClock()
+default_clock = _InstalledClock()
+
+
+def set_clock(clock):
+    """Install the clock used through default_clock; returns the previous one"""
+    global _installed
+    previous, _installed = _installed, clock
+    return previous
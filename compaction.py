@@ -0,0 +1,312 @@
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import zipfile
+from datetime import timedelta
+from raw_archive import ARCHIVE_SUFFIX, finalize_parts, iter_archive, read_record_at
+from clock import default_clock
+
+_DAY_PATTERN = re.compile(r'^\d{8}$')
+_MONTH_ARCHIVE = re.compile(r'^(\d{6})\.zip$')
+INDEX_SUFFIX = '.index.json'
+# raw_archive 另存编码设置不同的文件时追加的后缀
+_ASIDE_SUFFIX = re.compile(r'\.\d{20}(-\d+)?\.old$')
+# 目录中的文件在这段时间内修改过时视为仍在写入（例如并发的补录），本次不压缩
+ACTIVE_WRITE_SECONDS = 3600
+
+
+def list_day_directories(data_dir_prefix):
+    """Return {YYYYMMDD: path} for every daily report directory"""
+    root = os.path.dirname(data_dir_prefix) or '.'
+    name_prefix = os.path.basename(data_dir_prefix)
+    days = {}
+    if not os.path.isdir(root):
+        return days
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        day = name[len(name_prefix):] if name.startswith(name_prefix) else None
+        if day and _DAY_PATTERN.match(day) and os.path.isdir(path):
+            days[day] = path
+    return days
+
+
+def _archive_paths(archive_dir, month):
+    return os.path.join(archive_dir, f"{month}.zip"), os.path.join(archive_dir, f"{month}{INDEX_SUFFIX}")
+
+
+def _load_index(index_path):
+    if not os.path.exists(index_path):
+        return {'days': {}}
+    with open(index_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def data_file_name(path):
+    """File name that decides the record format of a result file
+
+    A stale .part keeps its final name's format, and so does a raw archive
+    moved aside as <name>[.part].<timestamp>.old after its settings changed.
+    """
+    name = _ASIDE_SUFFIX.sub('', os.path.basename(path))
+    return name[:-len('.part')] if name.endswith('.part') else name
+
+
+def result_file_order(name):
+    """Sort key putting files moved aside, which hold the oldest records, first"""
+    return (not _ASIDE_SUFFIX.search(name), name)
+
+
+def _keyword_entries(path, member, dict_dir=None):
+    """Map keywords of a raw result file to the locations of their records inside the archive
+
+    Every record is indexed, with its geo and timeframe, so several geos,
+    timeframes or backfill windows of one keyword on one day are all kept.
+    Per-keyword JSON files locate the whole member; JSON Lines and raw
+    archive files the byte offset and length of the record in the member.
+    A torn last record of a part file left by a crashed run is skipped.
+    """
+    name = data_file_name(path)
+    entries = {}
+
+    def add(record, location):
+        keyword = record.get('keyword') if isinstance(record, dict) else None
+        if keyword:
+            location.update(geo=record.get('geo'), timeframe=record.get('timeframe'))
+            entries.setdefault(keyword, []).append(location)
+
+    try:
+        if name.endswith('.json'):
+            with open(path, 'r', encoding='utf-8') as f:
+                add(json.load(f), {'member': member})
+        elif name.endswith('.jsonl'):
+            offset = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    if line.endswith(b'\n'):
+                        add(json.loads(line), {'member': member, 'offset': offset, 'length': len(line)})
+                    offset += len(line)
+        elif name.endswith(ARCHIVE_SUFFIX):
+            for offset, length, record in iter_archive(path, dict_dir, with_offsets=True):
+                add(record, {'member': member, 'offset': offset, 'length': length, 'format': 'rqz'})
+    except (OSError, ValueError, AttributeError) as e:
+        logging.warning(f"Failed to index {path}: {str(e)}")
+    return entries
+
+
+def keyword_locations(value):
+    """Locations of one keyword's records in a day's index entry, oldest first
+
+    Indexes written before every record was indexed hold a single location
+    (a member name or a dict) instead of a list.
+    """
+    if not value:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _location_member(location):
+    return location if isinstance(location, str) else location['member']
+
+
+def _file_stamps(directory):
+    stamps = {}
+    for name in os.listdir(directory):
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        stamps[name] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+
+def _being_written(stamps):
+    """Whether a day directory is still being written: a file, .part included, changed recently
+
+    A .part file untouched for ACTIVE_WRITE_SECONDS was left by a crashed
+    run; it is finalized, or compacted as-is when that fails, instead of
+    keeping the day out of the archive.
+    """
+    recent = (time.time() - ACTIVE_WRITE_SECONDS) * 1e9
+    return any(mtime >= recent for mtime, _ in stamps.values())
+
+
+def _compact_month(month, day_dirs, archive_dir, dict_dir=None):
+    """Merge day directories into the month's zip archive and index, atomically"""
+    archive_path, index_path = _archive_paths(archive_dir, month)
+    index = _load_index(index_path)
+    tmp_archive = archive_path + '.tmp'
+
+    with zipfile.ZipFile(tmp_archive, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as target:
+        # 已有归档中不会被本次同名文件覆盖的成员拷贝到新归档
+        # （补录的历史数据可能写入已归档的日期）
+        if os.path.exists(archive_path):
+            with zipfile.ZipFile(archive_path, 'r') as source:
+                for info in source.infolist():
+                    day, _, name = info.filename.partition('/')
+                    if day in day_dirs and os.path.isfile(os.path.join(day_dirs[day], name)):
+                        continue
+                    with source.open(info) as src, target.open(info, 'w') as dst:
+                        shutil.copyfileobj(src, dst)
+
+        for day, directory in sorted(day_dirs.items()):
+            entry = index['days'].get(day, {'files': [], 'keywords': {}})
+            # 另存的旧文件先索引，同一关键词取最后一条时以较新的数据为准
+            names = [name for name in sorted(os.listdir(directory), key=result_file_order)
+                     if os.path.isfile(os.path.join(directory, name))]
+            # 同名文件覆盖归档中的旧成员，旧成员的索引一并去掉
+            replaced = {f"{day}/{name}" for name in names}
+            keywords = {}
+            for keyword, value in entry['keywords'].items():
+                kept = [location for location in keyword_locations(value) if _location_member(location) not in replaced]
+                if kept:
+                    keywords[keyword] = kept
+            for name in names:
+                path = os.path.join(directory, name)
+                member = f"{day}/{name}"
+                # 原始归档的记录已经逐条压缩，原样存入，不再 deflate
+                stored = data_file_name(name).endswith(ARCHIVE_SUFFIX)
+                target.write(path, member, compress_type=zipfile.ZIP_STORED if stored else None)
+                if member not in entry['files']:
+                    entry['files'].append(member)
+                for keyword, locations in _keyword_entries(path, member, dict_dir).items():
+                    keywords.setdefault(keyword, []).extend(locations)
+            entry['keywords'] = keywords
+            index['days'][day] = entry
+
+    with open(tmp_archive, 'rb+') as f:
+        os.fsync(f.fileno())
+    tmp_index = index_path + '.tmp'
+    with open(tmp_index, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_archive, archive_path)
+    os.replace(tmp_index, index_path)
+
+
+def compact_reports(data_dir_prefix, archive_dir, compact_after_days=31, retention_months=0, now=None,
+                    dict_dir=None):
+    """Roll old daily directories into monthly zip archives and apply retention
+
+    Args:
+        data_dir_prefix (str): Prefix of the daily directories, e.g. 'reports/'
+        archive_dir (str): Directory holding YYYYMM.zip and YYYYMM.index.json
+        compact_after_days (int): Days a daily directory stays uncompressed
+        retention_months (int): Months of archives to keep, 0 keeps everything
+        now (datetime): Current time, injectable for tests
+        dict_dir (str): Directory of shared dictionaries used by raw archives
+
+    Returns:
+        dict: Number of compacted days and deleted archives
+    """
+    now = now or default_clock.now()
+    cutoff = (now - timedelta(days=compact_after_days)).strftime('%Y%m%d')
+    os.makedirs(archive_dir, exist_ok=True)
+
+    by_month = {}
+    stamps = {}
+    for day, directory in list_day_directories(data_dir_prefix).items():
+        if day >= cutoff:
+            continue
+        stamps[day] = _file_stamps(directory)
+        if _being_written(stamps[day]):
+            logging.info(f"Skipping {directory}, it is still being written")
+            continue
+        if any(name.endswith('.part') for name in stamps[day]) and finalize_parts(directory, dict_dir):
+            stamps[day] = _file_stamps(directory)
+        by_month.setdefault(day[:6], {})[day] = directory
+
+    compacted = 0
+    for month, day_dirs in sorted(by_month.items()):
+        try:
+            _compact_month(month, day_dirs, archive_dir, dict_dir)
+        except Exception as e:
+            logging.error(f"Failed to compact reports for {month}: {str(e)}")
+            continue
+        removed = 0
+        for day, directory in day_dirs.items():
+            # 压缩期间有新写入的目录保留，下次压缩时合并
+            if _file_stamps(directory) != stamps[day]:
+                logging.info(f"{directory} changed while compacting, keeping it for the next run")
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+        compacted += removed
+        logging.info(f"Compacted {removed} daily directories into {month}.zip")
+
+    deleted = 0
+    if retention_months > 0:
+        oldest = now.year * 12 + now.month - 1 - retention_months
+        for name in os.listdir(archive_dir):
+            match = _MONTH_ARCHIVE.match(name)
+            if not match:
+                continue
+            month = match.group(1)
+            if int(month[:4]) * 12 + int(month[4:]) - 1 < oldest:
+                for path in _archive_paths(archive_dir, month):
+                    if os.path.exists(path):
+                        os.remove(path)
+                deleted += 1
+                logging.info(f"Deleted archive {name} past retention of {retention_months} months")
+
+    return {'compacted_days': compacted, 'deleted_archives': deleted}
+
+
+def read_archived_file(archive_dir, day, filename):
+    """Read one archived file of a day without extracting the whole archive"""
+    archive_path, _ = _archive_paths(archive_dir, day[:6])
+    with zipfile.ZipFile(archive_path, 'r') as archive:
+        try:
+            return archive.read(f"{day}/{filename}")
+        except KeyError:
+            raise FileNotFoundError(f"{filename} not found in archive for {day}")
+
+
+def read_keyword_day(archive_dir, keyword, day, dict_dir=None, geo=None, timeframe=None):
+    """Read the latest archived related-queries record of one keyword on one day
+
+    Args:
+        geo, timeframe (str): Only consider records with this geo/timeframe (None for any)
+
+    Returns:
+        dict: The saved JSON record, or None if the keyword/day is not archived
+    """
+    _, index_path = _archive_paths(archive_dir, day[:6])
+    if not os.path.exists(index_path):
+        return None
+    value = _load_index(index_path)['days'].get(day, {}).get('keywords', {}).get(keyword)
+    for location in reversed(keyword_locations(value)):
+        if location_matches(location, geo, timeframe):
+            return read_archived_record(archive_dir, day, location, dict_dir)
+    return None
+
+
+def location_matches(location, geo=None, timeframe=None):
+    """Whether an indexed record may have this geo and timeframe (unknown values match)"""
+    if isinstance(location, str):
+        return True
+    if geo is not None and location.get('geo') not in (None, geo):
+        return False
+    if timeframe is not None and location.get('timeframe') not in (None, timeframe):
+        return False
+    return True
+
+
+def read_archived_record(archive_dir, day, location, dict_dir=None):
+    """Read the record at an index location (member name, or member with offset and length)"""
+    archive_path, _ = _archive_paths(archive_dir, day[:6])
+    with zipfile.ZipFile(archive_path, 'r') as archive:
+        if isinstance(location, str):
+            location = {'member': location}
+        with archive.open(location['member']) as f:
+            if 'offset' not in location:
+                return json.load(f)
+            if location.get('format') == 'rqz':
+                return read_record_at(f, location['offset'], location['length'], dict_dir)
+            f.seek(location['offset'])
+            return json.loads(f.read(location['length']))
@@ -6,8 +6,25 @@ load_dotenv()
 
 # Notification Configuration
 NOTIFICATION_CONFIG = {
-    'method': 'email',  # 可选值: 'email', 'wechat', 'both'
+    'method': 'email',  # 可选值: 'email', 'wechat', 'both'（未配置 channels 时使用）
     'wechat_receiver': os.getenv('TRENDS_WECHAT_RECEIVER', ''),  # 微信接收者的备注名或微信号
+    # 通知渠道列表，所有渠道和接收者并发发送；留空时按 method 生成
+    # 每个渠道可选: timeout（秒）, rate_per_minute, concurrency, name
+    # 例如:
+    # {'type': 'email', 'recipients': ['a@example.com', 'b@example.com'], 'timeout': 60},
+    # {'type': 'wechat', 'recipients': ['文件传输助手']},
+    # {'type': 'webhook', 'recipients': ['https://chat.example.com/hooks/xxx'],
+    #  'headers': {'Authorization': 'Bearer ...'}, 'text_field': 'text'},
+    'channels': [
+    ],
+    # 附件：不小于 attachment_compress_min_bytes 的文件发送前流式压缩，可选 'gzip'、'zip' 或 None（不压缩）
+    'attachment_compression': 'gzip',
+    'attachment_compress_min_bytes': 256 * 1024,
+    # 压缩后仍超过此大小的附件不发送，改为在正文中给出文件大小和链接；0 表示不限制
+    # 渠道可用 max_attachment_bytes 单独设置
+    'attachment_max_bytes': 10 * 1024 * 1024,
+    # 链接前缀，如 'http://trends.example.com:8080'；留空时若启用了查询服务则链接到查询服务，否则给出本地文件路径
+    'attachment_link_base': '',
 }
 
 # Email Configuration
@@ -31,44 +48,162 @@ KEYWORDS = [
 ]
 
 
+# Tenant Profiles
+# 多个团队共用一个进程和同一份请求配额时，在这里为每个团队配置独立的档案；
+# 留空时使用上面的 KEYWORDS 以及下方的 TRENDS_CONFIG / MONITOR_CONFIG / SCHEDULE_CONFIG。
+# 未设置的字段沿用全局配置；多个租户共有的关键词只请求一次。
+# 例如:
+# 'marketing': {
+#     'keywords': ['Image', 'Video'],
+#     'geo': 'US',
+#     'timeframe': 'last-3-d',
+#     'monitor': {'rising_threshold': 300},            # 覆盖 MONITOR_CONFIG 中的项
+#     'schedule': {'hour': 8, 'minute': 0},           # 覆盖 SCHEDULE_CONFIG 中的项
+#     'channels': [{'type': 'email', 'recipients': ['marketing@example.com']}],
+#     'weight': 2,                                    # 公平调度的权重，每轮可取的关键词数
+# },
+TENANTS = {
+}
+
+# Keyword Normalization Configuration
+NORMALIZATION_CONFIG = {
+    # 同义词映射（规范化后比较），例如 'img': 'image'
+    'synonyms': {
+    },
+}
+
 # Trends Query Configuration
 TRENDS_CONFIG = {
     'timeframe': 'last-3-d',  # 可选值: now 1-d, now 7-d, now 30-d, now 90-d, today 12-m, 
                             # last-2-d, last-3-d 或者 "2024-01-01 2024-01-31"
     'geo': '',  # 地区代码，例如: 'US' 表示美国, 'CN' 表示中国, '' 表示全球
+    'token_ttl': 300,  # widget token 的复用时间（秒），应短于 token 有效期；0 表示不缓存
+}
+
+# Interest Over Time Configuration
+INTEREST_CONFIG = {
+    'enabled': False,    # 报告和提醒发出后在后台按组（每组最多 5 个关键词）采集热度趋势，每组一次请求，共享请求配额
+    'anchor': '',        # 每组都包含的锚点关键词，用于跨组归一化；留空使用第一个关键词，宜选热度适中且稳定的词
+    'group_size': 5,     # 每次请求比较的关键词数（含锚点，最多 5）
 }
 
 # Rate Limiting Configuration
 RATE_LIMIT_CONFIG = {
-    'max_retries': 3,
+    'max_retries': 3,  # 单个关键词的最大重试次数（限流时放回队尾的次数上限相同）
     'min_delay_between_queries': 10,  # 最小延迟10秒
     'max_delay_between_queries': 20,  # 最大延迟20秒
     'batch_size': 5,  # 每批处理的关键词数量
     'batch_interval': 300,  # 批次间隔时间（秒）
+    'max_requests_per_minute': 30,  # 每分钟最大请求数
+    'max_requests_per_hour': 200,   # 每小时最大请求数
+    'breaker_failure_threshold': 5,   # 连续失败多少次后熔断（配额超限立即熔断）
+    'breaker_reset_timeout': 300,     # 熔断后多少秒尝试恢复
+    'breaker_max_reset_timeout': 1800,  # 恢复失败时熔断时间翻倍的上限
+}
+
+# Request Coalescing Configuration
+COALESCING_CONFIG = {
+    'cross_process': True,            # 是否通过文件锁与本机其他进程（定时任务、补录、手动查询）合并相同请求
+    'lock_dir': 'reports/.inflight',  # 文件锁和共享结果的目录
+    'result_ttl': 600,                # 文件锁和共享结果（JSON）在多少秒未使用后删除
 }
 
 # Schedule Configuration
 SCHEDULE_CONFIG = {
     'hour': 23,                    # 计划执行的小时（0-23）
     'minute': 5,                 # 计划执行的分钟（0-59）
-    'random_delay_minutes': 15   # 随机延迟的最大分钟数（可选）
+    'random_delay_minutes': 15,  # 随机延迟的最大分钟数（可选）
+    'catch_up': True,            # 启动时补跑停机期间错过的任务
+    'run_window_hours': 24,      # 一次采集必须完成的时长，dry-run 超出时给出警告
+    'reload_interval': 30,       # 每隔多少秒检查 config.py 是否修改并重新加载，0 表示不检查
+    'state_file': 'reports/.scheduler_state.json'  # 记录各任务上次运行时间
 }
 
 # Monitoring Configuration
 MONITOR_CONFIG = {
-    'rising_threshold': 500,  # 高增长趋势阈值
+    'rising_threshold': 500,  # 高增长趋势阈值（threshold 模式，或 ewma 模式下历史不足时使用）
+    'detector': 'threshold',  # 可选值: 'threshold'（静态阈值）, 'ewma'（基于历史的异常检测，需手动开启）
+    'ewma_alpha': 0.3,        # EWMA 平滑系数，越大越重视最近的值
+    'z_threshold': 3.0,       # 偏离历史均值多少个标准差时提醒
+    'min_samples': 3,         # 历史样本数达到该值后才使用统计检测
+    'min_std': 10,            # 标准差下限，避免历史平稳的查询轻微波动就提醒
+    'max_age_days': 90,       # 超过该天数未出现的序列从检测状态中删除，0 表示不删除
+    'state_file': 'reports/.anomaly_state.npz',  # 检测状态文件
+    'alert_cooldown_hours': 72,   # 同一 (关键词, 查询) 提醒后的冷却时间
+    'realert_ratio': 2.0,         # 冷却期内数值达到上次提醒的多少倍时再次提醒
+    'alert_retention_days': 30,   # 提醒记录保留天数
+    'alert_state_file': 'reports/.alert_state.json'  # 已发送提醒记录
+}
+
+# Co-occurrence Configuration
+COOCCURRENCE_CONFIG = {
+    'min_shared_seeds': 2,         # 相关查询至少出现在几个关键词下才算桥接查询
+    'history_days': 30,            # 历史聚类使用最近多少天的报告
+    'max_clusters_in_report': 10,  # 报告正文中最多展示的聚类数
+    'filename_prefix': 'clusters_'  # 聚类结果文件名前缀
+}
+
+# Keyword Expansion Configuration
+EXPANSION_CONFIG = {
+    'max_depth': 2,              # 扩展深度（种子关键词为第0层）
+    'max_requests': 30,          # 单次扩展的最大请求数
+    'min_rising_value': 100,     # 低于该增长值的上升查询不再继续扩展
+    'expected_queries': 100000,  # 预计去重的查询数量，用于设置布隆过滤器大小
+    'false_positive_rate': 0.001,  # 布隆过滤器误判率，即新查询被误认为已见过而跳过的概率
+    'max_pause_seconds': 3600,   # 熔断导致的累计等待超过该秒数时停止扩展
+    'filename_prefix': 'expansion_'  # 扩展结果文件名前缀
+}
+
+# Local Query Service Configuration
+SERVICE_CONFIG = {
+    'enabled': False,      # 定时任务模式下是否同时启动本地查询服务
+    'host': '127.0.0.1',   # 监听地址，容器内对外提供服务时改为 '0.0.0.0'
+    'port': 8080,
+    'cache_size': 256,     # 热点请求的 LRU 缓存条数
+    'signature_ttl': 5,    # 数据版本签名的缓存秒数，期间命中缓存的请求不再遍历数据文件；新数据最多延迟这么久可见
+    # /v1/files/ 允许下载的文件（相对数据目录的路径，* 可匹配多级目录），即通知中链接的报告和附件
+    'file_patterns': ['*/daily_report_*.csv', '*/clusters_*.csv'],
 }
 
 # Logging Configuration
 LOGGING_CONFIG = {
     'log_file': 'trends_monitor.log',
     'level': 'INFO',
-    'format': '%(asctime)s - %(levelname)s - %(message)s'
+    'format': '%(asctime)s - %(levelname)s - %(message)s',  # 控制台输出格式
+    'json': True,                    # 日志文件每行一条 JSON 记录
+    'max_bytes': 10 * 1024 * 1024,   # 单个日志文件上限，超出后轮转
+    'backup_count': 5,               # 保留的轮转文件数
+    # 高频日志的采样比例（按 logger 名称前缀），警告及以上级别不采样
+    'sample_rates': {
+        'querytrends.request': 0.1,
+    },
 }
 
 # Data Storage Configuration
 STORAGE_CONFIG = {
     'data_dir_prefix': 'reports/',  # 数据目录前缀
     'report_filename_prefix': 'daily_report_',  # 报告文件名前缀
-    'json_filename_prefix': 'related_queries_'  # JSON文件名前缀
-} 
\ No newline at end of file
+    'json_filename_prefix': 'related_queries_',  # 原始数据文件名前缀
+    'interest_filename_prefix': 'interest_over_time_',  # 热度趋势 CSV 文件名前缀
+    'raw_format': 'archive',     # 原始数据格式: 'archive'（压缩流归档 .rqz）或 'jsonl'
+    'raw_codec': 'zlib',         # 归档压缩方式: 'zlib' 或 'zstd'（需安装 zstandard）
+    'raw_dictionary': '',        # 共享压缩字典文件（python raw_archive.py train 生成），留空不使用
+    'raw_dict_dir': 'reports/archive/dicts'  # 归档引用的字典存放目录
+}
+
+# Compaction Configuration
+COMPACTION_CONFIG = {
+    'enabled': True,
+    'archive_dir': 'reports/archive',  # 月度归档目录（YYYYMM.zip + YYYYMM.index.json）
+    'compact_after_days': 31,          # 每日目录保留多少天后压缩归档
+    'retention_months': 12,            # 归档保留的月数，0 表示永久保留
+    'hour': 3,                         # 每日压缩任务执行时间
+    'minute': 30
+}
+
+# Backfill Configuration
+BACKFILL_CONFIG = {
+    'window_days': 7,                                   # 每个补录窗口的天数
+    'checkpoint_file': 'reports/.backfill_checkpoint.json',  # 已完成任务的断点文件
+    'max_requests_per_run': 0                           # 单次补录最多发起的请求数，0 表示不限制
+}
@@ -0,0 +1,130 @@
+import logging
+import os
+import runpy
+import threading
+import config
+from tenants import load_tenants
+from attachments import COMPRESSIONS
+
+# 修改后需要重启才能生效的配置项，重新加载时只给出提示
+RESTART_REQUIRED = ('LOGGING_CONFIG', 'SERVICE_CONFIG', 'COALESCING_CONFIG')
+
+# 重新加载时持有该锁应用所有修改；需要同时读取多个配置项构建对象的地方（如租户列表）也持有该锁，
+# 不会读到只应用了一半的配置
+config_lock = threading.RLock()
+
+
+def _require(condition, message):
+    if not condition:
+        raise ValueError(message)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_config(settings):
+    """Check a freshly loaded config namespace; raises ValueError describing the first problem"""
+    for name, value in vars(config).items():
+        if name.isupper() and isinstance(value, (dict, list)):
+            _require(name in settings, f"{name} is missing")
+            _require(isinstance(settings[name], type(value)),
+                     f"{name} must be a {type(value).__name__}")
+
+    keywords = settings['KEYWORDS']
+    _require(all(isinstance(keyword, str) and keyword.strip() for keyword in keywords),
+             "KEYWORDS must contain non-empty strings")
+
+    schedule = settings['SCHEDULE_CONFIG']
+    _require(schedule.get('hour') in range(24), "SCHEDULE_CONFIG['hour'] must be 0-23")
+    _require(schedule.get('minute', 0) in range(60), "SCHEDULE_CONFIG['minute'] must be 0-59")
+
+    rate_limit = settings['RATE_LIMIT_CONFIG']
+    for key in ('batch_size', 'max_requests_per_minute', 'max_requests_per_hour'):
+        _require(isinstance(rate_limit.get(key), int) and rate_limit[key] > 0,
+                 f"RATE_LIMIT_CONFIG['{key}'] must be a positive integer")
+    for key in ('batch_interval', 'min_delay_between_queries', 'max_delay_between_queries'):
+        _require(_is_number(rate_limit.get(key)) and rate_limit[key] >= 0,
+                 f"RATE_LIMIT_CONFIG['{key}'] must be a non-negative number")
+
+    compression = settings['NOTIFICATION_CONFIG'].get('attachment_compression')
+    _require(compression is None or compression in COMPRESSIONS,
+             f"NOTIFICATION_CONFIG['attachment_compression'] must be one of {', '.join(COMPRESSIONS)} or None")
+
+    # 租户名称、覆盖项和各租户的计划与全局配置使用同样的规则
+    tenants = load_tenants(settings['TENANTS'], keywords, settings['TRENDS_CONFIG'],
+                           settings['MONITOR_CONFIG'], schedule,
+                           settings['STORAGE_CONFIG']['data_dir_prefix'])
+    for tenant in tenants:
+        _require(all(isinstance(keyword, str) and keyword.strip() for keyword in tenant.keywords),
+                 f"Tenant {tenant.name}: keywords must contain non-empty strings")
+        _require(tenant.schedule.get('hour') in range(24), f"Tenant {tenant.name}: schedule hour must be 0-23")
+        _require(tenant.schedule.get('minute', 0) in range(60), f"Tenant {tenant.name}: schedule minute must be 0-59")
+
+
+def _update_in_place(target, value):
+    """Make target equal to value without replacing the object other modules imported"""
+    if isinstance(target, dict):
+        # 先更新再删除多余的键，读取方不会看到空字典
+        target.update(value)
+        for key in [key for key in target if key not in value]:
+            del target[key]
+    else:
+        target[:] = value
+
+
+class ConfigWatcher:
+    """Reload config.py when it changes and apply it to the imported config objects
+
+    The file is executed into a fresh namespace and validated first; an
+    invalid file is logged and the running configuration stays as it was.
+    Dicts and lists are updated in place, so every module that imported
+    them by name sees the new values on its next read. All updates are
+    applied under config_lock; readers combining several settings or
+    iterating a config dict take the same lock.
+    """
+
+    def __init__(self, path=None, module=config):
+        self.path = path or module.__file__
+        self.module = module
+        self._mtime = self._current_mtime()
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def check(self):
+        """Reload when the file changed since the last check
+
+        Returns:
+            set: Names of the settings that changed, empty when nothing was applied
+        """
+        mtime = self._current_mtime()
+        if mtime is None or mtime == self._mtime:
+            return set()
+        self._mtime = mtime
+
+        try:
+            settings = runpy.run_path(self.path)
+            validate_config(settings)
+        except Exception as e:
+            logging.error(f"Ignoring invalid configuration in {self.path}: {str(e)}")
+            return set()
+
+        changed = set()
+        with config_lock:
+            for name, current in vars(self.module).items():
+                if not name.isupper() or not isinstance(current, (dict, list)):
+                    continue
+                if settings[name] != current:
+                    _update_in_place(current, settings[name])
+                    changed.add(name)
+
+        for name in sorted(changed):
+            if name in RESTART_REQUIRED:
+                logging.warning(f"{name} changed; it takes effect after a restart")
+        if changed:
+            logging.info(f"Configuration reloaded, changed: {', '.join(sorted(changed))}")
+        return changed
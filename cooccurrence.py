@@ -0,0 +1,138 @@
+import glob
+import logging
+import os
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from result_table import ResultTable, TABLE_SUFFIX
+from clock import default_clock
+
+
+class CooccurrenceGraph:
+    """Sparse keyword x related-query matrix with cluster and bridge analysis
+
+    Rows are canonical seed keywords, columns canonical related queries and
+    cells the strongest value seen for the pair. Everything is computed on
+    the CSR/CSC matrix, so cost grows with the number of (seed, query)
+    pairs rather than with the square of the query count.
+    """
+
+    def __init__(self, keywords, queries, matrix):
+        self.keywords = keywords
+        self.queries = queries
+        self.matrix = matrix.tocsr()
+        # 只表示是否出现的同结构矩阵，值为0的查询也算出现
+        self.presence = self.matrix.copy()
+        self.presence.data = np.ones_like(self.presence.data, dtype=np.int32)
+
+    @classmethod
+    def from_tables(cls, tables, normalize=None):
+        normalize = normalize or (lambda text: text)
+        keyword_ids = {}
+        query_ids = {}
+        rows, cols, vals = [], [], []
+
+        for table in tables:
+            if not len(table):
+                continue
+            # 每张表内的ID先映射到全局规范化ID，再向量化展开
+            keyword_map = np.array([keyword_ids.setdefault(normalize(k), len(keyword_ids)) for k in table.keywords],
+                                   dtype=np.int64)
+            query_map = np.array([query_ids.setdefault(normalize(q), len(query_ids)) for q in table.queries],
+                                 dtype=np.int64)
+            rows.append(keyword_map[np.asarray(table.keyword_ids, dtype=np.int64)])
+            cols.append(query_map[np.asarray(table.query_ids, dtype=np.int64)])
+            vals.append(np.nan_to_num(np.asarray(table.values, dtype=np.float64)))
+
+        shape = (len(keyword_ids), len(query_ids))
+        if not rows:
+            return cls([], [], sparse.csr_matrix(shape))
+
+        # 同一 (关键词, 查询) 多次出现时取最大值而不是相加
+        pairs = pd.DataFrame({'r': np.concatenate(rows), 'c': np.concatenate(cols), 'v': np.concatenate(vals)})
+        pairs = pairs.groupby(['r', 'c'], sort=False)['v'].max().reset_index()
+        matrix = sparse.csr_matrix((pairs['v'].to_numpy(), (pairs['r'].to_numpy(), pairs['c'].to_numpy())),
+                                   shape=shape)
+        return cls(list(keyword_ids), list(query_ids), matrix)
+
+    def seed_counts(self):
+        """Number of distinct seed keywords each related query appears under"""
+        return np.diff(self.presence.tocsc().indptr)
+
+    def bridges(self, min_seeds=2):
+        """Related queries shared by at least min_seeds seeds
+
+        Returns:
+            list: (query, [seed keywords]) sorted by number of seeds, descending
+        """
+        csc = self.presence.tocsc()
+        counts = np.diff(csc.indptr)
+        candidates = np.flatnonzero(counts >= min_seeds)
+        candidates = candidates[np.argsort(-counts[candidates], kind='stable')]
+        return [
+            (self.queries[col], [self.keywords[row] for row in csc.indices[csc.indptr[col]:csc.indptr[col + 1]]])
+            for col in candidates
+        ]
+
+    def keyword_cooccurrence(self):
+        """Seed x seed matrix counting shared related queries"""
+        return (self.presence @ self.presence.T).tocsr()
+
+    def clusters(self, min_seeds=2):
+        """Group seeds connected through shared related queries
+
+        Only queries appearing under at least min_seeds seeds link seeds, so
+        each cluster is a connected component of the seed/bridge bipartite
+        graph.
+
+        Returns:
+            list: dicts with keywords, bridge queries and total query count,
+            largest cluster first; singleton seeds are omitted
+        """
+        n_keywords = self.matrix.shape[0]
+        if not n_keywords:
+            return []
+        counts = self.seed_counts()
+        # 按覆盖的种子数从多到少排列桥接查询
+        bridge_cols = np.flatnonzero(counts >= min_seeds)
+        bridge_cols = bridge_cols[np.argsort(-counts[bridge_cols], kind='stable')]
+        if len(bridge_cols):
+            links = self.presence[:, bridge_cols]
+            bipartite = sparse.bmat([[None, links], [links.T, None]], format='csr')
+        else:
+            bipartite = sparse.csr_matrix((n_keywords, n_keywords))
+        _, labels = connected_components(bipartite, directed=False)
+        keyword_labels = labels[:n_keywords]
+        bridge_labels = labels[n_keywords:]
+        per_keyword_queries = np.diff(self.presence.indptr)
+
+        result = []
+        for label in np.unique(keyword_labels):
+            members = np.flatnonzero(keyword_labels == label)
+            if len(members) < 2:
+                continue
+            result.append({
+                'keywords': [self.keywords[i] for i in members],
+                'bridge_queries': [self.queries[col] for col in bridge_cols[bridge_labels == label]],
+                'query_count': int(per_keyword_queries[members].sum())
+            })
+        result.sort(key=lambda cluster: (-len(cluster['keywords']), -len(cluster['bridge_queries'])))
+        return result
+
+
+def load_history_tables(data_dir_prefix, report_prefix, days, exclude=None):
+    """Memory-map the columnar daily reports of the last `days` days"""
+    cutoff = (default_clock.now() - timedelta(days=days)).strftime('%Y%m%d')
+    tables = []
+    pattern = os.path.join(f"{data_dir_prefix}*", f"{report_prefix}*{TABLE_SUFFIX}")
+    for path in sorted(glob.glob(pattern)):
+        day = os.path.basename(os.path.dirname(path))
+        if day < cutoff or (exclude and os.path.abspath(path) == os.path.abspath(exclude)):
+            continue
+        try:
+            tables.append(ResultTable.load(path))
+        except Exception as e:
+            logging.warning(f"Skipping unreadable report table {path}: {str(e)}")
+    return tables
@@ -0,0 +1,110 @@
+import logging
+import os
+import random
+import pandas as pd
+from clock import default_clock
+from trends_errors import TrendsError, QuotaExceededError, CircuitOpenError
+
+# Google Trends 一次最多比较 5 个关键词
+MAX_GROUP_SIZE = 5
+
+
+def pack_groups(keywords, anchor, group_size=MAX_GROUP_SIZE):
+    """Split keywords into comparison groups that all contain the anchor
+
+    Each group holds the anchor plus up to group_size - 1 other keywords,
+    so len(keywords) keywords cost about len(keywords) / 4 requests.
+    """
+    group_size = max(2, min(group_size, MAX_GROUP_SIZE))
+    others = [keyword for keyword in dict.fromkeys(keywords) if keyword != anchor]
+    step = group_size - 1
+    return [[anchor] + others[i:i + step] for i in range(0, len(others), step)] or [[anchor]]
+
+
+def normalize_groups(frames, anchor):
+    """Put the scores of several comparison groups on one scale
+
+    Trends scores are relative within a request (the peak of the group is
+    100). Every group contains the anchor, so a group's scores are scaled
+    by reference_anchor / group_anchor, where the reference is the first
+    group whose anchor has a non-zero mean. Groups whose anchor is all zero
+    cannot be aligned and get no normalized value.
+
+    Args:
+        frames (list): One DataFrame per group as returned by interest_over_time
+        anchor (str): Keyword present in every group
+
+    Returns:
+        pandas.DataFrame: Long format with columns time, keyword, group, value (raw
+        score within the group), normalized and is_partial
+    """
+    reference = None
+    anchor_written = False
+    rows = []
+    for group, frame in enumerate(frames):
+        if frame is None or frame.empty or anchor not in frame.columns:
+            continue
+        anchor_mean = frame[anchor].astype(float).mean()
+        if anchor_mean > 0 and reference is None:
+            reference = anchor_mean
+        scale = reference / anchor_mean if anchor_mean > 0 and reference else None
+        if scale is None:
+            logging.warning(f"Anchor '{anchor}' has no interest in group {group}, its scores are not normalized")
+
+        partial = frame['isPartial'] if 'isPartial' in frame.columns else None
+        for keyword in frame.columns:
+            if keyword == 'isPartial' or (keyword == anchor and anchor_written and scale is not None):
+                continue
+            values = frame[keyword].astype(float)
+            rows.append(pd.DataFrame({
+                'time': frame.index,
+                'keyword': keyword,
+                'group': group,
+                'value': values.values,
+                'normalized': (values * scale).round(2).values if scale is not None else float('nan'),
+                'is_partial': partial.values if partial is not None else False
+            }))
+        # 锚点只保留一份（参照组中的值）
+        anchor_written = anchor_written or scale is not None
+    if not rows:
+        return pd.DataFrame(columns=['time', 'keyword', 'group', 'value', 'normalized', 'is_partial'])
+    return pd.concat(rows, ignore_index=True)
+
+
+def collect_interest(keywords, anchor, fetch, group_size=MAX_GROUP_SIZE, delay_between_queries=0, sleep=default_clock.sleep):
+    """Fetch interest over time for all keywords in anchored groups and normalize them
+
+    Args:
+        fetch (callable): fetch(group) -> DataFrame, e.g. querytrends.get_interest_over_time
+        delay_between_queries (float): Base pause between group requests
+        sleep (callable): Used for the pause, e.g. the request limiter's sleep
+
+    Returns:
+        tuple: (normalized long DataFrame, list of keywords whose group failed)
+    """
+    groups = pack_groups(keywords, anchor, group_size)
+    frames = []
+    failed = []
+    for index, group in enumerate(groups):
+        try:
+            frames.append(fetch(group))
+        except TrendsError as e:
+            logging.error(f"Failed to get interest over time for {', '.join(group)}: {str(e)}")
+            frames.append(None)
+            failed.extend(group[1:] or group)
+            # 熔断器打开后剩余分组不再请求
+            if isinstance(e, (QuotaExceededError, CircuitOpenError)):
+                for skipped in groups[index + 1:]:
+                    failed.extend(skipped[1:])
+                break
+        if index < len(groups) - 1 and delay_between_queries:
+            sleep(delay_between_queries + random.uniform(0, 2))
+    logging.info(f"Interest over time: {len(keywords)} keywords in {len(groups)} requests, {len(failed)} failed")
+    return normalize_groups(frames, anchor), failed
+
+
+def save_interest(table, directory, filename):
+    """Write the normalized time series as CSV next to the day's related queries"""
+    path = os.path.join(directory, filename)
+    table.to_csv(path, index=False)
+    return path
@@ -0,0 +1,166 @@
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import random
+import pandas as pd
+from querytrends import get_related_queries
+from trends_errors import CircuitOpenError
+from keyword_index import normalize_keyword
+from clock import default_clock
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, sized from capacity and error rate"""
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class SeenSet:
+    """Set of seen queries kept only as a Bloom filter
+
+    Memory stays at about 1.44 * log2(1 / error_rate) bits per expected
+    query whatever the query lengths. A query already seen is always
+    recognized; a new one is taken for seen, and not expanded, with
+    probability error_rate while at most capacity queries were added.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._count = 0
+
+    def __contains__(self, item):
+        return item in self._bloom
+
+    def add(self, item):
+        """Add an item; returns True if it was (probably) not seen before"""
+        if item in self._bloom:
+            return False
+        self._bloom.add(item)
+        self._count += 1
+        return True
+
+    def __len__(self):
+        return self._count
+
+
+def _rising_score(value):
+    """Convert a rising value (number or 'Breakout'-like text) to a sortable score"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def expand_keywords(seeds, geo='', timeframe='today 12-m', max_depth=2, max_requests=20,
+                    min_rising_value=0, capacity=100000, error_rate=0.001,
+                    delay_between_queries=(10, 20), max_pause=3600, normalize=normalize_keyword,
+                    fetch=get_related_queries):
+    """Crawl related queries breadth-first starting from the seed keywords
+
+    Within each depth the frontier is ordered by rising value, so each
+    request goes to the query most likely to surface new keywords.
+    Crawling stops when the request budget is spent, the depth limit is
+    reached, the frontier is empty, or requests have been paused by the
+    circuit breaker for more than max_pause seconds in total.
+
+    Args:
+        seeds (list): Seed keywords, crawled first
+        geo (str): Geographic location code
+        timeframe (str): Time range passed to related_queries
+        max_depth (int): Maximum expansion depth (seeds are depth 0)
+        max_requests (int): Maximum number of related_queries requests
+        min_rising_value (float): Rising queries below this are not expanded
+        capacity (int): Expected number of distinct queries, sizes the seen-set
+        error_rate (float): Bloom filter false positive rate
+        delay_between_queries (tuple): Min/max seconds to wait between requests
+        max_pause (float): Total seconds to wait for an open circuit breaker before giving up
+        normalize (callable): Maps a query to its canonical form for deduplication
+        fetch (callable): Function used to fetch related queries
+
+    Returns:
+        list: Discovered queries as dicts with query, seed, parent, depth, type and value
+    """
+    seen = SeenSet(capacity, error_rate)
+    counter = itertools.count()
+    frontier = []
+    discovered = []
+
+    for seed in seeds:
+        if seen.add(normalize(seed)):
+            heapq.heappush(frontier, (0, -math.inf, next(counter), seed, seed))
+
+    requests_made = 0
+    paused = 0.0
+    while frontier and requests_made < max_requests:
+        depth, neg_score, _, query, seed = heapq.heappop(frontier)
+
+        if requests_made > 0:
+            delay = random.uniform(*delay_between_queries)
+            logging.info(f"Waiting {delay:.1f} seconds before expanding '{query}'...")
+            default_clock.sleep(delay)
+
+        logging.info(f"Expanding '{query}' (depth={depth}, score={-neg_score}, "
+                     f"request {requests_made + 1}/{max_requests})")
+        requests_made += 1
+        try:
+            data = fetch(query, geo, timeframe)
+        except CircuitOpenError as e:
+            # 熔断期间的失败不消耗请求预算，等待后重新排队；累计等待超过 max_pause 时停止扩展
+            requests_made -= 1
+            heapq.heappush(frontier, (depth, neg_score, next(counter), query, seed))
+            if paused + e.retry_after > max_pause:
+                logging.warning(f"Trends requests paused for over {max_pause:.0f}s, stopping expansion")
+                break
+            logging.warning(f"Trends requests paused, retrying '{query}' in {e.retry_after:.0f}s")
+            paused += e.retry_after
+            default_clock.sleep(e.retry_after)
+            continue
+        except Exception as e:
+            logging.error(f"Failed to expand '{query}': {str(e)}")
+            continue
+        if not data:
+            continue
+
+        for trend_type in ['rising', 'top']:
+            df = data.get(trend_type)
+            if not isinstance(df, pd.DataFrame) or df.empty:
+                continue
+            for related, value in zip(df['query'], df['value']):
+                if not seen.add(normalize(related)):
+                    continue
+                discovered.append({
+                    'query': related,
+                    'seed': seed,
+                    'parent': query,
+                    'depth': depth + 1,
+                    'type': trend_type,
+                    'value': value
+                })
+                score = _rising_score(value)
+                # 只有上升趋势进入待扩展队列，按增长值排序
+                if trend_type == 'rising' and depth + 1 < max_depth and score >= min_rising_value:
+                    heapq.heappush(frontier, (depth + 1, -score, next(counter), related, seed))
+
+    logging.info(f"Expansion finished: {requests_made} requests, {len(discovered)} new queries, "
+                 f"{len(frontier)} left in frontier")
+    return discovered
@@ -0,0 +1,102 @@
+import logging
+import sys
+import unicodedata
+
+
+def normalize_keyword(text, synonyms=None):
+    """Normalize a keyword to its canonical form
+
+    Applies Unicode NFKC (full-width -> half-width), case folding and
+    whitespace collapsing, then maps the result through the synonym table.
+
+    Args:
+        text (str): Raw keyword or related query
+        synonyms (dict): Normalized variant -> normalized canonical form
+
+    Returns:
+        str: Canonical keyword
+    """
+    text = unicodedata.normalize('NFKC', str(text))
+    text = ' '.join(text.split()).casefold()
+    if synonyms:
+        text = synonyms.get(text, text)
+    return text
+
+
+def clean_spelling(text):
+    """Keyword as written, with NFKC width folding and collapsed whitespace but case kept"""
+    return ' '.join(unicodedata.normalize('NFKC', str(text)).split())
+
+
+class KeywordIndex:
+    """Interned canonical-ID index for the configured keywords
+
+    Every distinct canonical form gets a stable integer ID for the lifetime
+    of the index, and the first spelling seen is kept for display. Only
+    configured keywords are interned (through dedupe); related queries are
+    normalized or displayed without being added, so the index does not grow
+    with every query Google returns.
+    """
+
+    def __init__(self, synonyms=None):
+        self._synonyms = {}
+        for variant, canonical in (synonyms or {}).items():
+            self._synonyms[normalize_keyword(variant)] = normalize_keyword(canonical)
+        self._ids = {}
+        self._canonical = []
+        self._display = []
+
+    def normalize(self, text):
+        return normalize_keyword(text, self._synonyms)
+
+    def intern(self, text):
+        """Return the canonical ID of text, assigning a new one if needed"""
+        canonical = self.normalize(text)
+        keyword_id = self._ids.get(canonical)
+        if keyword_id is None:
+            keyword_id = len(self._canonical)
+            canonical = sys.intern(canonical)
+            self._ids[canonical] = keyword_id
+            self._canonical.append(canonical)
+            self._display.append(clean_spelling(text))
+        return keyword_id
+
+    def lookup(self, text):
+        """Return the canonical ID of text, or None if it was never interned"""
+        return self._ids.get(self.normalize(text))
+
+    def canonical(self, keyword_id):
+        return self._canonical[keyword_id]
+
+    def display(self, keyword_id):
+        return self._display[keyword_id]
+
+    def display_text(self, text):
+        """Display spelling of text: the configured keyword's if interned, else text itself"""
+        keyword_id = self.lookup(text)
+        return self._display[keyword_id] if keyword_id is not None else clean_spelling(text)
+
+    def __len__(self):
+        return len(self._canonical)
+
+    def __contains__(self, text):
+        return self.normalize(text) in self._ids
+
+    def dedupe(self, keywords):
+        """Drop keywords whose canonical form already appeared earlier in the list
+
+        The keywords are interned, so reports show the configured spelling.
+
+        Returns:
+            list: Cleaned keywords in original order, the list's first spelling of each canonical form
+        """
+        unique = {}
+        for keyword in keywords:
+            keyword_id = self.intern(keyword)
+            if keyword_id in unique:
+                logging.info(f"Skipping duplicate keyword '{keyword}' (same as '{unique[keyword_id]}')")
+                continue
+            unique[keyword_id] = clean_spelling(keyword)
+            # 配置中改了写法时，报告随之使用新的写法
+            self._display[keyword_id] = unique[keyword_id]
+        return list(unique.values())
@@ -0,0 +1,131 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from datetime import datetime, timezone
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extra fields"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in N records of high-volume loggers; warnings and errors always pass
+
+    Args:
+        rates (dict): Logger name (or prefix) -> fraction of records kept, e.g. {'querytrends.request': 0.1}
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self._every = {name: max(1, round(1 / rate)) for name, rate in rates.items() if 0 < rate < 1}
+        self._dropped = {name for name, rate in rates.items() if rate <= 0}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _rule(self, name):
+        while name:
+            if name in self._every or name in self._dropped:
+                return name
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or (not self._every and not self._dropped):
+            return True
+        rule = self._rule(record.name)
+        if rule is None:
+            return True
+        if rule in self._dropped:
+            return False
+        with self._lock:
+            count = self._counters.get(rule, 0)
+            self._counters[rule] = count + 1
+        return count % self._every[rule] == 0
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that only renders the message text in the calling thread
+
+    Formatting, JSON encoding and file I/O all happen on the listener thread.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def stop(self):
+        # 允许手动停止后 atexit 再次调用
+        if self._thread is not None:
+            super().stop()
+
+
+def setup_logging(config, stream=True):
+    """Route all logging through a queue drained by a background listener
+
+    Args:
+        config (dict): LOGGING_CONFIG
+        stream (bool): Also write human-readable lines to stderr
+
+    Returns:
+        QueueListener: Already started; stopped automatically at exit
+    """
+    handlers = []
+    if config.get('log_file'):
+        file_handler = logging.handlers.RotatingFileHandler(
+            config['log_file'],
+            maxBytes=config.get('max_bytes', 10 * 1024 * 1024),
+            backupCount=config.get('backup_count', 5),
+            encoding='utf-8'
+        )
+        file_handler.setFormatter(JsonFormatter() if config.get('json', True)
+                                  else logging.Formatter(config['format']))
+        handlers.append(file_handler)
+    if stream:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(config['format']))
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(config.get('sample_rates', {})))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, config['level']))
+
+    listener = _QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
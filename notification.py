@@ -1,74 +1,225 @@
 import os
 import smtplib
 import logging
+import threading
+import json
+import re
+import itertools
+import urllib.request
+import uuid
 import itchat
 import itchat.content
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
 from config import EMAIL_CONFIG, NOTIFICATION_CONFIG
-import pandas as pd
-import time
+from attachments import iter_base64_lines, linked_attachments_html, prepare_attachments, split_by_size
 from wechat_utils import WeChatManager
+from clock import default_clock
+from result_table import ResultTable, table_path
 
-class NotificationManager:
-    def __init__(self):
-        self.wechat_manager = None
-        if NOTIFICATION_CONFIG['method'] in ['wechat', 'both']:
-            self.wechat_manager = WeChatManager()
-
-    def send_notification(self, subject, body, attachments=None):
-        """发送通知，根据配置选择发送方式"""
-        method = NOTIFICATION_CONFIG['method']
-        success = True
 
-        if method in ['email', 'both']:
-            email_success = self._send_email(subject, body, attachments)
-            success = success and email_success
+def _html_to_text(html):
+    """简单的HTML到纯文本转换"""
+    text = re.sub('<[^<]+?>', '', html)
+    return text.replace('&nbsp;', ' ').replace('&lt;', '<').replace('&gt;', '>')
 
-        if method in ['wechat', 'both']:
-            wechat_success = self._send_wechat(subject, body, attachments)
-            success = success and wechat_success
 
-        return success
+class ChannelRateLimiter:
+    """Token bucket shared by all deliveries of one channel"""
 
-    def _send_email(self, subject, body, attachments=None):
-        """发送邮件通知"""
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = EMAIL_CONFIG['sender_email']
-            msg['To'] = EMAIL_CONFIG['recipient_email']
-            msg['Subject'] = subject
+    def __init__(self, rate_per_minute, burst=None):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self.capacity = burst or max(1, int(rate_per_minute or 1))
+        self.tokens = float(self.capacity)
+        self.updated = default_clock.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        """Take a token, waiting until one is free; False if the deadline passes first"""
+        if not self.interval:
+            return True
+        while True:
+            with self._lock:
+                now = default_clock.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) * self.interval
+            if now + wait > deadline:
+                return False
+            default_clock.sleep(wait)
+
+
+class Channel:
+    """A notification channel delivering to one recipient per send() call
+
+    Subclasses implement send(); the manager applies the channel's rate
+    limit, concurrency and timeout around it. Attachments arrive as
+    attachments.Attachment objects; those larger than the channel's
+    max_attachment_bytes option (default NOTIFICATION_CONFIG
+    ['attachment_max_bytes']) are replaced by links in the body.
+    """
+
+    type_name = None
+    default_timeout = 60
+    default_rate_per_minute = 30
+    default_concurrency = 4
+
+    def __init__(self, recipients, timeout=None, rate_per_minute=None, concurrency=None, **options):
+        self.recipients = [r for r in recipients if r]
+        self.timeout = timeout or self.default_timeout
+        self.rate_limiter = ChannelRateLimiter(
+            self.default_rate_per_minute if rate_per_minute is None else rate_per_minute)
+        self.slots = threading.BoundedSemaphore(concurrency or self.default_concurrency)
+        self.options = options
+
+    @property
+    def name(self):
+        return self.options.get('name') or self.type_name
+
+    @property
+    def max_attachment_bytes(self):
+        return self.options.get('max_attachment_bytes', NOTIFICATION_CONFIG.get('attachment_max_bytes', 0))
+
+    def deliver(self, recipient, deadline, subject, body, attachments=None, report_data=None):
+        """Send to one recipient within the channel limits"""
+        if not self.rate_limiter.acquire(deadline):
+            logging.error(f"{self.name}: rate limit would exceed timeout, skipping {recipient}")
+            return False
+        attachments, linked = split_by_size(attachments or [], self.max_attachment_bytes)
+        if linked:
+            # 超过大小限制的附件不发送，在正文中给出文件大小和链接
+            body += linked_attachments_html(linked)
+        with self.slots:
+            return self.send(recipient, subject, body, attachments, report_data)
+
+    def send(self, recipient, subject, body, attachments=None, report_data=None):
+        raise NotImplementedError
+
+
+CHANNEL_TYPES = {}
+
+
+def register_channel(type_name):
+    """Class decorator adding a channel type to the registry"""
+    def decorator(cls):
+        cls.type_name = type_name
+        CHANNEL_TYPES[type_name] = cls
+        return cls
+    return decorator
 
-            msg.attach(MIMEText(body, 'html'))
 
-            if attachments:
-                for filepath in attachments:
-                    with open(filepath, 'rb') as f:
-                        part = MIMEApplication(f.read(), Name=os.path.basename(filepath))
-                    part['Content-Disposition'] = f'attachment; filename="{os.path.basename(filepath)}"'
-                    msg.attach(part)
+@register_channel('email')
+class EmailChannel(Channel):
+    default_timeout = 60
+    default_rate_per_minute = 20
 
-            with smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port']) as server:
+    @staticmethod
+    def write_message(write, recipient, subject, body, attachments=None):
+        """Write the MIME message through write(bytes) with CRLF line endings
+
+        Attachments are read and base64-encoded chunk by chunk, so the
+        message is never held in memory as a whole.
+        """
+        boundary = f"=============={uuid.uuid4().hex}=="
+        msg = MIMEMultipart(boundary=boundary)
+        msg['From'] = EMAIL_CONFIG['sender_email']
+        msg['To'] = recipient
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'html'))
+        policy = msg.policy.clone(linesep='\r\n')
+        head = msg.as_bytes(policy=policy)
+        if not attachments:
+            write(head)
+            return
+
+        # 去掉结束分隔符，在其前面逐个写入附件
+        closing = f"--{boundary}--\r\n".encode('ascii')
+        write(head[:head.rindex(closing)])
+        for attachment in attachments:
+            part = MIMEBase(*attachment.content_type.split('/', 1))
+            part.add_header('Content-Disposition', 'attachment', filename=attachment.filename)
+            part['Content-Transfer-Encoding'] = 'base64'
+            write(f"--{boundary}\r\n".encode('ascii') + part.as_bytes(policy=policy))
+            with attachment.open() as f:
+                for lines in iter_base64_lines(f):
+                    write(lines)
+            write(b'\r\n')
+        write(closing)
+
+    def _send_data(self, server, recipient, subject, body, attachments):
+        """SMTP DATA with the message streamed to the socket instead of built in memory"""
+        sender = EMAIL_CONFIG['sender_email']
+        code, response = server.mail(sender)
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, response, sender)
+        code, response = server.rcpt(recipient)
+        if code not in (250, 251):
+            raise smtplib.SMTPRecipientsRefused({recipient: (code, response)})
+        code, response = server.docmd('data')
+        if code != 354:
+            raise smtplib.SMTPDataError(code, response)
+
+        at_line_start = True
+
+        def write(data):
+            nonlocal at_line_start
+            if not data:
+                return
+            # 行首的 '.' 需要转义（RFC 5321 4.5.2）
+            stuffed = data.replace(b'\n.', b'\n..')
+            if at_line_start and stuffed.startswith(b'.'):
+                stuffed = b'.' + stuffed
+            at_line_start = data.endswith(b'\n')
+            server.send(stuffed)
+
+        self.write_message(write, recipient, subject, body, attachments)
+        server.send(b'.\r\n')
+        code, response = server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, response)
+
+    def send(self, recipient, subject, body, attachments=None, report_data=None):
+        """发送邮件通知"""
+        try:
+            with smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port'], timeout=self.timeout) as server:
                 server.ehlo()
                 server.starttls()
                 server.ehlo()
                 logging.info("Attempting to login to Gmail...")
                 server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
                 logging.info("Login successful, sending email...")
-                server.send_message(msg)
+                self._send_data(server, recipient, subject, body, attachments)
                 
-            logging.info(f"Email sent successfully: {subject}")
+            logging.info(f"Email sent successfully to {recipient}: {subject}")
             return True
         except Exception as e:
-            logging.error(f"Failed to send email: {str(e)}")
+            logging.error(f"Failed to send email to {recipient}: {str(e)}")
             logging.error(f"Email configuration used: server={EMAIL_CONFIG['smtp_server']}, port={EMAIL_CONFIG['smtp_port']}")
             return False
 
+
+@register_channel('wechat')
+class WeChatChannel(Channel):
+    # itchat 只有一个登录会话，同一时间只发给一个接收者
+    default_timeout = 120
+    default_rate_per_minute = 10
+    default_concurrency = 1
+
+    def __init__(self, recipients, **kwargs):
+        super().__init__(recipients, **kwargs)
+        self.wechat_manager = WeChatManager()
+        # 租户或重新加载的配置中的微信渠道也需要登录
+        self.wechat_manager.require()
+
     def _format_wechat_message(self, subject, body, report_data=None):
         """格式化微信消息内容"""
         # 移除HTML标签
-        text = self._html_to_text(body)
+        text = _html_to_text(body)
         
         # 提取和格式化关键信息
         lines = text.split('\n')
@@ -120,19 +271,17 @@ class NotificationManager:
         if trend_buffer:
             formatted_lines.extend(self._format_trend_data(trend_buffer))
         
-        if report_data is not None and isinstance(report_data, pd.DataFrame):
+        if report_data is not None and len(report_data):
             formatted_lines.append("\n📌 详细报告:")
             
-            for keyword in report_data['keyword'].unique():
-                keyword_data = report_data[report_data['keyword'] == keyword]
+            for keyword, by_type in report_data.grouped().items():
                 formatted_lines.append(f"\n🔍 {keyword}")
                 
                 for trend_type in ['rising', 'top']:
-                    type_data = keyword_data[keyword_data['type'] == trend_type]
-                    if not type_data.empty:
+                    if by_type[trend_type]:
                         formatted_lines.append(f"  {'↗️ 上升趋势' if trend_type == 'rising' else '⭐ 热门趋势'}:")
-                        for _, row in type_data.iterrows():
-                            formatted_lines.append(f"    • {row['related_keywords']} ({row['value']})")
+                        for query, value in by_type[trend_type]:
+                            formatted_lines.append(f"    • {query} ({value})")
         
         return '\n'.join(formatted_lines)
 
@@ -196,7 +345,7 @@ class NotificationManager:
                 chunk_text = '\n'.join(current_chunk)
                 if not self.wechat_manager.send_message(chunk_text, receiver_id):
                     raise Exception("Failed to send message chunk")
-                time.sleep(0.5)
+                default_clock.sleep(0.5)
                 current_chunk = []
                 current_length = 0
             
@@ -205,7 +354,7 @@ class NotificationManager:
                     chunk_text = '\n'.join(current_chunk)
                     if not self.wechat_manager.send_message(chunk_text, receiver_id):
                         raise Exception("Failed to send message chunk")
-                    time.sleep(0.5)
+                    default_clock.sleep(0.5)
                     current_chunk = []
                     current_length = 0
                 
@@ -213,7 +362,7 @@ class NotificationManager:
                     chunk = line[i:i + chunk_size]
                     if not self.wechat_manager.send_message(chunk, receiver_id):
                         raise Exception("Failed to send message chunk")
-                    time.sleep(0.5)
+                    default_clock.sleep(0.5)
             else:
                 current_chunk.append(line)
                 current_length += line_length
@@ -223,12 +372,22 @@ class NotificationManager:
             if not self.wechat_manager.send_message(chunk_text, receiver_id):
                 raise Exception("Failed to send final message chunk")
 
-    def _send_wechat(self, subject, body, attachments=None):
-        """发送微信通知"""
-        if not self.wechat_manager:
-            logging.error("WeChat manager not initialized")
-            return False
+    def _load_report_table(self, attachments):
+        """从报告附件旁的列式文件（内存映射）加载报告数据"""
+        for attachment in attachments or []:
+            if not attachment.path.endswith('.csv'):
+                continue
+            path = table_path(attachment.path)
+            if not os.path.exists(path):
+                continue
+            try:
+                return ResultTable.load(path)
+            except Exception as e:
+                logging.warning(f"Failed to load report table {path}: {str(e)}")
+        return None
 
+    def send(self, recipient, subject, body, attachments=None, report_data=None):
+        """发送微信通知，recipient 为接收者的备注名或微信号"""
         max_retries = 3
         retry_count = 0
         
@@ -237,31 +396,29 @@ class NotificationManager:
                 if not self.wechat_manager.ensure_login():
                     raise Exception("Failed to ensure WeChat connection")
 
-                receiver_name = NOTIFICATION_CONFIG['wechat_receiver']
-                receiver_id = self.wechat_manager.get_user_id(receiver_name)
+                receiver_id = self.wechat_manager.get_user_id(recipient)
                 if not receiver_id:
-                    raise Exception(f"Cannot find receiver: {receiver_name}")
-                
-                report_data = None
-                if attachments and any(f.endswith('.csv') for f in attachments):
-                    csv_file = next(f for f in attachments if f.endswith('.csv'))
-                    try:
-                        report_data = pd.read_csv(csv_file)
-                    except Exception as e:
-                        logging.warning(f"Failed to read report CSV file: {str(e)}")
+                    raise Exception(f"Cannot find receiver: {recipient}")
                 
-                message = self._format_wechat_message(subject, body, report_data)
+                # 自行加载的列式文件用完即关闭内存映射
+                loaded = self._load_report_table(attachments) if report_data is None else None
+                try:
+                    message = self._format_wechat_message(subject, body, report_data if loaded is None else loaded)
+                finally:
+                    if loaded is not None:
+                        loaded.close()
                 self._send_wechat_message_in_chunks(message, receiver_id)
                 
                 if attachments:
-                    for filepath in attachments:
-                        if not filepath.endswith('.csv'):
-                            file_message = f"\n📎 正在发送文件: {os.path.basename(filepath)}"
+                    for attachment in attachments:
+                        # CSV 报告已在消息正文中展开
+                        if not attachment.path.endswith('.csv'):
+                            file_message = f"\n📎 正在发送文件: {attachment.summary()}"
                             if not self.wechat_manager.send_message(file_message, receiver_id):
                                 raise Exception("Failed to send file message")
-                            itchat.send_file(filepath, toUserName=receiver_id)
+                            itchat.send_file(attachment.delivery_path, toUserName=receiver_id)
                 
-                logging.info(f"WeChat message sent successfully: {subject}")
+                logging.info(f"WeChat message sent successfully to {recipient}: {subject}")
                 return True
                 
             except Exception as e:
@@ -269,15 +426,179 @@ class NotificationManager:
                 error_msg = f"Failed to send WeChat message (attempt {retry_count}/{max_retries}): {str(e)}"
                 if retry_count < max_retries:
                     logging.warning(error_msg + " Retrying...")
-                    time.sleep(5)
+                    default_clock.sleep(5)
                 else:
                     logging.error(error_msg)
                     return False
         
         return False
 
-    def _html_to_text(self, html):
-        """简单的HTML到纯文本转换"""
-        import re
-        text = re.sub('<[^<]+?>', '', html)
-        return text.replace('&nbsp;', ' ').replace('&lt;', '<').replace('&gt;', '>')
+
+@register_channel('webhook')
+class WebhookChannel(Channel):
+    """POST a JSON message to HTTP endpoints (chat bots, incident tools, ...)
+
+    Options:
+        headers (dict): Extra request headers, e.g. an Authorization token
+        text_field (str): JSON field receiving the plain-text message, default 'text'
+    """
+
+    default_timeout = 10
+    default_rate_per_minute = 30
+
+    def send(self, recipient, subject, body, attachments=None, report_data=None):
+        text = f"{subject}\n\n{_html_to_text(body).strip()}"
+        if attachments:
+            # Webhook 不能携带文件，只给出附件的链接
+            text += "\n\n" + "\n".join(f"📎 {a.summary()}: {a.link}" for a in attachments)
+        payload = {self.options.get('text_field', 'text'): text, 'subject': subject}
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        headers.update(self.options.get('headers') or {})
+        request = urllib.request.Request(
+            recipient,
+            data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+            headers=headers,
+            method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+            logging.info(f"Webhook delivered to {recipient}: {subject}")
+            return True
+        except Exception as e:
+            logging.error(f"Failed to deliver webhook to {recipient}: {str(e)}")
+            return False
+
+
+@register_channel('outbox')
+class OutboxChannel(Channel):
+    """Write each notification as a .eml file into a local directory instead of sending it
+
+    Recipients are directory paths. Used for replays and for checking the
+    formatted output without a mail server.
+    """
+
+    default_timeout = 60
+    default_rate_per_minute = 0
+
+    def __init__(self, recipients, **kwargs):
+        super().__init__(recipients, **kwargs)
+        self._counter = itertools.count(1)
+
+    def send(self, recipient, subject, body, attachments=None, report_data=None):
+        try:
+            os.makedirs(recipient, exist_ok=True)
+            path = os.path.join(recipient, f"{default_clock.now().strftime('%Y%m%d_%H%M%S')}_{next(self._counter):04d}.eml")
+            with open(path, 'wb') as f:
+                EmailChannel.write_message(f.write, recipient, subject, body, attachments)
+            logging.info(f"Notification written to {path}: {subject}")
+            return True
+        except Exception as e:
+            logging.error(f"Failed to write notification to {recipient}: {str(e)}")
+            return False
+
+
+def _legacy_channels():
+    """Channel list equivalent to the old 'method' setting"""
+    method = NOTIFICATION_CONFIG.get('method', 'email')
+    channels = []
+    if method in ['email', 'both']:
+        channels.append({'type': 'email',
+                         'recipients': EMAIL_CONFIG['recipient_email'].split(',')})
+    if method in ['wechat', 'both']:
+        channels.append({'type': 'wechat', 'recipients': [NOTIFICATION_CONFIG['wechat_receiver']]})
+    return channels
+
+
+def build_channels(channel_configs):
+    channels = []
+    for channel_config in channel_configs:
+        options = dict(channel_config)
+        channel_type = options.pop('type')
+        if channel_type not in CHANNEL_TYPES:
+            raise ValueError(f"Unknown notification channel type: {channel_type}")
+        recipients = [r.strip() for r in options.pop('recipients', [])]
+        channels.append(CHANNEL_TYPES[channel_type](recipients, **options))
+    return channels
+
+
+class NotificationManager:
+    """Fans each notification out to every recipient of every channel concurrently
+
+    Delivery takes as long as the slowest channel (bounded by its timeout)
+    instead of the sum of all channels. A manager replaced by a config
+    reload is shut down once its notifications in progress have finished.
+    """
+
+    def __init__(self, channels=None, max_workers=8):
+        if channels is None:
+            channels = build_channels(NOTIFICATION_CONFIG.get('channels') or _legacy_channels())
+        self.channels = channels
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='notify')
+        self._state_lock = threading.Lock()
+        self._sending = 0
+        self._retired = False
+
+    def shutdown(self):
+        """Release the worker threads once the notifications in progress are done
+
+        Does not block: a send that already started, possibly on a manager
+        fetched just before a reload, completes on the existing workers,
+        and the executor is shut down after the last one.
+        """
+        with self._state_lock:
+            self._retired = True
+            idle = not self._sending
+        if idle:
+            self._executor.shutdown(wait=False)
+
+    def send_notification(self, subject, body, attachments=None, report_data=None):
+        """发送通知到所有配置的渠道和接收者
+
+        Args:
+            report_data: 内存中的报告数据（ResultTable），微信消息直接使用，无需重新读取CSV
+
+        Returns:
+            bool: 所有接收者都发送成功时为 True
+        """
+        with self._state_lock:
+            self._sending += 1
+        try:
+            return self._send_notification(subject, body, attachments, report_data)
+        finally:
+            with self._state_lock:
+                self._sending -= 1
+                idle = self._retired and not self._sending
+            if idle:
+                # 已超时仍在运行的发送完成后，工作线程随之退出
+                self._executor.shutdown(wait=False)
+
+    def _send_notification(self, subject, body, attachments, report_data):
+        # 附件只压缩一次，所有渠道和接收者共用
+        prepared = prepare_attachments(attachments)
+        start = default_clock.monotonic()
+        pending = []
+        try:
+            for channel in self.channels:
+                deadline = start + channel.timeout
+                for recipient in channel.recipients:
+                    prepared.acquire()
+                    future = self._executor.submit(channel.deliver, recipient, deadline, subject, body,
+                                                   prepared.items, report_data)
+                    future.add_done_callback(lambda _: prepared.release())
+                    pending.append((channel, recipient, deadline, future))
+        finally:
+            prepared.release()
+
+        success = True
+        for channel, recipient, deadline, future in pending:
+            try:
+                delivered = future.result(timeout=max(0.0, deadline - default_clock.monotonic()))
+            except FutureTimeoutError:
+                logging.error(f"{channel.name}: delivery to {recipient} timed out after {channel.timeout}s")
+                delivered = False
+            except Exception as e:
+                logging.error(f"{channel.name}: delivery to {recipient} failed: {str(e)}")
+                delivered = False
+            success = success and bool(delivered)
+        return success
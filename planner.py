@@ -0,0 +1,121 @@
+import logging
+import random
+import statistics
+from datetime import timedelta
+from querytrends import RequestLimiter
+from trends_client import CALLS_PER_REQUEST
+from clock import FakeClock
+
+
+def simulate_run(keyword_count, batch_size=5, batch_interval=300, min_delay=10, max_delay=20,
+                 max_per_minute=30, max_per_hour=200, request_seconds=2.0, calls_per_request=CALLS_PER_REQUEST, rng=None):
+    """Replay the waits of one collection run on a virtual clock
+
+    Mirrors process_trends / batch_get_queries / get_related_queries:
+    1-3 s pre-request delay, a limiter wait per HTTP call, per-batch base delay plus 0-2 s
+    between queries, and batch_interval plus 0-60 s between batches.
+    Requests are assumed to succeed and take request_seconds; each one
+    makes calls_per_request HTTP calls (token page and data), and every
+    call takes a limiter slot.
+
+    Returns:
+        dict: duration, requests, limiter_wait and a per-batch timeline
+    """
+    rng = rng or random.Random()
+    clock = FakeClock(start=0.0)
+    limiter = RequestLimiter(max_per_minute, max_per_hour, clock=clock, sleep=clock.sleep)
+    timeline = []
+    limiter_wait = 0.0
+
+    for start in range(0, keyword_count, batch_size):
+        size = min(batch_size, keyword_count - start)
+        batch_start = clock()
+        batch_wait = 0.0
+        delay_between_queries = rng.uniform(min_delay, max_delay)
+        for i in range(size):
+            clock.sleep(rng.uniform(1, 3))
+            for _ in range(calls_per_request):
+                before = clock()
+                while not limiter.try_acquire():
+                    clock.sleep(rng.uniform(5, 10))
+                batch_wait += clock() - before
+                clock.sleep(request_seconds / calls_per_request)
+            if i < size - 1:
+                clock.sleep(delay_between_queries + rng.uniform(0, 2))
+        limiter_wait += batch_wait
+        timeline.append({
+            'batch': len(timeline) + 1,
+            'keywords': size,
+            'start': batch_start,
+            'end': clock(),
+            'limiter_wait': batch_wait
+        })
+        if start + batch_size < keyword_count:
+            clock.sleep(batch_interval + rng.uniform(0, 60))
+
+    return {
+        'duration': clock(),
+        'requests': keyword_count,
+        'http_calls': keyword_count * calls_per_request,
+        'limiter_wait': limiter_wait,
+        'timeline': timeline
+    }
+
+
+def plan_run(keyword_count, window_hours=None, simulations=20, seed=None, **limits):
+    """Simulate a run several times and summarize the expected duration
+
+    Args:
+        keyword_count (int): Number of keywords requested in the run
+        window_hours (float): Time the run must finish in; a warning is added when exceeded
+        simulations (int): Number of randomized runs used for the estimate
+        seed (int): Seed for reproducible output
+        **limits: Passed to simulate_run
+
+    Returns:
+        dict: Median run (with timeline) plus p95/max durations and warnings
+    """
+    rng = random.Random(seed)
+    runs = sorted((simulate_run(keyword_count, rng=rng, **limits) for _ in range(max(1, simulations))),
+                  key=lambda run: run['duration'])
+    durations = [run['duration'] for run in runs]
+    plan = dict(runs[len(runs) // 2])
+    plan['p95_duration'] = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    plan['max_duration'] = durations[-1]
+    plan['mean_duration'] = statistics.mean(durations)
+    plan['warnings'] = []
+
+    if window_hours and plan['p95_duration'] > window_hours * 3600:
+        per_keyword = plan['mean_duration'] / keyword_count if keyword_count else 0
+        fits = int(window_hours * 3600 / per_keyword) if per_keyword else keyword_count
+        plan['warnings'].append(
+            f"Run needs about {_format_seconds(plan['p95_duration'])} (p95) but the schedule window is "
+            f"{window_hours:g} h; roughly {fits} of {keyword_count} keywords fit")
+    for warning in plan['warnings']:
+        logging.warning(warning)
+    return plan
+
+
+def _format_seconds(seconds):
+    return str(timedelta(seconds=int(seconds)))
+
+
+def format_plan(plan, max_batches=50):
+    """Render a plan as plain text for the --dry-run output"""
+    lines = [
+        f"Requests:          {plan['requests']} ({plan['http_calls']} HTTP calls)",
+        f"Expected duration: {_format_seconds(plan['duration'])} "
+        f"(p95 {_format_seconds(plan['p95_duration'])}, max {_format_seconds(plan['max_duration'])})",
+        f"Rate limit waits:  {_format_seconds(plan['limiter_wait'])}",
+        "",
+        f"{'Batch':>5}  {'Keywords':>8}  {'Start':>9}  {'End':>9}  {'Limit wait':>10}"
+    ]
+    timeline = plan['timeline']
+    for entry in timeline[:max_batches]:
+        lines.append(f"{entry['batch']:>5}  {entry['keywords']:>8}  {_format_seconds(entry['start']):>9}  "
+                     f"{_format_seconds(entry['end']):>9}  {_format_seconds(entry['limiter_wait']):>10}")
+    if len(timeline) > max_batches:
+        lines.append(f"... {len(timeline) - max_batches} more batches")
+    for warning in plan['warnings']:
+        lines.append(f"WARNING: {warning}")
+    return "\n".join(lines)
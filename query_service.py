@@ -0,0 +1,457 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+from attachments import CHUNK_SIZE, FILES_PATH, servable
+from clock import default_clock
+from compaction import (
+    INDEX_SUFFIX, data_file_name, keyword_locations, list_day_directories, location_matches, read_archived_record,
+    result_file_order
+)
+from keyword_index import normalize_keyword
+from raw_archive import ARCHIVE_SUFFIX, iter_raw_records
+from tenants import tenant_archive_dir, tenant_data_prefix, validate_tenant_name
+from config import STORAGE_CONFIG, COMPACTION_CONFIG, SERVICE_CONFIG
+
+_DATE_PATTERN = re.compile(r'^\d{8}$')
+
+
+class LocalStore:
+    """Read-only view over the daily report directories and monthly archives
+
+    Never talks to Google: everything is served from files written by
+    trends_monitor. signature() results are reused for signature_ttl
+    seconds, so cached responses are served without listing every file.
+    """
+
+    def __init__(self, data_dir_prefix, archive_dir, dict_dir=None, json_prefix='related_queries_', file_patterns=(),
+                 signature_ttl=0, clock=default_clock.time):
+        self.data_dir_prefix = data_dir_prefix
+        self.archive_dir = archive_dir
+        self.dict_dir = dict_dir
+        self.json_prefix = json_prefix
+        self.file_patterns = list(file_patterns)
+        self.signature_ttl = signature_ttl
+        self.clock = clock
+        self._indexes = {}  # 索引文件路径 -> ((mtime, size), {日期: 关键词位置})
+        self._index_lock = threading.Lock()
+        self._signatures = {}  # 日期 -> (计算时间, 签名)
+        self._tenants = {}
+        self._tenant_lock = threading.Lock()
+
+    def for_tenant(self, name):
+        """Store over a tenant's data (reports/<tenant>/ and archive_dir/<tenant>), or None if it has none"""
+        try:
+            validate_tenant_name(name)
+        except ValueError:
+            return None
+        with self._tenant_lock:
+            store = self._tenants.get(name)
+            if store is None:
+                prefix = tenant_data_prefix(self.data_dir_prefix, name)
+                archive_dir = tenant_archive_dir(self.archive_dir, name)
+                if not os.path.isdir(os.path.dirname(prefix)) and not os.path.isdir(archive_dir):
+                    return None
+                store = self._tenants[name] = LocalStore(
+                    prefix, archive_dir, self.dict_dir, self.json_prefix, self.file_patterns,
+                    self.signature_ttl, self.clock)
+            return store
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return 0, 0
+
+    def _index_paths(self):
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(os.path.join(self.archive_dir, name) for name in os.listdir(self.archive_dir)
+                      if name.endswith(INDEX_SUFFIX))
+
+    def signature(self, date=None):
+        """Version stamp that changes when the data behind a request may have changed
+
+        Covers every file a response can be built from: the archive indexes
+        and the result files of the requested day, or of every day when no
+        date is given (latest and history read all of them, and a backfill
+        may append to any day). Computing it lists those files, so a result
+        younger than signature_ttl seconds is returned as is.
+        """
+        if self.signature_ttl > 0:
+            now = self.clock()
+            cached = self._signatures.get(date)
+            if cached is not None and now - cached[0] < self.signature_ttl:
+                return cached[1]
+            signature = self._compute_signature(date)
+            if len(self._signatures) >= 1024:
+                self._signatures = {key: value for key, value in self._signatures.items()
+                                    if now - value[0] < self.signature_ttl}
+            self._signatures[date] = (now, signature)
+            return signature
+        return self._compute_signature(date)
+
+    def _compute_signature(self, date):
+        root = os.path.dirname(self.data_dir_prefix) or '.'
+        days = list_day_directories(self.data_dir_prefix)
+        if date:
+            directories = [days[date]] if date in days else []
+        else:
+            directories = sorted(days.values())
+        stamps = [self._stamp(root), self._stamp(self.archive_dir)]
+        stamps.extend((path, self._stamp(path)) for path in self._index_paths())
+        for directory in directories:
+            stamps.append((directory, self._stamp(directory)))
+            try:
+                names = sorted(os.listdir(directory))
+            except OSError:
+                continue
+            for name in names:
+                if name.startswith(self.json_prefix):
+                    path = os.path.join(directory, name)
+                    stamps.append((path, self._stamp(path)))
+        return hash(tuple(stamps))
+
+    def _archived_days(self):
+        """{day: {keyword: location}} over all archive indexes, reparsed only when an index changes"""
+        days = {}
+        paths = self._index_paths()
+        with self._index_lock:
+            for path in list(self._indexes):
+                if path not in paths:
+                    del self._indexes[path]
+            for path in paths:
+                stamp = self._stamp(path)
+                cached = self._indexes.get(path)
+                if cached is None or cached[0] != stamp:
+                    try:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            entries = {day: entry.get('keywords', {})
+                                       for day, entry in json.load(f).get('days', {}).items()}
+                    except (OSError, ValueError) as e:
+                        logging.warning(f"Skipping unreadable archive index {os.path.basename(path)}: {str(e)}")
+                        continue
+                    cached = self._indexes[path] = (stamp, entries)
+                days.update(cached[1])
+        return days
+
+    def file_path(self, relative):
+        """Absolute path of a downloadable file under the data directory
+
+        Returns None unless the file exists inside the data directory and
+        its relative path matches one of file_patterns (reports and
+        attachments); state files, raw data and archives are never served.
+        """
+        root = os.path.realpath(os.path.dirname(self.data_dir_prefix) or '.')
+        path = os.path.realpath(os.path.join(root, relative))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            return None
+        if not servable(os.path.relpath(path, root), self.file_patterns):
+            return None
+        return path
+
+    def dates(self):
+        return sorted(set(list_day_directories(self.data_dir_prefix)) | set(self._archived_days()))
+
+    def _day_records(self, directory):
+        """Yield raw records of a live daily directory, newest files last"""
+        for name in sorted(os.listdir(directory), key=result_file_order):
+            if not name.startswith(self.json_prefix):
+                continue
+            # 未完成的 .part 文件不读取；另存的旧归档按原格式读取
+            data_name = data_file_name(name) if not name.endswith('.part') else name
+            if not (data_name.endswith(ARCHIVE_SUFFIX) or data_name.endswith('.jsonl') or data_name.endswith('.json')):
+                continue
+            try:
+                yield from iter_raw_records(os.path.join(directory, name), self.dict_dir, data_name)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping unreadable result file {name}: {str(e)}")
+
+    @staticmethod
+    def _matches(record, canonical, geo, timeframe):
+        if normalize_keyword(record.get('keyword', '')) != canonical:
+            return False
+        # 旧格式的记录没有 geo/timeframe 字段，视为匹配
+        if geo is not None and record.get('geo', geo) != geo:
+            return False
+        if timeframe is not None and record.get('timeframe', timeframe) != timeframe:
+            return False
+        return True
+
+    def records(self, date):
+        """Yield every raw record stored for one day, live or archived"""
+        directory = list_day_directories(self.data_dir_prefix).get(date)
+        # 补录可能向已归档的日期写入新文件，归档和当天目录都要读取
+        for value in self._archived_days().get(date, {}).values():
+            for location in keyword_locations(value):
+                record = read_archived_record(self.archive_dir, date, location, self.dict_dir)
+                if record:
+                    yield record
+        if directory:
+            yield from self._day_records(directory)
+
+    def find(self, keyword, date, geo=None, timeframe=None):
+        """Return the latest matching record of a keyword on one day, or None"""
+        canonical = normalize_keyword(keyword)
+        directory = list_day_directories(self.data_dir_prefix).get(date)
+        if directory:
+            found = None
+            for record in self._day_records(directory):
+                if self._matches(record, canonical, geo, timeframe):
+                    found = record
+            if found:
+                return found
+
+        found = None
+        for archived_keyword, value in self._archived_days().get(date, {}).items():
+            if normalize_keyword(archived_keyword) != canonical:
+                continue
+            # 位置按写入顺序排列，取最后一条匹配的记录
+            for location in keyword_locations(value):
+                if not location_matches(location, geo, timeframe):
+                    continue
+                record = read_archived_record(self.archive_dir, date, location, self.dict_dir)
+                if record and self._matches(record, canonical, geo, timeframe):
+                    found = record
+        return found
+
+    def latest(self, keyword, geo=None, timeframe=None):
+        for date in reversed(self.dates()):
+            record = self.find(keyword, date, geo, timeframe)
+            if record:
+                return date, record
+        return None, None
+
+    def history(self, keyword, geo=None, timeframe=None, start=None, end=None):
+        results = []
+        for date in self.dates():
+            if (start and date < start) or (end and date > end):
+                continue
+            record = self.find(keyword, date, geo, timeframe)
+            if record:
+                results.append({'date': date, 'record': record})
+        return results
+
+
+class ResponseCache:
+    """Thread-safe LRU of encoded responses keyed by request and store signature"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class _Response:
+    __slots__ = ('status', 'body', 'gzipped', 'etag')
+
+    def __init__(self, status, payload):
+        self.status = status
+        self.body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.gzipped = gzip.compress(self.body, compresslevel=6) if len(self.body) > 512 else None
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:20] + '"'
+
+
+class QueryService:
+    """Resolves API requests against the local store with response caching"""
+
+    def __init__(self, store, cache_size=256):
+        self.store = store
+        self.cache = ResponseCache(cache_size)
+
+    def handle(self, path, params):
+        def param(name):
+            values = params.get(name)
+            return values[0] if values else None
+
+        if path == '/health':
+            return _Response(200, {'status': 'ok'})
+
+        date = param('date')
+        if date is not None and not _DATE_PATTERN.match(date):
+            return _Response(400, {'error': 'date must be YYYYMMDD'})
+
+        store = self.store
+        tenant = param('tenant')
+        if tenant:
+            store = self.store.for_tenant(tenant)
+            if store is None:
+                return _Response(404, {'error': 'unknown tenant', 'tenant': tenant})
+
+        key = (path, tuple(sorted((k, tuple(v)) for k, v in params.items())), store.signature(date))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = self._resolve(store, path, param, date)
+        if response.status == 200:
+            self.cache.put(key, response)
+        return response
+
+    def _resolve(self, store, path, param, date):
+        if path == '/v1/dates':
+            return _Response(200, {'dates': store.dates()})
+
+        keyword = param('keyword')
+        if not keyword:
+            return _Response(400, {'error': 'keyword is required'})
+        geo = param('geo')
+        timeframe = param('timeframe')
+
+        if path == '/v1/related':
+            if date:
+                record = store.find(keyword, date, geo, timeframe)
+            else:
+                date, record = store.latest(keyword, geo, timeframe)
+            if not record:
+                return _Response(404, {'error': 'no data', 'keyword': keyword})
+            return _Response(200, {'date': date, 'record': record})
+
+        if path == '/v1/history':
+            results = store.history(keyword, geo, timeframe, param('start'), param('end'))
+            return _Response(200, {'keyword': keyword, 'results': results})
+
+        return _Response(404, {'error': 'unknown endpoint'})
+
+
+# 已压缩的文件原样发送
+_COMPRESSED_SUFFIXES = ('.gz', '.zip', '.rqz', '.rtab')
+
+
+def _make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.startswith(FILES_PATH):
+                self._send_file(unquote(url.path[len(FILES_PATH):]))
+                return
+            try:
+                response = service.handle(url.path, parse_qs(url.query))
+            except Exception as e:
+                logging.error(f"Query service error for {self.path}: {str(e)}")
+                response = _Response(500, {'error': 'internal error'})
+
+            if response.status == 200 and self.headers.get('If-None-Match') == response.etag:
+                self.send_response(304)
+                self.send_header('ETag', response.etag)
+                self.end_headers()
+                return
+
+            use_gzip = response.gzipped is not None and 'gzip' in self.headers.get('Accept-Encoding', '')
+            body = response.gzipped if use_gzip else response.body
+            self.send_response(response.status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Vary', 'Accept-Encoding')
+            if response.status == 200:
+                self.send_header('ETag', response.etag)
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_file(self, relative):
+            """Stream a report file (linked from notifications), gzip-compressed on the fly when accepted"""
+            path = service.store.file_path(relative)
+            if path is None:
+                body = json.dumps({'error': 'file not found'}).encode('utf-8')
+                self.send_response(404)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '') and not path.endswith(_COMPRESSED_SUFFIXES)
+            self.send_response(200)
+            self.send_header('Content-Type', mimetypes.guess_type(path)[0] or 'application/octet-stream')
+            self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(path)}"')
+            if use_gzip:
+                # 压缩后长度未知，不发送 Content-Length，发送完毕后关闭连接（HTTP/1.0）
+                self.send_header('Content-Encoding', 'gzip')
+            else:
+                self.send_header('Content-Length', str(os.path.getsize(path)))
+            self.end_headers()
+            with open(path, 'rb') as f:
+                if use_gzip:
+                    with gzip.GzipFile(mode='wb', fileobj=self.wfile, compresslevel=6) as out:
+                        shutil.copyfileobj(f, out, CHUNK_SIZE)
+                else:
+                    shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+        def log_message(self, format, *args):
+            logging.debug(f"Query service: {self.address_string()} {format % args}")
+
+    return Handler
+
+
+def create_server(host=None, port=None, store=None):
+    """Build the HTTP server; call serve_forever() on the result"""
+    store = store or LocalStore(
+        STORAGE_CONFIG['data_dir_prefix'],
+        COMPACTION_CONFIG['archive_dir'],
+        STORAGE_CONFIG.get('raw_dict_dir'),
+        STORAGE_CONFIG['json_filename_prefix'],
+        SERVICE_CONFIG.get('file_patterns', []),
+        SERVICE_CONFIG.get('signature_ttl', 5)
+    )
+    service = QueryService(store, SERVICE_CONFIG['cache_size'])
+    server = ThreadingHTTPServer((host or SERVICE_CONFIG['host'], port or SERVICE_CONFIG['port']),
+                                 _make_handler(service))
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(host=None, port=None):
+    """Start the query service on a daemon thread next to the scheduler"""
+    server = create_server(host, port)
+    thread = threading.Thread(target=server.serve_forever, name='query-service', daemon=True)
+    thread.start()
+    logging.info(f"Query service listening on {server.server_address[0]}:{server.server_address[1]}")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Trends query service')
+    parser.add_argument('--host', help='监听地址，默认使用配置文件中的值')
+    parser.add_argument('--port', type=int, help='监听端口，默认使用配置文件中的值')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = create_server(args.host, args.port)
+    logging.info(f"Query service listening on {server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
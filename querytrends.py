@@ -1,121 +1,204 @@
-from trendspy import Trends
 import pandas as pd
 import json
-import time
+import logging
+import os
 import random
-from datetime import datetime
+import threading
 import requests
 from urllib.parse import quote
 import re
+from keyword_index import normalize_keyword
+from clock import default_clock
+from singleflight import SingleFlight
+from config import COALESCING_CONFIG, TRENDS_CONFIG
+from trends_client import CachingTrends, TokenCache
+from trends_errors import (
+    TrendsError, QuotaExceededError, EmptyResponseError, TransientError, CircuitOpenError,
+    CircuitBreaker, classify_error
+)
 
-def get_related_queries(keyword, geo='', timeframe='today 12-m'):
+logger = logging.getLogger('querytrends')
+# 每个请求一条的高频日志，按 LOGGING_CONFIG['sample_rates'] 采样
+request_logger = logging.getLogger('querytrends.request')
+
+# 各类错误重试前的等待时间（秒）
+RETRY_WAITS = {
+    EmptyResponseError: (60, 120),
+    TransientError: (10, 30),
+}
+
+def get_related_queries(keyword, geo='', timeframe='today 12-m', limiter=None, breaker=None, max_retries=3):
     """
-    获取关键词的相关查询数据，带请求限制
+    获取关键词的相关查询数据
+
+    同一时刻对相同 (关键词, 地区, 时间范围) 的请求（跨线程，可选跨进程）只发出一次，
+    其余调用等待并共享结果，不占用请求配额。
     """
-    while True:  # 添加无限重试循环
-        tr = Trends(hl='zh-CN')
-        
-        # 随机化 User-Agent
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        ]
-        
-        headers = {
-            'referer': 'https://www.google.com/',
-            'User-Agent': random.choice(user_agents),
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
-        }
+    key = (normalize_keyword(keyword), geo, timeframe)
+    return single_flight.do(key, lambda: _fetch_related_queries(keyword, geo, timeframe, limiter, breaker, max_retries))
+
+async def get_related_queries_async(keyword, geo='', timeframe='today 12-m', limiter=None, breaker=None, max_retries=3):
+    """
+    get_related_queries 的 asyncio 版本，与线程中的相同请求共享同一次调用
+    """
+    key = (normalize_keyword(keyword), geo, timeframe)
+    return await single_flight.do_async(
+        key, lambda: _fetch_related_queries(keyword, geo, timeframe, limiter, breaker, max_retries))
+
+# 随机化 User-Agent
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+]
+
+def _random_headers():
+    return {
+        'referer': 'https://www.google.com/',
+        'User-Agent': random.choice(USER_AGENTS),
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
+    }
+
+def _request_with_retries(request, keyword, limiter=None, breaker=None, max_retries=3):
+    """
+    发起一次 Trends 请求，带请求限制、熔断和按错误类型的重试
+
+    失败时按错误类型处理：配额超限立即打开熔断器并抛出，由调用方统一等待；
+    空响应和临时错误最多重试 max_retries 次；永久错误直接抛出。
+
+    Args:
+        request (callable): request(tr, headers)，使用给定的客户端和请求头发起请求
+        keyword (str): 日志中标识本次请求的关键词
+
+    Raises:
+        TrendsError: 分类后的错误（QuotaExceededError, CircuitOpenError, ...）
+    """
+    limiter = limiter or request_limiter
+    breaker = breaker or circuit_breaker
+    # 各次重试复用同一个客户端（会话和 cookie），widget token 由共享缓存复用
+    # 请求限制作用于客户端发出的每个 HTTP 请求（token 页面和数据请求分别计数）
+    tr = CachingTrends(token_cache=token_cache, cassette=cassette, limiter=limiter, hl='zh-CN')
+    for attempt in range(1, max_retries + 1):
+        # 熔断器打开时不发请求，直接失败
+        breaker.before_request()
+
+        headers = _random_headers()
         
         try:
-            # 检查请求限制
-            request_limiter.wait_if_needed()
-            
             # 添加随机延时
             delay = random.uniform(1, 3)
-            time.sleep(delay)
-            
-            related_data = tr.related_queries(
-                keyword,
-                headers=headers,
-                geo=geo,
-                timeframe=timeframe
-            )
-            print(f"成功获取数据！")
-            return related_data
+            limiter.sleep(delay)
             
+            data = request(tr, headers)
         except Exception as e:
-            error_msg = str(e)
-            print(f"尝试获取数据时出错: {error_msg}")
-            
-            # 如果是配额超限错误，等待后重试
-            if "API quota exceeded" in error_msg:
-                wait_time = random.uniform(300, 360)  # 等待5-6分钟
-                print(f"API配额超限，等待 {wait_time:.1f} 秒后重试...")
-                time.sleep(wait_time)
-                continue  # 继续下一次重试
-            
-            # 如果是NoneType错误，也等待后重试
-            if "'NoneType' object has no attribute 'raise_for_status'" in error_msg:
-                wait_time = random.uniform(60, 120)  # 等待1-2分钟
-                print(f"请求返回为空，等待 {wait_time:.1f} 秒后重试...")
-                time.sleep(wait_time)
-                continue  # 继续下一次重试
-                
-            # 其他错误则直接抛出
-            raise
+            error = classify_error(e)
+            breaker.record_failure(error)
+            logger.warning(f"尝试获取数据时出错 ({attempt}/{max_retries}): {error}",
+                           extra={'keyword': keyword, 'error_type': type(error).__name__})
+            if not error.retryable or isinstance(error, QuotaExceededError) or attempt == max_retries:
+                raise error
+            wait_time = random.uniform(*RETRY_WAITS.get(type(error), (10, 30))) * attempt
+            logger.info(f"{wait_time:.1f} 秒后重试...", extra={'keyword': keyword})
+            limiter.sleep(wait_time)
+            continue
+
+        breaker.record_success()
+        request_logger.info("成功获取数据！", extra={'keyword': keyword})
+        return data
+
+def _fetch_related_queries(keyword, geo='', timeframe='today 12-m', limiter=None, breaker=None, max_retries=3):
+    """
+    获取关键词的相关查询数据，带请求限制
+    """
+    return _request_with_retries(
+        lambda tr, headers: tr.related_queries(keyword, headers=headers, geo=geo, timeframe=timeframe),
+        keyword, limiter, breaker, max_retries
+    )
 
-def batch_get_queries(keywords, geo='', timeframe='today 12-m', delay_between_queries=5):
+def get_interest_over_time(keywords, geo='', timeframe='today 12-m', limiter=None, breaker=None, max_retries=3):
+    """
+    在一次请求中获取最多 5 个关键词的热度趋势
+
+    Returns:
+        pandas.DataFrame: 以时间为索引，每个关键词一列（0-100，组内相对值），可能带 isPartial 列
+    """
+    return _request_with_retries(
+        lambda tr, headers: tr.interest_over_time(list(keywords), headers=headers, geo=geo, timeframe=timeframe),
+        ', '.join(keywords), limiter, breaker, max_retries
+    )
+
+def batch_get_queries(keywords, geo='', timeframe='today 12-m', delay_between_queries=5, limiter=None,
+                      breaker=None, errors=None):
     """
     批量获取多个关键词的数据，带间隔控制
+
+    熔断器打开后，本批剩余的关键词不再请求，直接记为失败。
+
+    Args:
+        errors (dict): 传入时记录每个失败关键词的 TrendsError，供调用方决定是否稍后重试
     """
     results = {}
     
-    for keyword in keywords:
+    for index, keyword in enumerate(keywords):
         try:
-            print(f"\n正在查询关键词: {keyword}")
-            results[keyword] = get_related_queries(keyword, geo, timeframe)
+            request_logger.info(f"正在查询关键词: {keyword}", extra={'keyword': keyword})
+            results[keyword] = get_related_queries(keyword, geo, timeframe, limiter, breaker)
             
             # 在请求之间添加延时
-            if keyword != keywords[-1]:  # 如果不是最后一个关键词
+            if index < len(keywords) - 1:  # 如果不是最后一个关键词
                 delay = delay_between_queries + random.uniform(0, 2)  # 基础延时加0-2秒的随机延时
-                print(f"等待 {delay:.1f} 秒后继续下一个查询...")
-                time.sleep(delay)
+                request_logger.debug(f"等待 {delay:.1f} 秒后继续下一个查询...")
+                (limiter or request_limiter).sleep(delay)
                 
-        except Exception as e:
-            print(f"获取 {keyword} 的数据失败: {str(e)}")
+        except TrendsError as e:
+            logger.error(f"获取 {keyword} 的数据失败: {str(e)}", extra={'keyword': keyword})
             results[keyword] = None
-            
-            # 如果遇到错误，增加额外等待时间
-            time.sleep(10)
+            if errors is not None:
+                errors[keyword] = e
+
+            if isinstance(e, (QuotaExceededError, CircuitOpenError)):
+                for skipped in keywords[index + 1:]:
+                    results[skipped] = None
+                    if errors is not None:
+                        errors[skipped] = CircuitOpenError((breaker or circuit_breaker).retry_after())
+                break
     
     return results
 
-def save_related_queries(keyword, related_data):
+def build_related_record(keyword, related_data, geo='', timeframe=''):
     """
-    保存相关查询数据到JSON文件
+    将相关查询数据转换为可序列化的记录
     """
-    if not related_data:
-        return
-    
-    timestamp = time.strftime('%Y%m%d_%H%M%S')
-    json_data = {
+    return {
         'keyword': keyword,
-        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'timestamp': default_clock.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'geo': geo,
+        'timeframe': timeframe,
         'related_queries': {
             'top': related_data['top'].to_dict(orient='records') if isinstance(related_data.get('top'), pd.DataFrame) else related_data.get('top'),
             'rising': related_data['rising'].to_dict(orient='records') if isinstance(related_data.get('rising'), pd.DataFrame) else related_data.get('rising')
         }
     }
+
+def save_related_queries(keyword, related_data, directory=None):
+    """
+    保存相关查询数据到JSON文件
+    """
+    if not related_data:
+        return
+    
+    timestamp = default_clock.now().strftime('%Y%m%d_%H%M%S')
+    json_data = build_related_record(keyword, related_data)
     
     # 保存为JSON文件
     filename = f"related_queries_{keyword}_{timestamp}.json"
+    if directory:
+        filename = os.path.join(directory, filename)
     with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(json_data, f, ensure_ascii=False, indent=2)
+        json.dump(json_data, f, ensure_ascii=False, separators=(',', ':'))
     
     return filename
 
@@ -158,6 +241,7 @@ def print_related_queries(related_data):
 # now 90-d：90天
 # 日期格式：2024-12-28 2024-12-30
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     # 设置要查询的关键词列表
     keywords = ['game']  # 可以添加多个关键词
     geo = ''
@@ -177,7 +261,7 @@ def main():
         )
 
         # 处理和保存结果
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        timestamp = default_clock.now().strftime('%Y%m%d_%H%M%S')
         for keyword, data in results.items():
             if data:
                 print(f"\n处理 {keyword} 的数据:")
@@ -191,44 +275,101 @@ def main():
         print(f"批量查询过程中出错: {str(e)}")
 
 class RequestLimiter:
-    def __init__(self):
+    """Sliding-window limiter shared by all threads making Trends requests
+
+    Checking the limits and recording a request happen under one lock
+    (try_acquire), so concurrent callers cannot both take the last slot.
+    """
+
+    def __init__(self, max_requests_per_min=30, max_requests_per_hour=200, clock=default_clock.time, sleep=default_clock.sleep):
         self.requests = []  # 存储请求时间戳
-        self.max_requests_per_min = 30  # 每分钟最大请求数
-        self.max_requests_per_hour = 200  # 每小时最大请求数
+        self.max_requests_per_min = max_requests_per_min  # 每分钟最大请求数
+        self.max_requests_per_hour = max_requests_per_hour  # 每小时最大请求数
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.RLock()
         
     def can_make_request(self):
         """检查是否可以发起新请求"""
-        current_time = time.time()
-        
-        # 清理超过1小时的旧请求记录
-        self.requests = [t for t in self.requests if current_time - t < 3600]
-        
-        # 获取最近1分钟的请求数
-        recent_min_requests = len([t for t in self.requests if current_time - t < 60])
-        
-        # 获取最近1小时的请求数
-        recent_hour_requests = len(self.requests)
-        
-        if (recent_min_requests >= self.max_requests_per_min or 
-            recent_hour_requests >= self.max_requests_per_hour):
-            return False
-        
-        return True
+        with self._lock:
+            current_time = self.clock()
+            
+            # 清理超过1小时的旧请求记录
+            self.requests = [t for t in self.requests if current_time - t < 3600]
+            
+            # 获取最近1分钟的请求数
+            recent_min_requests = len([t for t in self.requests if current_time - t < 60])
+            
+            # 获取最近1小时的请求数
+            recent_hour_requests = len(self.requests)
+            
+            if (recent_min_requests >= self.max_requests_per_min or 
+                recent_hour_requests >= self.max_requests_per_hour):
+                return False
+            
+            return True
     
     def add_request(self):
         """记录新的请求"""
-        self.requests.append(time.time())
+        with self._lock:
+            self.requests.append(self.clock())
+
+    def try_acquire(self):
+        """检查限制并记录请求（原子操作），可以发起请求时返回 True"""
+        with self._lock:
+            if not self.can_make_request():
+                return False
+            self.add_request()
+            return True
     
     def wait_if_needed(self):
         """如果需要，等待直到可以发送请求"""
-        while not self.can_make_request():
+        while not self.try_acquire():
             wait_time = random.uniform(5, 10)
-            print(f"达到请求限制，等待 {wait_time:.1f} 秒...")
-            time.sleep(wait_time)
-        self.add_request()
+            logger.info(f"达到请求限制，等待 {wait_time:.1f} 秒...")
+            self.sleep(wait_time)
 
 # 创建全局请求限制器
 request_limiter = RequestLimiter()
 
+# 创建全局熔断器，所有线程共享
+circuit_breaker = CircuitBreaker()
+
+# 录制或回放请求时使用的 Cassette，None 表示直接请求
+cassette = None
+
+def use_cassette(new_cassette):
+    """Record to or replay from a Cassette for all following requests (None to stop)"""
+    global cassette
+    cassette = new_cassette
+
+# widget token 缓存，所有请求共享
+token_cache = TokenCache(TRENDS_CONFIG.get('token_ttl', 300))
+
+def _related_to_json(related_data):
+    """相关查询结果（DataFrame）转换为可写入 JSON 的形式，供其他进程复用"""
+    if related_data is None:
+        return None
+    return {
+        trend_type: df.to_dict(orient='split') if isinstance(df, pd.DataFrame) else None
+        for trend_type, df in related_data.items()
+    }
+
+def _related_from_json(data):
+    if data is None:
+        return None
+    return {
+        trend_type: pd.DataFrame(**frame) if frame is not None else None
+        for trend_type, frame in data.items()
+    }
+
+# 合并进行中的相同请求；配置了锁目录时同一台机器上的多个进程也会合并
+single_flight = SingleFlight(
+    COALESCING_CONFIG['lock_dir'] if COALESCING_CONFIG.get('cross_process') else None,
+    encode=_related_to_json,
+    decode=_related_from_json,
+    result_ttl=COALESCING_CONFIG.get('result_ttl', 600)
+)
+
 if __name__ == "__main__":
     main()
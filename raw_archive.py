@@ -0,0 +1,348 @@
+import argparse
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from clock import default_clock
+from result_writer import BatchResultWriter, iter_result_records
+
+try:
+    import zstandard
+except ImportError:  # zstd 为可选依赖，未安装时使用 zlib
+    zstandard = None
+
+# 文件格式：魔数(4) + 编码(1) + 字典ID(4)，之后每条记录为 长度(4) + 压缩后的JSON
+MAGIC = b'RQZ1'
+CODECS = {'zlib': 0, 'zstd': 1}
+_CODEC_NAMES = {code: name for name, code in CODECS.items()}
+_HEADER = struct.Struct('<4sBI')
+_LENGTH = struct.Struct('<I')
+ARCHIVE_SUFFIX = '.rqz'
+_ZLIB_DICT_SIZE = 32 * 1024
+
+
+def dictionary_id(dictionary):
+    """Stable non-zero ID of a dictionary, stored in the archive header"""
+    return (zlib.crc32(dictionary) or 1) if dictionary else 0
+
+
+def dictionary_path(dict_dir, dict_id):
+    return os.path.join(dict_dir, f"raw_{dict_id:08x}.dict")
+
+
+def load_dictionary(dict_dir, dict_id):
+    if not dict_id:
+        return None
+    with open(dictionary_path(dict_dir, dict_id), 'rb') as f:
+        return f.read()
+
+
+def train_dictionary(samples, codec='zlib', size=_ZLIB_DICT_SIZE):
+    """Build a shared compression dictionary from past records
+
+    zstd uses its trainer; zlib uses the tail of the concatenated samples
+    as a preset dictionary, which is where deflate looks for matches.
+    """
+    encoded = [json.dumps(sample, ensure_ascii=False).encode('utf-8') for sample in samples]
+    if not encoded:
+        return None
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        return zstandard.train_dictionary(size, encoded).as_bytes()
+    return b''.join(encoded)[-size:]
+
+
+def save_dictionary(dictionary, dict_dir):
+    """Store a dictionary under its ID and return the ID"""
+    os.makedirs(dict_dir, exist_ok=True)
+    dict_id = dictionary_id(dictionary)
+    path = dictionary_path(dict_dir, dict_id)
+    if not os.path.exists(path):
+        with open(path + '.tmp', 'wb') as f:
+            f.write(dictionary)
+        os.replace(path + '.tmp', path)
+    return dict_id
+
+
+class _Codec:
+    def __init__(self, codec, dictionary=None, level=None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        if codec == 'zstd' and zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        self.name = codec
+        self.dictionary = dictionary
+        if codec == 'zstd':
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            self._compressor = zstandard.ZstdCompressor(level=level or 10, dict_data=dict_data)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        self.level = level or 9
+
+    def compress(self, data):
+        if self.name == 'zstd':
+            return self._compressor.compress(data)
+        compressor = zlib.compressobj(self.level, zdict=self.dictionary) if self.dictionary \
+            else zlib.compressobj(self.level)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, payload):
+        if self.name == 'zstd':
+            return self._decompressor.decompress(payload)
+        decompressor = zlib.decompressobj(zdict=self.dictionary) if self.dictionary else zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
+
+
+def _read_header(f):
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError("Truncated archive header")
+    magic, codec, dict_id = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("Not a raw response archive")
+    return _CODEC_NAMES[codec], dict_id
+
+
+def _scan(f):
+    """Yield (offset, payload) of every complete record after the header"""
+    while True:
+        offset = f.tell()
+        prefix = f.read(_LENGTH.size)
+        if len(prefix) < _LENGTH.size:
+            return
+        length = _LENGTH.unpack(prefix)[0]
+        payload = f.read(length)
+        if len(payload) < length:
+            return
+        yield offset, payload
+
+
+class RawArchiveWriter(BatchResultWriter):
+    """Batch writer producing a compressed, length-prefixed record stream
+
+    Keeps the batching, per-batch fsync and atomic rename of
+    BatchResultWriter; every record is compressed on its own (optionally
+    with a shared dictionary), so the stream can be read record by record.
+    """
+
+    def __init__(self, directory, filename, codec='zlib', dictionary=None, dict_dir=None, buffer_size=64 * 1024):
+        self._codec = _Codec(codec, dictionary)
+        self._dict_id = save_dictionary(dictionary, dict_dir or directory) if dictionary else 0
+        super().__init__(directory, filename, buffer_size)
+
+    def _header(self):
+        return _HEADER.pack(MAGIC, CODECS[self._codec.name], self._dict_id)
+
+    def _encode(self, record):
+        payload = self._codec.compress(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return _LENGTH.pack(len(payload)) + payload
+
+    def _aside_path(self, path):
+        """Unused name for a file moved aside; earlier ones are never overwritten"""
+        stamp = default_clock.now().strftime('%Y%m%d%H%M%S%f')
+        aside = f"{path}.{stamp}.old"
+        attempt = 1
+        while os.path.exists(aside):
+            aside = f"{path}.{stamp}-{attempt}.old"
+            attempt += 1
+        return aside
+
+    def _settings_match(self, path):
+        with open(path, 'rb') as f:
+            try:
+                return _read_header(f) == (self._codec.name, self._dict_id)
+            except ValueError:
+                return False
+
+    def _recover(self):
+        """Truncate a torn trailing record; restart files written with other settings"""
+        # 已完成的文件编码或字典不同时无法合并，另存后由本次运行重新生成
+        if os.path.exists(self.path) and not self._settings_match(self.path):
+            aside = self._aside_path(self.path)
+            os.replace(self.path, aside)
+            logging.warning(f"Archive settings changed, moved {self.path} aside to {aside}")
+        if not os.path.exists(self.part_path) or not os.path.getsize(self.part_path):
+            return
+        with open(self.part_path, 'rb+') as f:
+            try:
+                codec, dict_id = _read_header(f)
+            except ValueError:
+                codec, dict_id = None, None
+            if (codec, dict_id) != (self._codec.name, self._dict_id):
+                # 编码或字典与本次不同时，另存旧文件后重新开始
+                f.close()
+                aside = self._aside_path(self.part_path)
+                os.replace(self.part_path, aside)
+                logging.warning(f"Archive settings changed, moved {self.part_path} aside to {aside}")
+                return
+            end = f.tell()
+            for offset, payload in _scan(f):
+                end = offset + _LENGTH.size + len(payload)
+            size = f.seek(0, os.SEEK_END)
+            if end != size:
+                logging.warning(f"Truncating {size - end} bytes of incomplete data from {self.part_path}")
+                f.truncate(end)
+
+
+def finalize_parts(directory, dict_dir=None, min_age=0):
+    """Recover .part files left in a directory by crashed runs and move them to their final names
+
+    Parts changed within min_age seconds may still be written and are left
+    alone. Returns the number of finalized files.
+    """
+    finalized = 0
+    if not os.path.isdir(directory):
+        return finalized
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.part'):
+            continue
+        path = os.path.join(directory, name)
+        filename = name[:-len('.part')]
+        try:
+            if os.path.getmtime(path) > time.time() - min_age:
+                continue
+            if filename.endswith(ARCHIVE_SUFFIX):
+                # 沿用 part 文件自身的编码和字典，才能接着合并
+                with open(path, 'rb') as f:
+                    codec, dict_id = _read_header(f)
+                dict_dir = dict_dir or directory
+                writer = RawArchiveWriter(directory, filename, codec, load_dictionary(dict_dir, dict_id), dict_dir)
+            else:
+                writer = BatchResultWriter(directory, filename)
+            writer.close()
+            finalized += 1
+            logging.info(f"Finalized {path} left by an interrupted run")
+        except (OSError, ValueError, RuntimeError) as e:
+            logging.warning(f"Failed to finalize {path}: {str(e)}")
+    return finalized
+
+
+def iter_archive(path, dict_dir=None, with_offsets=False):
+    """Stream records from a raw archive without loading the file into memory
+
+    Args:
+        path (str): Archive file
+        dict_dir (str): Directory holding shared dictionaries, defaults to the archive's directory
+        with_offsets (bool): Also yield the byte offset and length of each record
+
+    Yields:
+        dict, or (offset, length, dict) with with_offsets
+    """
+    with open(path, 'rb') as f:
+        yield from iter_archive_stream(f, dict_dir or os.path.dirname(path), with_offsets)
+
+
+def iter_archive_stream(f, dict_dir, with_offsets=False):
+    """Same as iter_archive over an already opened binary stream"""
+    codec_name, dict_id = _read_header(f)
+    codec = _Codec(codec_name, load_dictionary(dict_dir, dict_id))
+    for offset, payload in _scan(f):
+        record = json.loads(codec.decompress(payload))
+        if with_offsets:
+            yield offset, _LENGTH.size + len(payload), record
+        else:
+            yield record
+
+
+def read_record_at(f, offset, length, dict_dir):
+    """Read a single record at a known offset of an archive stream"""
+    f.seek(0)
+    codec_name, dict_id = _read_header(f)
+    codec = _Codec(codec_name, load_dictionary(dict_dir, dict_id))
+    f.seek(offset)
+    data = f.read(length)
+    return json.loads(codec.decompress(data[_LENGTH.size:]))
+
+
+def iter_raw_records(path, dict_dir=None, name=None):
+    """Yield records from any raw result file: archive, JSON Lines or legacy JSON
+
+    The format follows name (defaults to path), for files whose own name
+    does not end in the format's suffix.
+    """
+    name = name or path
+    if name.endswith(ARCHIVE_SUFFIX):
+        yield from iter_archive(path, dict_dir)
+    elif name.endswith('.jsonl'):
+        yield from iter_result_records(path)
+    elif name.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield json.load(f)
+
+
+def import_files(paths, output, codec='zlib', dictionary=None, dict_dir=None, batch_size=100):
+    """Import existing JSON / JSON Lines result files into a raw archive
+
+    Returns:
+        int: Number of records imported
+    """
+    directory, filename = os.path.split(os.path.abspath(output))
+    imported = 0
+    with RawArchiveWriter(directory, filename, codec, dictionary, dict_dir) as writer:
+        batch = []
+        for path in paths:
+            try:
+                for record in iter_raw_records(path, dict_dir):
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        imported += writer.write_batch(batch)
+                        batch = []
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping {path}: {str(e)}")
+        imported += writer.write_batch(batch)
+    return imported
+
+
+def _collect_samples(paths, limit):
+    samples = []
+    for path in paths:
+        for record in iter_raw_records(path):
+            samples.append(record)
+            if len(samples) >= limit:
+                return samples
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Raw response archive tool')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='导入已有的 JSON/JSONL 文件到压缩归档')
+    import_parser.add_argument('output', help='输出的归档文件（.rqz）')
+    import_parser.add_argument('files', nargs='+', help='要导入的 JSON/JSONL 文件')
+    import_parser.add_argument('--codec', choices=list(CODECS), default='zlib')
+    import_parser.add_argument('--train', type=int, default=0,
+                               help='用前 N 条记录训练共享字典，0 表示不使用字典')
+
+    train_parser = subparsers.add_parser('train', help='用已有记录训练共享压缩字典')
+    train_parser.add_argument('output', help='输出的字典文件')
+    train_parser.add_argument('files', nargs='+', help='用作样本的 JSON/JSONL/归档文件')
+    train_parser.add_argument('--codec', choices=list(CODECS), default='zlib')
+    train_parser.add_argument('--samples', type=int, default=1000, help='最多使用的样本记录数')
+
+    cat_parser = subparsers.add_parser('cat', help='以 JSON Lines 格式输出归档中的记录')
+    cat_parser.add_argument('archive')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == 'import':
+        dictionary = train_dictionary(_collect_samples(args.files, args.train), args.codec) if args.train else None
+        count = import_files(args.files, args.output, args.codec, dictionary)
+        logging.info(f"Imported {count} records into {args.output}")
+    elif args.command == 'train':
+        dictionary = train_dictionary(_collect_samples(args.files, args.samples), args.codec)
+        if not dictionary:
+            logging.error("No samples found, dictionary not written")
+            return
+        with open(args.output, 'wb') as f:
+            f.write(dictionary)
+        logging.info(f"Wrote {len(dictionary)} byte dictionary to {args.output}")
+    elif args.command == 'cat':
+        for record in iter_archive(args.archive):
+            print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+import pandas as pd
+
+TREND_TYPES = ('rising', 'top')
+_TYPE_CODES = {name: code for code, name in enumerate(TREND_TYPES)}
+
+# 列式文件格式：魔数 + 头部长度 + JSON头部 + 字符串表 + 对齐填充 + 各列原始数组
+TABLE_SUFFIX = '.rtab'
+_MAGIC = b'RTAB0001'
+_SEPARATOR = '\x00'
+
+
+class StringTable:
+    """Append-only interned string table mapping strings to dense integer IDs"""
+
+    def __init__(self):
+        self._ids = {}
+        self._strings = []
+
+    @classmethod
+    def from_blob(cls, blob, count=None):
+        """Rebuild a table from to_blob() output holding count strings
+
+        Without count (files written before it was stored) an empty blob is
+        read as no strings, so a table of one empty string cannot be told apart.
+        """
+        table = cls()
+        if count is None:
+            count = blob.count(_SEPARATOR.encode('utf-8')) + 1 if blob else 0
+        if count:
+            texts = blob.decode('utf-8').split(_SEPARATOR)
+            if len(texts) != count:
+                raise ValueError(f"String table holds {len(texts)} strings, expected {count}")
+            for text in texts:
+                table.intern(text)
+        return table
+
+    def to_blob(self):
+        return _SEPARATOR.join(self._strings).encode('utf-8')
+
+    def intern(self, text):
+        string_id = self._ids.get(text)
+        if string_id is None:
+            string_id = len(self._strings)
+            text = sys.intern(text)
+            self._ids[text] = string_id
+            self._strings.append(text)
+        return string_id
+
+    def lookup(self, text):
+        return self._ids.get(text)
+
+    def __getitem__(self, string_id):
+        return self._strings[string_id]
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __iter__(self):
+        return iter(self._strings)
+
+
+class ResultRow:
+    """Lightweight read-only view of one related-query row"""
+    __slots__ = ('keyword', 'query', 'value', 'type')
+
+    def __init__(self, keyword, query, value, trend_type):
+        self.keyword = keyword
+        self.query = query
+        self.value = value
+        self.type = trend_type
+
+    def __repr__(self):
+        return f"ResultRow({self.keyword!r}, {self.query!r}, {self.value!r}, {self.type!r})"
+
+
+class ResultTable:
+    """Columnar container for related-query results of one run
+
+    Query and keyword strings are interned once; each row is stored as a
+    keyword ID, query ID, type code and value in typed arrays, which is
+    far smaller than keeping a pair of DataFrames per keyword.
+    """
+
+    def __init__(self):
+        self.keywords = StringTable()
+        self.queries = StringTable()
+        self.keyword_ids = array('I')
+        self.query_ids = array('I')
+        self.types = array('B')
+        self.values = array('d')
+        self._mmap = None
+        self._view = None
+
+    def save(self, path):
+        """Write the table to a columnar file that load() can memory-map"""
+        keyword_blob = self.keywords.to_blob()
+        query_blob = self.queries.to_blob()
+        header = json.dumps({
+            'rows': len(self),
+            'keywords_bytes': len(keyword_blob),
+            'queries_bytes': len(query_blob),
+            'keywords_count': len(self.keywords),
+            'queries_count': len(self.queries)
+        }).encode('utf-8')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(keyword_blob)
+            f.write(query_blob)
+            f.write(b'\x00' * (-f.tell() % 8))
+            for column in (self.values, self.keyword_ids, self.query_ids, self.types):
+                f.write(column.tobytes())
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Open a columnar file; numeric columns are zero-copy views over an mmap
+
+        Call close() (or use the table as a context manager) to unmap the
+        file once the table, and arrays viewing its columns, are no longer used.
+        """
+        table = cls()
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        if bytes(view[:8]) != _MAGIC:
+            raise ValueError(f"Not a result table file: {path}")
+        header_length = struct.unpack('<I', view[8:12])[0]
+        offset = 12 + header_length
+        header = json.loads(bytes(view[12:offset]))
+        rows = header['rows']
+
+        table.keywords = StringTable.from_blob(bytes(view[offset:offset + header['keywords_bytes']]),
+                                               header.get('keywords_count'))
+        offset += header['keywords_bytes']
+        table.queries = StringTable.from_blob(bytes(view[offset:offset + header['queries_bytes']]),
+                                              header.get('queries_count'))
+        offset += header['queries_bytes']
+        offset += -offset % 8
+
+        columns = []
+        for typecode in ('d', 'I', 'I', 'B'):
+            size = rows * array(typecode).itemsize
+            columns.append(view[offset:offset + size].cast(typecode))
+            offset += size
+        table.values, table.keyword_ids, table.query_ids, table.types = columns
+        table._mmap = mapped
+        table._view = view
+        return table
+
+    def close(self):
+        """Release the memory map of a loaded table; the table is empty afterwards"""
+        if self._mmap is None:
+            return
+        for column in (self.values, self.keyword_ids, self.query_ids, self.types, self._view):
+            column.release()
+        self.keyword_ids = array('I')
+        self.query_ids = array('I')
+        self.types = array('B')
+        self.values = array('d')
+        self._mmap.close()
+        self._mmap = None
+        self._view = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, keyword, related_data):
+        """Append the rising/top DataFrames returned by related_queries for keyword"""
+        if not related_data:
+            return
+        keyword_id = self.keywords.intern(keyword)
+        for trend_type in TREND_TYPES:
+            df = related_data.get(trend_type)
+            if not isinstance(df, pd.DataFrame) or df.empty:
+                continue
+            type_code = _TYPE_CODES[trend_type]
+            for query, value in zip(df['query'], df['value']):
+                self.append(keyword_id, str(query), value, type_code)
+
+    def append(self, keyword_id, query, value, type_code):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = math.nan
+        self.keyword_ids.append(keyword_id)
+        self.query_ids.append(self.queries.intern(query))
+        self.types.append(type_code)
+        self.values.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, keyword):
+        return self.keywords.lookup(keyword) is not None
+
+    def row(self, index):
+        return ResultRow(
+            self.keywords[self.keyword_ids[index]],
+            self.queries[self.query_ids[index]],
+            self.values[index],
+            TREND_TYPES[self.types[index]]
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.row(index)
+
+    def rows(self, trend_type=None, keyword=None):
+        """Iterate rows, optionally filtered by type and keyword"""
+        type_code = _TYPE_CODES[trend_type] if trend_type else None
+        keyword_id = self.keywords.lookup(keyword) if keyword is not None else None
+        if keyword is not None and keyword_id is None:
+            return
+        for index in range(len(self)):
+            if type_code is not None and self.types[index] != type_code:
+                continue
+            if keyword_id is not None and self.keyword_ids[index] != keyword_id:
+                continue
+            yield self.row(index)
+
+    def grouped(self):
+        """Group rows by keyword and type in a single pass
+
+        Returns:
+            dict: keyword -> {'rising': [(query, value)], 'top': [(query, value)]},
+            in first-seen keyword order
+        """
+        groups = {}
+        for index in range(len(self)):
+            keyword = self.keywords[self.keyword_ids[index]]
+            by_type = groups.get(keyword)
+            if by_type is None:
+                by_type = groups[keyword] = {name: [] for name in TREND_TYPES}
+            by_type[TREND_TYPES[self.types[index]]].append(
+                (self.queries[self.query_ids[index]], _display_value(self.values[index]))
+            )
+        return groups
+
+    def rising_above(self, threshold):
+        """Return (keyword, query, value) for rising rows whose value exceeds threshold"""
+        rising = _TYPE_CODES['rising']
+        return [
+            (self.keywords[self.keyword_ids[i]], self.queries[self.query_ids[i]], _display_value(self.values[i]))
+            for i in range(len(self))
+            if self.types[i] == rising and self.values[i] > threshold
+        ]
+
+    def to_dataframe(self):
+        """Materialize the table in the daily report layout"""
+        keywords = list(self.keywords)
+        queries = list(self.queries)
+        values = pd.Series(self.values, dtype='float64')
+        if values.notna().all() and (values % 1 == 0).all():
+            values = values.astype('int64')
+        return pd.DataFrame({
+            'keyword': [keywords[i] for i in self.keyword_ids],
+            'related_keywords': [queries[i] for i in self.query_ids],
+            'value': values,
+            'type': [TREND_TYPES[code] for code in self.types]
+        })
+
+
+def _display_value(value):
+    return int(value) if value.is_integer() else value
+
+
+def table_path(report_file):
+    """Path of the columnar companion file of a CSV report"""
+    return os.path.splitext(report_file)[0] + TABLE_SUFFIX
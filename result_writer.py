@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import shutil
+
+
+class BatchResultWriter:
+    """Append result records to one JSON Lines file per run, a batch at a time
+
+    Records go through a buffered stream into ``<file>.part`` in the
+    destination directory. Each batch is flushed and fsynced once, and
+    close() atomically renames the part file to its final name, or merges
+    it into the final file left by an earlier run of the same day, which
+    stays readable meanwhile. After a crash the part file is resumed from
+    its last complete line, so no torn records are ever left behind.
+    """
+
+    def __init__(self, directory, filename, buffer_size=64 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, filename)
+        self.part_path = self.path + '.part'
+
+        # 同一天再次运行时写入新的 part 文件，关闭时合并到已有文件
+        self._recover()
+        self._file = open(self.part_path, 'ab', buffering=buffer_size)
+        if self._file.tell() == 0:
+            self._file.write(self._header())
+        self.records_written = 0
+
+    def _header(self):
+        """Bytes written at the start of a new file"""
+        return b''
+
+    def _encode(self, record):
+        return json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    def _recover(self):
+        """Drop a trailing incomplete record left by an interrupted write"""
+        if not os.path.exists(self.part_path):
+            return
+        with open(self.part_path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(0, end - 4096)
+                f.seek(start)
+                chunk = f.read(end - start)
+                newline = chunk.rfind(b'\n')
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end != size:
+                logging.warning(f"Truncating {size - end} bytes of incomplete data from {self.part_path}")
+                f.truncate(end)
+
+    def write_batch(self, records):
+        """Append records and make them durable with a single fsync"""
+        if not records:
+            return 0
+        for record in records:
+            self._file.write(self._encode(record))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.records_written += len(records)
+        return len(records)
+
+    def close(self):
+        """Finish the file and atomically move it to its final name"""
+        if self._file.closed:
+            return self.path
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if os.path.exists(self.path):
+            self._merge()
+        else:
+            os.replace(self.part_path, self.path)
+        try:
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return self.path
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+        return self.path
+
+    def _merge(self):
+        """Append the part file's records to the existing final file, atomically"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as target:
+            with open(self.path, 'rb') as source:
+                shutil.copyfileobj(source, target)
+            with open(self.part_path, 'rb') as source:
+                source.seek(len(self._header()))
+                shutil.copyfileobj(source, target)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(tmp_path, self.path)
+        # 在这里崩溃时 part 文件中的记录会在下次合并时重复一次，不会丢失
+        os.remove(self.part_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_result_records(path):
+    """Yield records from a JSON Lines result file, skipping a torn last line"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            yield json.loads(line)
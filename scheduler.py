@@ -0,0 +1,212 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from clock import default_clock
+
+
+def daily_at(hour, minute=0, random_delay_minutes=0, rng=random):
+    """Build a trigger that fires once a day at hour:minute plus a random delay
+
+    Args:
+        hour (int): Hour of day (0-23)
+        minute (int): Minute of hour (0-59)
+        random_delay_minutes (int): Maximum random delay added to each run
+        rng: Random source, injectable for tests
+
+    Returns:
+        callable: Maps a timestamp to the next fire timestamp strictly after it
+    """
+    def trigger(after):
+        # 先找 after 之后的下一个名义执行时间，再叠加随机延迟；
+        # 延迟用 timedelta 相加，跨小时/跨天不会算错，也不会在同一天重复执行
+        start = datetime.fromtimestamp(after)
+        nominal = start.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if nominal <= start:
+            nominal += timedelta(days=1)
+        delay = rng.randint(0, random_delay_minutes) if random_delay_minutes > 0 else 0
+        return (nominal + timedelta(minutes=delay)).timestamp()
+
+    return trigger
+
+
+def every(seconds):
+    """Build a trigger that fires at a fixed interval"""
+    def trigger(after):
+        return after + seconds
+
+    return trigger
+
+
+class Job:
+    def __init__(self, name, func, trigger, catch_up=True):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.catch_up = catch_up
+        self.next_run = None
+        self.last_run = None
+
+
+class EventScheduler:
+    """Heap-based scheduler that sleeps exactly until the next job deadline
+
+    Each job's last run time is persisted to ``state_file`` so that runs
+    missed while the process was down are executed once on startup.
+    ``clock`` and ``sleep`` can be replaced with a fake clock in tests.
+    """
+
+    def __init__(self, clock=default_clock.time, sleep=default_clock.sleep, state_file=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.state_file = state_file
+        self._jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._state = self._load_state()
+
+    def _load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to load scheduler state: {str(e)}")
+            return {}
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def add_job(self, name, func, trigger, catch_up=True):
+        """Register a named job, replacing any job with the same name"""
+        now = self.clock()
+        job = Job(name, func, trigger, catch_up)
+        job.last_run = self._state.get(name)
+
+        # 停机期间错过的运行：上次运行后的下一个触发时间已经过去，则立即补跑一次；
+        # 还没到时（例如名义时间已过但随机延迟未到）按该时间运行，不跳到下一天
+        due = trigger(job.last_run) if catch_up and job.last_run is not None else None
+        if due is not None and due <= now:
+            job.next_run = now
+            logging.info(f"Job '{name}' missed a run since {datetime.fromtimestamp(job.last_run)}, catching up now")
+        elif due is not None:
+            job.next_run = min(due, trigger(now))
+        else:
+            job.next_run = trigger(now)
+
+        self._jobs[name] = job
+        self._push(job)
+        logging.info(f"Job '{name}' scheduled, next run at {datetime.fromtimestamp(job.next_run)}")
+        return job
+
+    def remove_job(self, name):
+        """Remove a job; its stale heap entries are skipped lazily"""
+        return self._jobs.pop(name, None)
+
+    def reschedule_job(self, name, trigger):
+        """Replace a job's trigger, taking effect from now"""
+        job = self._jobs.get(name)
+        if job is None:
+            return None
+        job.trigger = trigger
+        job.next_run = trigger(self.clock())
+        self._push(job)
+        logging.info(f"Job '{name}' rescheduled, next run at {datetime.fromtimestamp(job.next_run)}")
+        return job
+
+    @property
+    def jobs(self):
+        return dict(self._jobs)
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.next_run, next(self._counter), job.name, job))
+
+    def _peek(self):
+        """Return the next live heap entry, discarding stale ones"""
+        while self._heap:
+            due, _, name, job = self._heap[0]
+            if self._jobs.get(name) is job and job.next_run == due:
+                return due, job
+            heapq.heappop(self._heap)
+        return None, None
+
+    def next_deadline(self):
+        due, _ = self._peek()
+        return due
+
+    def run_pending(self):
+        """Run every job whose deadline has passed; returns the names run"""
+        ran = []
+        while True:
+            due, job = self._peek()
+            if job is None or due > self.clock():
+                break
+            heapq.heappop(self._heap)
+            self._run_job(job)
+            ran.append(job.name)
+        return ran
+
+    def _run_job(self, job):
+        started = self.clock()
+        logging.info(f"Running job '{job.name}'")
+        try:
+            job.func()
+        except Exception as e:
+            logging.error(f"Job '{job.name}' failed: {str(e)}")
+
+        job.last_run = started
+        self._state[job.name] = started
+        try:
+            self._save_state()
+        except OSError as e:
+            logging.warning(f"Failed to save scheduler state: {str(e)}")
+
+        # 以当前时间计算下一次，长时间运行的任务不会连续补跑多次
+        if self._jobs.get(job.name) is job:
+            job.next_run = job.trigger(max(started, self.clock()))
+            self._push(job)
+            logging.info(f"Job '{job.name}' next run at {datetime.fromtimestamp(job.next_run)}")
+
+    def run_forever(self, max_sleep=None, max_iterations=None, on_tick=None):
+        """Sleep until the next deadline and run due jobs, forever
+
+        Args:
+            max_sleep (float): Upper bound on a single sleep, so callers
+                can interleave other periodic work between ticks
+            max_iterations (int): Stop after this many wake-ups (for tests)
+            on_tick (callable): Called after every wake-up before due jobs
+                run; it may add, remove or reschedule jobs
+        """
+        iterations = 0
+        while max_iterations is None or iterations < max_iterations:
+            iterations += 1
+            due = self.next_deadline()
+            if due is None:
+                if max_sleep is None:
+                    logging.info("No jobs scheduled, scheduler exiting")
+                    return
+                self.sleep(max_sleep)
+            else:
+                wait = due - self.clock()
+                if max_sleep is not None:
+                    wait = min(wait, max_sleep)
+                if wait > 0:
+                    self.sleep(wait)
+            if on_tick is not None:
+                try:
+                    on_tick()
+                except Exception as e:
+                    logging.error(f"Scheduler tick handler failed: {str(e)}")
+            self.run_pending()
@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只在进程内合并请求
+    fcntl = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution
+
+    The first caller for a key runs the function; threads and asyncio tasks
+    asking for the same key while it runs wait for that call and receive
+    its result or exception. With lock_dir set, processes on the same host
+    coordinate through a per-key file lock: a process that had to wait for
+    the lock reuses the result the holder wrote meanwhile instead of
+    repeating the request.
+
+    Shared results are stored as JSON: encode maps a result to a
+    JSON-serializable object and decode maps it back. Lock and result files
+    untouched for result_ttl seconds are removed.
+    """
+
+    def __init__(self, lock_dir=None, encode=None, decode=None, result_ttl=600):
+        self.lock_dir = lock_dir
+        self.encode = encode or (lambda result: result)
+        self.decode = decode or (lambda data: data)
+        self.result_ttl = result_ttl
+        self.shared = 0  # 被合并掉（未实际发出）的调用次数
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def do(self, key, func):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            logging.debug(f"Joining in-flight request for {key}")
+            return future.result()
+
+        try:
+            result = self._call_across_processes(key, func)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key, func, executor=None):
+        """Asyncio variant; the blocking function runs in an executor"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+        if future is not None:
+            return await asyncio.wrap_future(future)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.do, key, func)
+
+    def _paths(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        base = os.path.join(self.lock_dir, digest)
+        return base + '.lock', base + '.result'
+
+    @staticmethod
+    def _open_lock(lock_path, blocking=True):
+        """Open and lock lock_path; None when blocking is False and it is held
+
+        A lock file removed by a sweep while we waited is no longer the one
+        other processes open, so the lock is taken again on the new file.
+        """
+        while True:
+            lock_file = open(lock_path, 'a+')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+            try:
+                if os.path.samestat(os.fstat(lock_file.fileno()), os.stat(lock_path)):
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+            if not blocking:
+                return None
+
+    def _sweep(self):
+        """Remove lock and result files of keys not used for result_ttl seconds"""
+        now = time.time()
+        if now - self._last_sweep < self.result_ttl:
+            return
+        self._last_sweep = now
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.lock_dir, name)
+            if name.endswith('.tmp'):
+                # 写入结果时中断留下的临时文件
+                try:
+                    if now - os.path.getmtime(path) >= self.result_ttl:
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith('.lock'):
+                continue
+            result_path = path[:-len('.lock')] + '.result'
+            try:
+                used = max(os.path.getmtime(p) for p in (path, result_path) if os.path.exists(p))
+            except (OSError, ValueError):
+                continue
+            if now - used < self.result_ttl:
+                continue
+            # 只删除没有进程持有的锁；持有锁时删除，等待的进程会在新文件上重新加锁
+            lock_file = self._open_lock(path, blocking=False)
+            if lock_file is None:
+                continue
+            try:
+                for p in (result_path, path):
+                    try:
+                        os.remove(p)
+                    except FileNotFoundError:
+                        pass
+            finally:
+                lock_file.close()
+
+    def _call_across_processes(self, key, func):
+        if not self.lock_dir or fcntl is None:
+            return func()
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._sweep()
+        lock_path, result_path = self._paths(key)
+        waiting_since = time.time()
+        lock_file = self._open_lock(lock_path)
+        try:
+            # 等锁期间另一个进程完成了同样的请求，直接使用它的结果
+            try:
+                if os.path.getmtime(result_path) >= waiting_since:
+                    with open(result_path, 'r', encoding='utf-8') as f:
+                        result = self.decode(json.load(f))
+                    with self._lock:
+                        self.shared += 1
+                    logging.debug(f"Reused result of another process for {key}")
+                    return result
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+            result = func()
+            try:
+                with open(result_path + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(self.encode(result), f, ensure_ascii=False)
+                os.replace(result_path + '.tmp', result_path)
+            except (OSError, TypeError, ValueError) as e:
+                logging.warning(f"Failed to share result for {key}: {str(e)}")
+            return result
+        finally:
+            # 关闭文件即释放锁
+            lock_file.close()
@@ -0,0 +1,240 @@
+import logging
+import os
+from collections import deque
+from keyword_index import normalize_keyword
+
+DEFAULT_TENANT = 'default'
+# 数据目录下已被其他功能占用的名称，租户目录不能与之重名
+RESERVED_TENANT_NAMES = frozenset({'archive', 'dicts', 'replay', 'replay_output', 'outbox', 'tmp'})
+
+
+class Tenant:
+    """One team's monitoring profile: keywords, query parameters, thresholds, recipients and schedule"""
+
+    def __init__(self, name, keywords, geo, timeframe, monitor, schedule, data_dir_prefix,
+                 channels=None, weight=1):
+        self.name = name
+        self.keywords = list(keywords)
+        self.geo = geo
+        self.timeframe = timeframe
+        self.monitor = monitor
+        self.schedule = schedule
+        self.data_dir_prefix = data_dir_prefix
+        self.channels = channels
+        self.weight = max(1, int(weight))
+
+    @property
+    def is_default(self):
+        return self.name == DEFAULT_TENANT
+
+    @property
+    def job_name(self):
+        return 'collection' if self.is_default else f"collection:{self.name}"
+
+    def state_path(self, path):
+        """Per-tenant variant of a state file path; the default tenant keeps the original"""
+        if self.is_default or not path:
+            return path
+        root, ext = os.path.splitext(path)
+        return f"{root}.{self.name}{ext}"
+
+
+def validate_tenant_name(name):
+    """Raise ValueError unless name can be used as a tenant's data directory"""
+    if not name or '/' in name or '\\' in name or name.startswith('.'):
+        raise ValueError(f"Invalid tenant name: {name!r}")
+    # 全数字的名称会被当作日期目录压缩归档
+    if name.lower() in RESERVED_TENANT_NAMES or name.isdigit():
+        raise ValueError(f"Tenant name {name!r} is reserved for the data directory")
+
+
+def tenant_data_prefix(data_dir_prefix, name):
+    """Daily directory prefix of a tenant; the default tenant keeps data_dir_prefix"""
+    return data_dir_prefix if name == DEFAULT_TENANT else f"{data_dir_prefix}{name}/"
+
+
+def tenant_archive_dir(archive_dir, name):
+    """Monthly archive directory of a tenant; the default tenant keeps archive_dir"""
+    return archive_dir if name == DEFAULT_TENANT else os.path.join(archive_dir, name)
+
+
+def load_tenants(tenants_config, keywords, trends_config, monitor_config, schedule_config, data_dir_prefix):
+    """Build tenants from TENANTS; without profiles a single default tenant uses the global settings
+
+    Each profile may set keywords, geo, timeframe, monitor (overrides of
+    MONITOR_CONFIG), schedule (overrides of SCHEDULE_CONFIG), channels
+    (NOTIFICATION_CONFIG['channels'] format) and weight (fair-share weight).
+    """
+    if not tenants_config:
+        return [Tenant(DEFAULT_TENANT, keywords, trends_config['geo'], trends_config['timeframe'],
+                       dict(monitor_config), dict(schedule_config), data_dir_prefix)]
+
+    tenants = []
+    for name, profile in tenants_config.items():
+        validate_tenant_name(name)
+        tenants.append(Tenant(
+            name,
+            profile.get('keywords', keywords),
+            profile.get('geo', trends_config['geo']),
+            profile.get('timeframe', trends_config['timeframe']),
+            {**monitor_config, **profile.get('monitor', {})},
+            {**schedule_config, **profile.get('schedule', {})},
+            tenant_data_prefix(data_dir_prefix, name),
+            channels=profile.get('channels'),
+            weight=profile.get('weight', 1)
+        ))
+    return tenants
+
+
+class TenantRun:
+    """Progress of one tenant inside a collection round"""
+
+    def __init__(self, tenant, keywords, timeframe):
+        self.tenant = tenant
+        self.keywords = keywords
+        self.timeframe = timeframe
+        self.queue = deque()      # 由本租户负责请求的 fetch key
+        self.remaining = set()    # 还在等待结果的 fetch key
+        self.received = []        # (keyword, data)，data 为 None 表示失败
+
+    @property
+    def finished(self):
+        return not self.remaining
+
+    def deliver(self, key, keyword, data):
+        if key in self.remaining:
+            self.remaining.discard(key)
+            self.received.append((keyword, data))
+
+
+class FairShareQueue:
+    """Weighted round-robin over the pending keywords of several tenants
+
+    Identical requests (normalized keyword, geo, timeframe) from different
+    tenants are fetched once: the first tenant owns the request and every
+    subscribed tenant receives the result. Results fetched earlier in the
+    round are handed out without a new request.
+    """
+
+    def __init__(self, normalize=normalize_keyword, max_deferrals=3):
+        self.normalize = normalize
+        self.max_deferrals = max_deferrals
+        self.runs = []
+        self._subscribers = {}   # key -> [(run, keyword)]
+        self._requests = {}      # key -> (keyword, geo, timeframe)
+        self._fetched = {}       # key -> data，本轮已获取的结果
+        self._deferrals = {}
+        self._cursor = 0
+        self.shared = 0
+
+    def add(self, run):
+        self.runs.append(run)
+        self._subscribe(run, run.keywords)
+
+    def _key(self, run, keyword):
+        return (self.normalize(keyword), run.tenant.geo, run.timeframe)
+
+    def _subscribe(self, run, keywords):
+        for keyword in keywords:
+            key = self._key(run, keyword)
+            if key in run.remaining:
+                continue
+            run.remaining.add(key)
+            if key in self._fetched:
+                self.shared += 1
+                run.deliver(key, keyword, self._fetched[key])
+            elif key in self._subscribers:
+                self.shared += 1
+                self._subscribers[key].append((run, keyword))
+            else:
+                self._subscribers[key] = [(run, keyword)]
+                self._requests[key] = (keyword, run.tenant.geo, run.timeframe)
+                run.queue.append(key)
+        if self.shared:
+            logging.debug(f"{self.shared} keyword requests shared between tenants so far")
+
+    def update(self, run, keywords):
+        """Apply a changed keyword list to a run in progress
+
+        New keywords are queued; removed keywords still waiting for a result
+        are cancelled. Results already received are kept.
+        """
+        wanted = {self._key(run, keyword) for keyword in keywords}
+        kept = []
+        cancelled = 0
+        for keyword in run.keywords:
+            key = self._key(run, keyword)
+            if key in wanted or key not in run.remaining:
+                kept.append(keyword)
+            else:
+                self._cancel(run, key)
+                cancelled += 1
+        known = {self._key(run, keyword) for keyword in kept}
+        added = [keyword for keyword in keywords if self._key(run, keyword) not in known]
+        run.keywords = kept + added
+        self._subscribe(run, added)
+        if added or cancelled:
+            logging.info(f"[{run.tenant.name}] Keywords updated: {len(added)} queued, {cancelled} cancelled")
+
+    def _cancel(self, run, key):
+        run.remaining.discard(key)
+        subscribers = [(other, keyword) for other, keyword in self._subscribers.get(key, []) if other is not run]
+        if key in run.queue:
+            run.queue.remove(key)
+            # 其他租户也订阅了该请求时改由它们负责
+            if subscribers:
+                subscribers[0][0].queue.append(key)
+        if subscribers:
+            self._subscribers[key] = subscribers
+        else:
+            # 请求正在进行中时，结果到达后没有订阅者，直接丢弃
+            self._subscribers.pop(key, None)
+            self._requests.pop(key, None)
+            self._deferrals.pop(key, None)
+
+    def has_pending(self):
+        return any(run.queue for run in self.runs)
+
+    def next_batch(self, size):
+        """Take up to size requests, weight-many per tenant per turn"""
+        batch = []
+        active = [run for run in self.runs if run.queue]
+        if not active:
+            return batch
+        start = self._cursor % len(active)
+        order = active[start:] + active[:start]
+        while len(batch) < size and any(run.queue for run in order):
+            for run in order:
+                for _ in range(run.tenant.weight):
+                    if run.queue and len(batch) < size:
+                        batch.append(run.queue.popleft())
+        self._cursor = start + 1
+        return batch
+
+    def request(self, key):
+        """(keyword, geo, timeframe) to send for a key"""
+        return self._requests[key]
+
+    def complete(self, key, data):
+        if data:
+            self._fetched[key] = data
+        for run, keyword in self._subscribers.pop(key, []):
+            run.deliver(key, keyword, data)
+        self._requests.pop(key, None)
+
+    def defer(self, key):
+        """Put a throttled request back at the end of its owner's queue, or give up"""
+        if key not in self._subscribers:
+            return  # 已被取消
+        self._deferrals[key] = self._deferrals.get(key, 0) + 1
+        if self._deferrals[key] > self.max_deferrals:
+            logging.error(f"Giving up on {self._requests[key][0]} after {self.max_deferrals} throttled attempts")
+            self.complete(key, None)
+            return
+        owner = self._subscribers[key][0][0]
+        owner.queue.append(key)
+
+    def pop_finished(self):
+        finished = [run for run in self.runs if run.finished]
+        self.runs = [run for run in self.runs if not run.finished]
+        return finished
@@ -0,0 +1,27 @@
+import copy
+import os
+import sys
+import pytest
+
+# 模块位于仓库根目录（平铺布局），测试直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+# 测试中导入 trends_monitor 时不写日志文件
+config.LOGGING_CONFIG['log_file'] = ''
+
+
+@pytest.fixture
+def restore_config():
+    """Restore every config dict and list in place after the test"""
+    saved = {name: copy.deepcopy(value) for name, value in vars(config).items()
+             if name.isupper() and isinstance(value, (dict, list))}
+    yield config
+    for name, value in saved.items():
+        target = getattr(config, name)
+        if isinstance(target, dict):
+            target.clear()
+            target.update(value)
+        else:
+            target[:] = value
@@ -0,0 +1,53 @@
+from alert_store import AlertSuppressor
+from clock import FakeClock
+
+HOUR = 3600
+
+
+def suppressor(clock, **kwargs):
+    return AlertSuppressor(cooldown_hours=72, realert_ratio=2.0, normalize=str.lower, clock=clock, **kwargs)
+
+
+def test_suppressed_within_cooldown_and_released_after():
+    clock = FakeClock(start=0.0)
+    alerts = suppressor(clock)
+    assert alerts.filter([('Image', 'AI Art', 500)]) == [('Image', 'AI Art', 500)]
+    alerts.record([('Image', 'AI Art', 500)])
+
+    clock.sleep(71 * HOUR)
+    assert alerts.filter([('image', 'ai art', 600)]) == []
+    clock.sleep(HOUR)
+    assert alerts.filter([('image', 'ai art', 600)]) == [('image', 'ai art', 600)]
+
+
+def test_realert_when_value_reaches_ratio():
+    clock = FakeClock(start=0.0)
+    alerts = suppressor(clock)
+    alerts.record([('Image', 'ai art', 500), ('Image', 'breakout', 'Breakout')])
+    clock.sleep(HOUR)
+    assert not alerts.should_alert('Image', 'ai art', 999)
+    assert alerts.should_alert('Image', 'ai art', 1000)
+    # 非数值的上次提醒无法比较倍数，只能等冷却结束
+    assert not alerts.should_alert('Image', 'breakout', 5000)
+
+    # 再次提醒后以新的数值为基准
+    alerts.record([('Image', 'ai art', 1000)])
+    clock.sleep(HOUR)
+    assert not alerts.should_alert('Image', 'ai art', 1500)
+
+
+def test_duplicates_reduced_and_state_round_trips(tmp_path):
+    clock = FakeClock(start=0.0)
+    alerts = suppressor(clock, retention_days=30)
+    assert alerts.filter([('Image', 'AI Art', 500), ('image', 'ai art', 700)]) == [('Image', 'AI Art', 500)]
+    alerts.record([('Image', 'AI Art', 500)])
+    clock.sleep(10 * 86400)
+    alerts.record([('Video', 'clip', 100)])
+
+    path = str(tmp_path / 'alerts.json')
+    clock.sleep(25 * 86400)
+    alerts.save(path)
+    loaded = AlertSuppressor.load(path, normalize=str.lower, clock=clock)
+    # 超过保留期的记录在保存时删除
+    assert list(loaded._entries) == ['video\x1fclip']
+    assert loaded._entries['video\x1fclip'] == (10 * 86400, 100.0)
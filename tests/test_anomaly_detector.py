@@ -0,0 +1,66 @@
+import math
+import pandas as pd
+import pytest
+from anomaly_detector import EwmaDetector
+from clock import FakeClock
+from result_table import ResultTable
+
+DAY = 86400
+
+
+def table(rising):
+    results = ResultTable()
+    for keyword, rows in rising.items():
+        results.add(keyword, {'rising': pd.DataFrame({'query': [q for q, _ in rows], 'value': [v for _, v in rows]}),
+                              'top': None})
+    return results
+
+
+def detector(clock, **kwargs):
+    return EwmaDetector(min_samples=2, normalize=str.lower, clock=clock, **kwargs)
+
+
+def test_duplicate_rows_of_one_series_are_aggregated():
+    ewma = detector(FakeClock(start=0.0))
+    # 归一化后是同一序列：取平均后只更新一步
+    ewma.update(table({'Image': [('Cat', 100), ('cat', 300)]}))
+    assert len(ewma) == 1
+    assert ewma.mean[0] == 200 and ewma.count[0] == 1
+    ewma.update(table({'Image': [('cat', 100), ('CAT', 100), ('dog', 50)]}))
+    assert ewma.count.tolist() == [2, 1]
+    assert ewma.mean[0] == pytest.approx(200 + 0.3 * (100 - 200))
+
+
+def test_missing_values_are_skipped():
+    ewma = detector(FakeClock(start=0.0))
+    ewma.update(table({'Image': [('cat', 100), ('dog', math.nan)]}))
+    ewma.update(table({'Image': [('cat', math.nan)]}))
+    assert len(ewma) == 1 and ewma.count[0] == 1 and ewma.mean[0] == 100
+    assert ewma.detect(table({'Image': [('cat', math.nan), ('dog', 'Breakout')]})) == []
+
+
+def test_stale_series_are_pruned_and_state_round_trips(tmp_path):
+    clock = FakeClock(start=0.0)
+    ewma = detector(clock, max_age_days=30)
+    ewma.update(table({'Image': [('old', 100), ('kept', 100)]}))
+    clock.sleep(20 * DAY)
+    ewma.update(table({'Image': [('kept', 100)]}))
+    clock.sleep(15 * DAY)
+    ewma.update(table({'Image': [('new', 100)]}))
+    assert sorted(ewma._index) == ['image\x1fkept', 'image\x1fnew']
+
+    path = str(tmp_path / 'state.npz')
+    ewma.save(path)
+    loaded = EwmaDetector.load(path, clock=clock, max_age_days=30)
+    assert loaded._keys == ewma._keys
+    assert loaded.last_seen.tolist() == ewma.last_seen.tolist()
+    clock.sleep(20 * DAY)
+    assert loaded.prune() == 1 and loaded._keys == ['image\x1fnew']
+
+
+def test_detects_deviation_from_history():
+    ewma = detector(FakeClock(start=0.0))
+    for value in (100, 110, 90):
+        ewma.update(table({'Image': [('cat', value)]}))
+    assert ewma.detect(table({'Image': [('cat', 105)]})) == []
+    assert ewma.detect(table({'Image': [('cat', 400), ('dog', 600)]})) == [('Image', 'cat', 400), ('Image', 'dog', 600)]
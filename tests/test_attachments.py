@@ -0,0 +1,143 @@
+import email
+import gzip
+import io
+import os
+import threading
+import urllib.error
+import urllib.request
+import zipfile
+from http.server import ThreadingHTTPServer
+import pytest
+from attachments import (
+    PreparedAttachments, compress_file, file_link, linked_attachments_html, split_by_size
+)
+from notification import EmailChannel
+from query_service import LocalStore, QueryService, _make_handler
+
+PATTERNS = ['*/daily_report_*.csv', '*/clusters_*.csv']
+
+
+def write_report(directory, name='daily_report_20250101.csv', size=300 * 1024):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    line = b'keyword,query,value,type\r\n'
+    with open(path, 'wb') as f:
+        f.write(line * (size // len(line) + 1))
+    return path
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zip'])
+def test_compress_file_round_trip(tmp_path, compression):
+    source = write_report(str(tmp_path / '20250101'))
+    target = compress_file(source, str(tmp_path), compression)
+    with open(source, 'rb') as f:
+        original = f.read()
+    if compression == 'gzip':
+        assert target.endswith('.csv.gz')
+        with gzip.open(target, 'rb') as f:
+            assert f.read() == original
+    else:
+        with zipfile.ZipFile(target) as archive:
+            assert archive.read(os.path.basename(source)) == original
+    assert os.path.getsize(target) < len(original)
+
+
+def test_only_large_files_compressed_and_temp_dir_released(tmp_path):
+    large = write_report(str(tmp_path / '20250101'))
+    small = write_report(str(tmp_path / '20250101'), 'clusters_20250101.csv', size=1024)
+    prepared = PreparedAttachments([large, small, str(tmp_path / 'missing.csv')], 'gzip', 256 * 1024)
+    assert [a.filename for a in prepared.items] == ['daily_report_20250101.csv.gz', 'clusters_20250101.csv']
+    assert prepared.items[0].content_type == 'application/gzip'
+    assert prepared.items[0].size < prepared.items[0].original_size
+    directory = os.path.dirname(prepared.items[0].delivery_path)
+
+    # 发送中的渠道持有引用，最后一个释放时才删除临时目录
+    prepared.acquire()
+    prepared.release()
+    assert os.path.isdir(directory)
+    prepared.release()
+    assert not os.path.exists(directory)
+    assert os.path.exists(large)
+
+
+def test_streamed_email_carries_compressed_attachment(tmp_path):
+    report = write_report(str(tmp_path / '20250101'))
+    prepared = PreparedAttachments([report], 'gzip', 0)
+    out = io.BytesIO()
+    try:
+        EmailChannel.write_message(out.write, 'a@example.com', 'Report', '<p>hi</p>', prepared.items)
+    finally:
+        prepared.release()
+
+    message = email.message_from_bytes(out.getvalue())
+    parts = [part for part in message.walk() if part.get_filename()]
+    assert [part.get_filename() for part in parts] == ['daily_report_20250101.csv.gz']
+    assert parts[0].get_content_type() == 'application/gzip'
+    with open(report, 'rb') as f:
+        assert gzip.decompress(parts[0].get_payload(decode=True)) == f.read()
+    # 按行编码，不超过 SMTP 的 998 字节行长限制
+    assert max(len(line) for line in out.getvalue().split(b'\r\n')) <= 998
+
+
+def test_oversized_attachment_linked_through_service(tmp_path, restore_config):
+    restore_config.STORAGE_CONFIG['data_dir_prefix'] = str(tmp_path / 'reports') + '/'
+    restore_config.NOTIFICATION_CONFIG['attachment_link_base'] = 'http://trends.example.com:8080/'
+    restore_config.SERVICE_CONFIG['file_patterns'] = PATTERNS
+    report = write_report(str(tmp_path / 'reports' / 'team' / '20250101'))
+    prepared = PreparedAttachments([report], 'gzip', 0)
+    try:
+        sendable, linked = split_by_size(prepared.items, 100)
+        assert sendable == [] and linked == prepared.items
+        html = linked_attachments_html(linked)
+        assert 'http://trends.example.com:8080/v1/files/team/20250101/daily_report_20250101.csv' in html
+    finally:
+        prepared.release()
+
+    # 不在允许列表中的文件不生成服务链接
+    state_file = tmp_path / 'reports' / '.alert_state.json'
+    state_file.write_text('{}')
+    assert file_link(str(state_file)) == str(state_file)
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    root = tmp_path / 'reports'
+    store = LocalStore(str(root) + '/', str(root / 'archive'), file_patterns=PATTERNS)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _make_handler(QueryService(store)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield root, f"http://127.0.0.1:{server.server_address[1]}/v1/files/"
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(url, gzip_ok=False):
+    request = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'} if gzip_ok else {})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.headers, response.read()
+
+
+def test_report_served_gzipped_on_the_fly(file_server):
+    root, base = file_server
+    report = write_report(str(root / '20250101'))
+    with open(report, 'rb') as f:
+        original = f.read()
+
+    headers, body = fetch(base + '20250101/daily_report_20250101.csv', gzip_ok=True)
+    assert headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(body) == original
+    headers, body = fetch(base + '20250101/daily_report_20250101.csv')
+    assert headers['Content-Encoding'] is None
+    assert int(headers['Content-Length']) == len(body) == len(original)
+
+
+@pytest.mark.parametrize('relative', ['.alert_state.json', '20250101/related_queries_20250101.jsonl',
+                                      '../secret.csv', '20250101/../../secret.csv', 'missing/daily_report_1.csv'])
+def test_files_outside_allowlist_not_served(file_server, relative):
+    root, base = file_server
+    write_report(str(root / '20250101'), 'related_queries_20250101.jsonl', size=10)
+    write_report(str(root), '.alert_state.json', size=10)
+    write_report(str(root.parent), 'secret.csv', size=10)
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        fetch(base + relative)
+    assert excinfo.value.code == 404
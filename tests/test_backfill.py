@@ -0,0 +1,58 @@
+import json
+import os
+from backfill import Checkpoint, estimate_duration
+
+
+def test_marks_are_journaled_not_rewritten(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = Checkpoint(path, compact_every=100)
+    for i in range(10):
+        checkpoint.mark_done(f"|w|k{i}")
+    # 快照未重写，只追加日志
+    assert not os.path.exists(path)
+    with open(path + '.journal', encoding='utf-8') as f:
+        assert f.read().splitlines() == [f"|w|k{i}" for i in range(10)]
+
+
+def test_reload_after_crash_reads_journal_and_skips_torn_line(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = Checkpoint(path, compact_every=3)
+    for key in ('a', 'b', 'c', 'd'):
+        checkpoint.mark_done(key)
+    # 未调用 close()：a-c 已合并到快照，d 仍在日志中
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == {'done': ['a', 'b', 'c']}
+    with open(path + '.journal', 'a', encoding='utf-8') as f:
+        f.write('torn')
+
+    reloaded = Checkpoint(path)
+    assert all(key in reloaded for key in ('a', 'b', 'c', 'd'))
+    assert 'torn' not in reloaded
+    assert len(reloaded) == 4
+
+
+def test_close_folds_journal_into_snapshot(tmp_path):
+    path = str(tmp_path / 'nested' / 'checkpoint.json')
+    with Checkpoint(path) as checkpoint:
+        checkpoint.mark_done('b')
+        checkpoint.mark_done('a')
+        checkpoint.mark_done('a')
+    assert not os.path.exists(path + '.journal')
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f) == {'done': ['a', 'b']}
+    assert 'a' in Checkpoint(path)
+
+
+def test_without_path_nothing_is_written(tmp_path):
+    with Checkpoint('') as checkpoint:
+        checkpoint.mark_done('a')
+        assert 'a' in checkpoint
+    assert os.listdir(tmp_path) == []
+
+
+def test_estimate_counts_every_http_call_against_the_hourly_cap():
+    # 每个任务两次 HTTP 调用：200 次/小时只够 100 个任务
+    assert estimate_duration(250, 1, 200) == 3600
+    assert estimate_duration(250, 1, 200, calls_per_request=2) == 2 * 3600
+    assert estimate_duration(100, 1, 200, calls_per_request=2) == 100
+    assert estimate_duration(0, 1, 200, calls_per_request=2) == 0
@@ -0,0 +1,163 @@
+import json
+import os
+import time
+import zipfile
+from datetime import datetime
+import compaction
+from backfill import job_key, stored_jobs
+from compaction import compact_reports, read_keyword_day
+from raw_archive import RawArchiveWriter
+from query_service import LocalStore
+
+NOW = datetime(2025, 3, 1)
+
+
+def write_records(directory, records, name='related_queries_run.jsonl', age=2 * 3600):
+    """Write JSON Lines records, dated age seconds ago so the directory is not considered active"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    past = time.time() - age
+    os.utime(path, (past, past))
+    return path
+
+
+def record(keyword, geo, timeframe, value=1):
+    return {'keyword': keyword, 'geo': geo, 'timeframe': timeframe,
+            'related_queries': {'top': [{'query': 'q', 'value': value}], 'rising': None}}
+
+
+def value(found):
+    return found['related_queries']['top'][0]['value']
+
+
+def compact(reports):
+    return compact_reports(str(reports) + '/', str(reports / 'archive'), compact_after_days=1, now=NOW)
+
+
+def store(reports):
+    return LocalStore(str(reports) + '/', str(reports / 'archive'))
+
+
+def test_every_geo_and_timeframe_of_a_keyword_is_indexed(tmp_path):
+    reports = tmp_path / 'reports'
+    windows = ['2025-01-01 2025-01-07', '2024-12-25 2025-01-07']
+    write_records(reports / '20250107', [
+        record('Image', 'US', windows[0], 1), record('Image', 'GB', windows[0], 2),
+        record('Image', 'US', windows[1], 3), record('Video', 'US', windows[0], 4),
+    ])
+    assert compact(reports)['compacted_days'] == 1
+    assert not (reports / '20250107').exists()
+
+    local = store(reports)
+    assert stored_jobs(local, '20250107') == {
+        job_key('Image', 'US', windows[0]), job_key('Image', 'GB', windows[0]),
+        job_key('Image', 'US', windows[1]), job_key('Video', 'US', windows[0]),
+    }
+    assert value(local.find('Image', '20250107', geo='GB')) == 2
+    assert value(local.find('Image', '20250107', geo='US', timeframe=windows[0])) == 1
+    assert value(local.find('Image', '20250107', geo='US')) == 3
+    assert value(read_keyword_day(str(reports / 'archive'), 'Image', '20250107', geo='US', timeframe=windows[0])) == 1
+
+
+def test_recompacting_a_day_replaces_rewritten_members(tmp_path):
+    reports = tmp_path / 'reports'
+    write_records(reports / '20250107', [record('Image', 'US', 'now 7-d', 1)], name='related_queries_a.jsonl')
+    write_records(reports / '20250107', [record('Image', 'US', 'now 7-d', 2)], name='related_queries_b.jsonl')
+    compact(reports)
+    # 补录向已归档的日期写入同名文件：旧成员的索引被替换，其他文件的保留
+    write_records(reports / '20250107', [record('Image', 'GB', 'now 7-d', 5)], name='related_queries_b.jsonl')
+    compact(reports)
+
+    with open(reports / 'archive' / '202501.index.json', encoding='utf-8') as f:
+        locations = json.load(f)['days']['20250107']['keywords']['Image']
+    assert [(location['member'], location['geo']) for location in locations] == [
+        ('20250107/related_queries_a.jsonl', 'US'), ('20250107/related_queries_b.jsonl', 'GB')]
+
+
+def test_single_location_indexes_still_readable(tmp_path):
+    reports = tmp_path / 'reports'
+    write_records(reports / '20250107', [record('Image', 'US', 'now 7-d', 7)])
+    compact(reports)
+    index_path = reports / 'archive' / '202501.index.json'
+    with open(index_path, encoding='utf-8') as f:
+        index = json.load(f)
+    keywords = index['days']['20250107']['keywords']
+    keywords['Image'] = keywords['Image'][-1]
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+
+    assert value(store(reports).find('Image', '20250107')) == 7
+
+
+def test_day_directories_being_written_are_skipped(tmp_path):
+    reports = tmp_path / 'reports'
+    write_records(reports / '20250105', [record('Image', 'US', 'now 7-d')])
+    write_records(reports / '20250106', [record('Image', 'US', 'now 7-d')], name='related_queries_run.jsonl.part',
+                  age=60)
+    write_records(reports / '20250107', [record('Image', 'US', 'now 7-d')], age=0)
+    assert compact(reports)['compacted_days'] == 1
+    assert not (reports / '20250105').exists()
+    assert (reports / '20250106').exists() and (reports / '20250107').exists()
+
+
+def test_day_changed_during_compaction_is_kept(tmp_path, monkeypatch):
+    reports = tmp_path / 'reports'
+    write_records(reports / '20250107', [record('Image', 'US', 'now 7-d')])
+    compact_month = compaction._compact_month
+
+    def concurrent_backfill(month, day_dirs, archive_dir, dict_dir=None):
+        compact_month(month, day_dirs, archive_dir, dict_dir)
+        write_records(reports / '20250107', [record('Image', 'US', '2025-01-01 2025-01-07')], name='related_queries_bf.jsonl')
+
+    monkeypatch.setattr(compaction, '_compact_month', concurrent_backfill)
+    assert compact(reports)['compacted_days'] == 0
+    assert (reports / '20250107' / 'related_queries_bf.jsonl').exists()
+
+
+def test_stale_part_file_is_compacted_and_indexed(tmp_path):
+    reports = tmp_path / 'reports'
+    path = write_records(reports / '20250106', [record('Image', 'US', 'now 7-d', 6)],
+                         name='related_queries_run.jsonl.part')
+    # 崩溃的采集留下的未完成记录
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"keyword": "Vid')
+    past = time.time() - 2 * 3600
+    os.utime(path, (past, past))
+
+    assert compact(reports)['compacted_days'] == 1
+    assert not (reports / '20250106').exists()
+    assert value(store(reports).find('Image', '20250106')) == 6
+    assert store(reports).find('Vid', '20250106') is None
+
+
+def test_raw_archives_stored_and_moved_aside_files_indexed(tmp_path):
+    reports = tmp_path / 'reports'
+    day = reports / '20250107'
+    dict_dir = str(reports / 'archive' / 'dicts')
+    with RawArchiveWriter(str(day), 'related_queries_20250107.rqz') as writer:
+        writer.write_batch([record('Image', 'US', 'now 7-d', 1), record('Old', 'US', 'now 7-d', 2)])
+    # 编码设置改变后再次运行：已有文件被另存为 .old，新文件重新开始
+    with RawArchiveWriter(str(day), 'related_queries_20250107.rqz', dictionary=b'{"keyword": "Image"}' * 10,
+                          dict_dir=dict_dir) as writer:
+        writer.write_batch([record('Image', 'US', 'now 7-d', 3)])
+    aside, = [name for name in os.listdir(day) if name.endswith('.old')]
+    past = time.time() - 2 * 3600
+    for name in os.listdir(day):
+        os.utime(day / name, (past, past))
+
+    local = LocalStore(str(reports) + '/', str(reports / 'archive'), dict_dir)
+    # 当天目录中另存的记录也能查询，较新的文件优先
+    assert value(local.find('Old', '20250107')) == 2
+    assert value(local.find('Image', '20250107')) == 3
+
+    assert compact_reports(str(reports) + '/', str(reports / 'archive'), compact_after_days=1, now=NOW,
+                           dict_dir=dict_dir)['compacted_days'] == 1
+    with zipfile.ZipFile(reports / 'archive' / '202501.zip') as archive:
+        types = {info.filename: info.compress_type for info in archive.infolist()}
+    assert types['20250107/related_queries_20250107.rqz'] == zipfile.ZIP_STORED
+    assert types[f"20250107/{aside}"] == zipfile.ZIP_STORED
+    assert value(local.find('Old', '20250107')) == 2
+    assert value(local.find('Image', '20250107')) == 3
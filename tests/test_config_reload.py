@@ -0,0 +1,58 @@
+import os
+import threading
+import time
+import pytest
+from config_reload import ConfigWatcher, config_lock
+
+
+@pytest.fixture
+def config_file(tmp_path, restore_config):
+    path = tmp_path / 'config.py'
+    with open(restore_config.__file__, 'r', encoding='utf-8') as f:
+        # 与 conftest 中关闭日志文件的设置一致
+        path.write_text(f.read().replace("'log_file': 'trends_monitor.log'", "'log_file': ''"), encoding='utf-8')
+    return path
+
+
+def edit(path, old, new):
+    text = path.read_text(encoding='utf-8')
+    assert old in text
+    path.write_text(text.replace(old, new, 1), encoding='utf-8')
+    # 保证 mtime 变化
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_changes_are_applied_in_place(config_file, restore_config):
+    keywords = restore_config.KEYWORDS
+    watcher = ConfigWatcher(path=str(config_file), module=restore_config)
+    edit(config_file, "'rising_threshold': 500", "'rising_threshold': 800")
+    edit(config_file, '"Image",', '"Image",\n    "Photo",')
+
+    assert watcher.check() == {'MONITOR_CONFIG', 'KEYWORDS'}
+    assert restore_config.MONITOR_CONFIG['rising_threshold'] == 800
+    assert restore_config.KEYWORDS is keywords and 'Photo' in keywords
+    assert watcher.check() == set()
+
+
+def test_invalid_config_is_ignored(config_file, restore_config):
+    watcher = ConfigWatcher(path=str(config_file), module=restore_config)
+    edit(config_file, "'hour': 23", "'hour': 25")
+    assert watcher.check() == set()
+    assert restore_config.SCHEDULE_CONFIG['hour'] == 23
+
+
+def test_reload_waits_for_readers_holding_the_lock(config_file, restore_config):
+    watcher = ConfigWatcher(path=str(config_file), module=restore_config)
+    edit(config_file, "'rising_threshold': 500", "'rising_threshold': 800")
+    result = []
+
+    with config_lock:
+        thread = threading.Thread(target=lambda: result.append(watcher.check()))
+        thread.start()
+        time.sleep(0.2)
+        # 持有锁的读取方看到的始终是完整的旧配置
+        assert thread.is_alive()
+        assert restore_config.MONITOR_CONFIG['rising_threshold'] == 500
+    thread.join(5)
+    assert result == [{'MONITOR_CONFIG'}]
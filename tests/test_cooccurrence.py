@@ -0,0 +1,61 @@
+import os
+from datetime import datetime
+import pandas as pd
+from clock import FakeClock, set_clock
+from cooccurrence import CooccurrenceGraph, load_history_tables
+from result_table import ResultTable, table_path
+
+
+def table(related):
+    results = ResultTable()
+    for keyword, queries in related.items():
+        results.add(keyword, {'rising': pd.DataFrame({'query': list(queries), 'value': list(queries.values())}),
+                              'top': None})
+    return results
+
+
+RUN = {
+    'Image': {'ai art': 500, 'photo editor': 200, 'cat': 90},
+    'Video': {'ai art': 300, 'photo editor': 100, 'video editor': 50},
+    'Music': {'ai music': 400, 'music generator': 0},
+    'Voice': {'AI Music': 100},
+    'Solo': {'lonely': 10},
+}
+
+
+def test_matrix_keeps_strongest_value_per_pair():
+    graph = CooccurrenceGraph.from_tables([table({'Image': {'ai art': 100}}), table({'image': {'AI Art': 700}})],
+                                          normalize=str.lower)
+    assert graph.keywords == ['image'] and graph.queries == ['ai art']
+    assert graph.matrix.toarray().tolist() == [[700]]
+
+
+def test_clusters_link_seeds_through_bridge_queries():
+    graph = CooccurrenceGraph.from_tables([table(RUN)], normalize=str.lower)
+    assert graph.bridges()[:2] == [('ai art', ['image', 'video']), ('photo editor', ['image', 'video'])]
+    assert graph.clusters() == [
+        {'keywords': ['image', 'video'], 'bridge_queries': ['ai art', 'photo editor'], 'query_count': 6},
+        {'keywords': ['music', 'voice'], 'bridge_queries': ['ai music'], 'query_count': 3},
+    ]
+    # 要求三个种子共享时没有桥接查询，也就没有聚类
+    assert graph.clusters(min_seeds=3) == []
+    assert graph.keyword_cooccurrence().toarray()[0].tolist() == [3, 2, 0, 0, 0]
+
+
+def test_history_tables_join_clusters_and_skip_old_days(tmp_path):
+    reports = tmp_path / 'reports'
+    for day, related in (('20250110', {'Solo': {'photo editor': 5}}), ('20241201', {'Music': {'cat': 1}})):
+        os.makedirs(reports / day)
+        table(related).save(table_path(str(reports / day / f"daily_report_{day}.csv")))
+    previous = set_clock(FakeClock(start=datetime(2025, 1, 15).timestamp()))
+    try:
+        history = load_history_tables(str(reports) + '/', 'daily_report_', 30)
+    finally:
+        set_clock(previous)
+    try:
+        assert len(history) == 1
+        clusters = CooccurrenceGraph.from_tables([table(RUN)] + history, normalize=str.lower).clusters()
+    finally:
+        for loaded in history:
+            loaded.close()
+    assert clusters[0]['keywords'] == ['image', 'video', 'solo']
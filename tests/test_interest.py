@@ -0,0 +1,28 @@
+import threading
+import trends_monitor
+from tenants import load_tenants
+
+
+def test_interest_collected_in_background(monkeypatch, restore_config):
+    release = threading.Event()
+    collected = []
+
+    def fake_collect(keywords, timeframe, directory, geo=None):
+        release.wait(5)
+        collected.append((tuple(keywords), timeframe, directory, geo))
+        return None
+
+    monkeypatch.setattr(trends_monitor, 'collect_interest_over_time', fake_collect)
+    tenant = load_tenants({}, ['a', 'b'], restore_config.TRENDS_CONFIG, restore_config.MONITOR_CONFIG,
+                          restore_config.SCHEDULE_CONFIG, 'reports/')[0]
+    collector = trends_monitor.InterestCollector()
+    # 提交后立即返回，采集在后台进行
+    collector.submit(tenant, ['a', 'b'], 'now 7-d', 'reports/x')
+    assert collected == []
+    release.set()
+    collector.wait()
+    assert collected == [(('a', 'b'), 'now 7-d', 'reports/x', tenant.geo)]
+
+
+def test_interest_disabled_by_default(restore_config):
+    assert not restore_config.INTEREST_CONFIG['enabled']
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+from clock import FakeClock, set_clock
+from keyword_expansion import SeenSet, expand_keywords
+from trends_errors import CircuitOpenError
+
+
+@pytest.fixture
+def clock():
+    fake = FakeClock(start=0.0)
+    previous = set_clock(fake)
+    yield fake
+    set_clock(previous)
+
+
+def related(rising):
+    return {'rising': pd.DataFrame({'query': list(rising), 'value': list(rising.values())}), 'top': None}
+
+
+def test_stops_after_max_pause_while_circuit_stays_open(clock):
+    calls = []
+
+    def fetch(query, geo, timeframe):
+        calls.append(query)
+        raise CircuitOpenError(600)
+
+    discovered = expand_keywords(['a', 'b'], max_requests=5, max_pause=3600, fetch=fetch)
+    assert discovered == []
+    # 6 次等待共 3600 秒，第 7 次超出上限后停止，不再无限重试
+    assert len(calls) == 7
+    assert clock.elapsed == pytest.approx(3600, abs=20 * 7)
+
+
+def test_recovers_when_circuit_closes(clock):
+    failures = [CircuitOpenError(300)]
+
+    def fetch(query, geo, timeframe):
+        if failures:
+            raise failures.pop()
+        return related({'a rising': 500, 'a small': 10}) if query == 'a' else None
+
+    discovered = expand_keywords(['a'], max_depth=2, max_requests=5, min_rising_value=100, fetch=fetch)
+    assert [item['query'] for item in discovered] == ['a rising', 'a small']
+
+
+def test_frontier_ordered_by_rising_value(clock):
+    fetched = []
+
+    def fetch(query, geo, timeframe):
+        fetched.append(query)
+        if query == 'seed':
+            return related({'low': 200, 'high': 900, 'mid': 500})
+        return None
+
+    expand_keywords(['seed'], max_depth=3, max_requests=4, fetch=fetch)
+    assert fetched == ['seed', 'high', 'mid', 'low']
+
+
+def test_seen_set_deduplicates():
+    seen = SeenSet(capacity=2000, error_rate=0.001)
+    assert seen.add('a')
+    assert not seen.add('a')
+    assert 'a' in seen and 'b' not in seen
+    assert all(seen.add(f"q{i}") for i in range(1000))
+    assert len(seen) == 1001
+
+
+def test_run_expansion_uses_the_shared_limiter_and_breaker(clock, restore_config, monkeypatch, tmp_path):
+    import trends_monitor
+    restore_config.STORAGE_CONFIG['data_dir_prefix'] = str(tmp_path) + '/'
+    calls = []
+    monkeypatch.setattr(trends_monitor, 'get_related_queries',
+                        lambda keyword, geo, timeframe, limiter, breaker, max_retries:
+                        calls.append((keyword, limiter, breaker)) or related({'seed rising': 500}))
+    assert trends_monitor.run_expansion(['seed'], max_depth=1, max_requests=1)
+    assert calls == [('seed', trends_monitor.request_limiter, trends_monitor.circuit_breaker)]
@@ -0,0 +1,19 @@
+from keyword_index import KeywordIndex
+
+
+def test_dedupe_keeps_configured_spelling():
+    index = KeywordIndex({'img': 'image'})
+    assert index.dedupe(['Image', 'IMAGE ', 'img', 'Ｖｉｄｅｏ', 'video']) == ['Image', 'Video']
+    # 另一个租户的列表使用自己的写法
+    assert index.dedupe(['image', 'AI']) == ['image', 'AI']
+    assert index.display_text('IMAGE') == 'image'
+
+
+def test_related_queries_are_not_interned():
+    index = KeywordIndex()
+    index.dedupe(['Image'])
+    assert index.display_text('image') == 'Image'
+    assert index.display_text('Image  Generator') == 'Image Generator'
+    assert index.normalize('Image  Generator') == 'image generator'
+    assert len(index) == 1
+    assert 'image generator' not in index
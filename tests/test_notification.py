@@ -0,0 +1,300 @@
+import email
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import smtplib
+import pandas as pd
+import pytest
+from clock import FakeClock, set_clock
+from notification import Channel, ChannelRateLimiter, EmailChannel, NotificationManager, build_channels
+
+
+class WebhookStandIn:
+    """Local HTTP endpoint recording webhook posts; paths starting with /slow answer after delay seconds"""
+
+    def __init__(self, delay=0.5):
+        self.posts = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.path.startswith('/slow'):
+                    time.sleep(delay)
+                stand_in.posts.append((self.path, json.loads(body), time.monotonic()))
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SMTPStandIn:
+    """Minimal SMTP server storing the un-stuffed DATA of each message"""
+
+    def __init__(self):
+        self.messages = []
+        self.raw = []
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.sock.accept()
+        f = conn.makefile('rb')
+        conn.sendall(b'220 stand-in\r\n')
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            command = line.strip().upper()
+            if command == b'DATA':
+                conn.sendall(b'354 go ahead\r\n')
+                raw, lines = [], []
+                while True:
+                    data_line = f.readline()
+                    raw.append(data_line)
+                    if data_line == b'.\r\n':
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b'.') else data_line)
+                self.raw.append(b''.join(raw))
+                self.messages.append(b''.join(lines))
+                conn.sendall(b'250 queued\r\n')
+            elif command == b'QUIT':
+                conn.sendall(b'221 bye\r\n')
+                break
+            else:
+                conn.sendall(b'250 ok\r\n')
+        conn.close()
+
+
+@pytest.fixture
+def webhook():
+    stand_in = WebhookStandIn()
+    yield stand_in
+    stand_in.close()
+
+
+def test_fan_out_is_concurrent(webhook):
+    manager = NotificationManager(build_channels([
+        {'type': 'webhook', 'recipients': [webhook.url(f'/slow/{i}') for i in range(4)], 'timeout': 5},
+    ]))
+    start = time.monotonic()
+    assert manager.send_notification('Subject', '<p>Body</p>')
+    elapsed = time.monotonic() - start
+
+    assert len(webhook.posts) == 4
+    # 4 个接收者各需 0.5 秒，并发发送时总耗时接近单次
+    assert elapsed < 1.5
+    assert webhook.posts[0][1]['text'].startswith('Subject\n\nBody')
+
+
+def test_slow_channel_times_out_without_delaying_others(webhook):
+    manager = NotificationManager(build_channels([
+        {'type': 'webhook', 'name': 'slow', 'recipients': [webhook.url('/slow')], 'timeout': 0.2},
+        {'type': 'webhook', 'name': 'fast', 'recipients': [webhook.url('/fast')], 'timeout': 5},
+    ]))
+    start = time.monotonic()
+    assert not manager.send_notification('Subject', '<p>Body</p>')
+    assert time.monotonic() - start < 0.45
+    assert [post[0] for post in webhook.posts] == ['/fast']
+
+
+def test_rate_limit_skips_deliveries_past_the_deadline(webhook):
+    manager = NotificationManager(build_channels([
+        {'type': 'webhook', 'recipients': [webhook.url(f'/r{i}') for i in range(3)],
+         'rate_per_minute': 1, 'timeout': 5},
+    ]))
+    # 每分钟 1 条：第一条立即发送，其余的等待会超过 5 秒的超时
+    assert not manager.send_notification('Subject', '<p>Body</p>')
+    assert len(webhook.posts) == 1
+
+
+def test_channel_rate_limiter_paces_on_the_clock():
+    clock = FakeClock(start=0.0)
+    previous = set_clock(clock)
+    try:
+        limiter = ChannelRateLimiter(rate_per_minute=6, burst=2)
+        assert limiter.acquire(deadline=100)
+        assert limiter.acquire(deadline=100)
+        assert limiter.acquire(deadline=100)
+        assert clock.elapsed == pytest.approx(10)
+        assert not limiter.acquire(deadline=clock.monotonic() + 5)
+    finally:
+        set_clock(previous)
+
+
+def test_streamed_smtp_data_is_dot_stuffed(tmp_path):
+    report = tmp_path / 'report.txt'
+    report.write_bytes(b''.join(b'.line %d\n' % i for i in range(20000)))
+    smtp = SMTPStandIn()
+    body = '<p>Summary</p>\n.starts with a dot\n..two dots'
+
+    from attachments import PreparedAttachments
+    prepared = PreparedAttachments([str(report)], compression=None)
+    with smtplib.SMTP('127.0.0.1', smtp.port, timeout=5) as server:
+        server.ehlo()
+        EmailChannel([])._send_data(server, 'to@example.com', 'Subject', body, prepared.items)
+    prepared.release()
+
+    raw = smtp.raw[0]
+    # 除结束标记外，没有以单个 '.' 开头的行
+    assert not [line for line in raw.split(b'\r\n')[:-2] if line.startswith(b'.') and not line.startswith(b'..')]
+    message = email.message_from_bytes(smtp.messages[0])
+    parts = [part for part in message.walk() if not part.is_multipart()]
+    assert parts[0].get_payload(decode=True).decode().replace('\r\n', '\n') == body
+    assert parts[1].get_filename() == 'report.txt'
+    assert parts[1].get_payload(decode=True) == report.read_bytes()
+
+
+def test_tenant_only_wechat_channel_logs_in(restore_config, monkeypatch):
+    import trends_monitor
+    import wechat_utils
+    from tenants import load_tenants
+    monkeypatch.setattr(wechat_utils.WeChatManager, '_instance', None)
+    monkeypatch.setattr(trends_monitor, '_tenant_managers', {})
+    restore_config.NOTIFICATION_CONFIG['channels'] = [{'type': 'email', 'recipients': ['a@example.com']}]
+    assert not wechat_utils.WeChatManager()._need_wechat
+
+    tenant, = load_tenants({'ops': {'channels': [{'type': 'wechat', 'recipients': ['ops']}]}}, ['a'],
+                           restore_config.TRENDS_CONFIG, restore_config.MONITOR_CONFIG,
+                           restore_config.SCHEDULE_CONFIG, 'reports/')
+    logins = []
+    monkeypatch.setattr(wechat_utils.WeChatManager, 'login', lambda self: logins.append(1) or True)
+    channel, = trends_monitor.tenant_notification_manager(tenant).channels
+    # 只有租户配置了微信渠道时也会尝试登录，而不是直接丢弃提醒
+    assert channel.wechat_manager.ensure_login()
+    assert logins == [1]
+
+
+class SlowChannel(Channel):
+    type_name = 'slow'
+
+    def __init__(self, started, release):
+        super().__init__(['someone'], timeout=5)
+        self.started = started
+        self.release = release
+
+    def send(self, recipient, subject, body, attachments=None, report_data=None):
+        self.started.set()
+        return self.release.wait(5)
+
+
+def test_shutdown_waits_for_sends_in_progress():
+    started, release = threading.Event(), threading.Event()
+    manager = NotificationManager([SlowChannel(started, release)])
+    results = []
+    sender = threading.Thread(target=lambda: results.append(manager.send_notification('s', '<p>b</p>')))
+    sender.start()
+    assert started.wait(5)
+
+    manager.shutdown()
+    # 进行中的发送不被放弃
+    assert not manager._executor._shutdown
+    release.set()
+    sender.join(5)
+    assert results == [True]
+    assert manager._executor._shutdown
+    for thread in list(manager._executor._threads):
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+def test_config_reload_shuts_down_replaced_managers(restore_config, monkeypatch):
+    import trends_monitor
+    old = NotificationManager([])
+    tenant_manager = NotificationManager([])
+    monkeypatch.setattr(trends_monitor, 'notification_manager', old)
+    monkeypatch.setattr(trends_monitor, '_tenant_managers', {'ops': tenant_manager})
+    trends_monitor.apply_config_changes({'NOTIFICATION_CONFIG'}, None, None, None)
+    assert trends_monitor.notification_manager is not old
+    assert old._executor._shutdown and tenant_manager._executor._shutdown
+    assert trends_monitor._tenant_managers == {}
+
+
+class FakeWeChat:
+    """Stands in for WeChatManager and records every message sent"""
+
+    def __init__(self):
+        self.messages = []
+
+    def ensure_login(self):
+        return True
+
+    def get_user_id(self, recipient):
+        return f"@{recipient}"
+
+    def send_message(self, message, receiver_id):
+        self.messages.append((receiver_id, message))
+        return True
+
+
+@pytest.fixture
+def wechat_channel(monkeypatch):
+    import wechat_utils
+    from notification import WeChatChannel
+    monkeypatch.setattr(wechat_utils.WeChatManager, 'require', lambda self: None)
+    previous = set_clock(FakeClock(start=0.0))
+    channel = WeChatChannel(['ops'])
+    channel.wechat_manager = FakeWeChat()
+    yield channel
+    set_clock(previous)
+
+
+def report_table(related):
+    from result_table import ResultTable
+    results = ResultTable()
+    for keyword, by_type in related.items():
+        results.add(keyword, {trend_type: pd.DataFrame({'query': [q for q, _ in rows], 'value': [v for _, v in rows]})
+                              for trend_type, rows in by_type.items()})
+    return results
+
+
+def test_wechat_report_grouped_by_keyword(tmp_path, wechat_channel):
+    from attachments import Attachment
+    from result_table import table_path
+    report = tmp_path / 'daily_report_20250101.csv'
+    report.write_text('keyword,query,value,type\n')
+    table = report_table({'Image': {'rising': [('ai art', 500)]}, 'Video': {'top': [('clip', 80)]}})
+    # 同一关键词分两次加入的行也归到一起
+    table.add('Image', {'top': pd.DataFrame({'query': ['photo'], 'value': [100]})})
+    table.save(table_path(str(report)))
+
+    assert wechat_channel.send('ops', 'Daily', '<p>Summary:</p>', [Attachment(str(report))])
+    (receiver, message), = wechat_channel.wechat_manager.messages
+    assert receiver == '@ops'
+    lines = message.split('\n')
+    image, video = lines.index('🔍 Image'), lines.index('🔍 Video')
+    assert lines[image:video] == ['🔍 Image', '  ↗️ 上升趋势:', '    • ai art (500)', '  ⭐ 热门趋势:', '    • photo (100)', '']
+    assert lines[video:] == ['🔍 Video', '  ⭐ 热门趋势:', '    • clip (80)']
+
+
+def test_wechat_message_split_into_bounded_chunks(wechat_channel):
+    rows = [(f"query {i:03d} " + 'x' * 40, i) for i in range(120)]
+    report = report_table({'Image': {'rising': rows}})
+    long_line = '<p>' + 'y' * 4500 + '</p>'
+    assert wechat_channel.send('ops', 'Daily', long_line, report_data=report)
+
+    chunks = [message for _, message in wechat_channel.wechat_manager.messages]
+    assert all(len(chunk) <= 2000 for chunk in chunks)
+    # 超长的单行按 2000 字符切开，其余按行拼接且不拆开一行
+    assert ['y' * 2000, 'y' * 2000, 'y' * 500] == [chunk for chunk in chunks if set(chunk) == {'y'}]
+    report_lines = [line for chunk in chunks for line in chunk.split('\n') if line.startswith('    • ')]
+    assert report_lines == [f"    • {query} ({value})" for query, value in rows]
+    assert len(chunks) > 5
@@ -0,0 +1,47 @@
+import random
+import planner
+from planner import plan_run, simulate_run
+from querytrends import RequestLimiter
+
+
+def max_in_window(times, window):
+    """Most calls inside any window seconds long"""
+    most, first = 0, 0
+    for last, at in enumerate(times):
+        while at - times[first] >= window:
+            first += 1
+        most = max(most, last - first + 1)
+    return most
+
+
+def test_simulated_calls_respect_minute_and_hour_caps(monkeypatch):
+    acquired = []
+
+    class RecordingLimiter(RequestLimiter):
+        def try_acquire(self):
+            if super().try_acquire():
+                acquired.append(self.clock())
+                return True
+            return False
+
+    monkeypatch.setattr(planner, 'RequestLimiter', RecordingLimiter)
+    run = simulate_run(300, batch_size=10, batch_interval=30, min_delay=1, max_delay=2,
+                       max_per_minute=6, max_per_hour=200, rng=random.Random(7))
+
+    assert run['http_calls'] == len(acquired) == 600
+    assert max_in_window(acquired, 60) <= 6
+    assert max_in_window(acquired, 3600) <= 200
+    # 600 次调用、每小时 200 次：最后一批至少要到第三个小时
+    assert run['duration'] >= 2 * 3600
+    assert run['limiter_wait'] > 0
+    assert sum(batch['keywords'] for batch in run['timeline']) == 300
+
+
+def test_plan_is_reproducible_with_a_seed():
+    limits = dict(batch_size=5, batch_interval=60, min_delay=1, max_delay=2, max_per_minute=30, max_per_hour=200)
+    first = plan_run(120, window_hours=1, simulations=5, seed=3, **limits)
+    second = plan_run(120, window_hours=1, simulations=5, seed=3, **limits)
+    assert first['duration'] == second['duration'] and first['p95_duration'] == second['p95_duration']
+    assert first['duration'] <= first['p95_duration'] <= first['max_duration']
+    # 240 次调用超过每小时 200 次，一小时内完成不了
+    assert first['duration'] > 3600 and first['warnings']
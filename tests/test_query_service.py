@@ -0,0 +1,114 @@
+import json
+import os
+from datetime import datetime
+import compaction
+from clock import FakeClock
+from compaction import compact_reports
+from query_service import LocalStore, QueryService
+
+
+def write_records(directory, records, name='related_queries_run.jsonl'):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def record(keyword, value, geo='', timeframe='now 7-d'):
+    return {'keyword': keyword, 'geo': geo, 'timeframe': timeframe,
+            'related_queries': {'top': [{'query': f"{keyword} q", 'value': value}], 'rising': None}}
+
+
+def make_service(tmp_path):
+    store = LocalStore(str(tmp_path / 'reports') + '/', str(tmp_path / 'reports' / 'archive'))
+    return store, QueryService(store)
+
+
+def history(service, keyword):
+    response = service.handle('/v1/history', {'keyword': [keyword]})
+    return [(item['date'], item['record']['related_queries']['top'][0]['value'])
+            for item in json.loads(response.body)['results']]
+
+
+def test_history_sees_backfilled_older_day(tmp_path):
+    store, service = make_service(tmp_path)
+    write_records(tmp_path / 'reports' / '20250101', [record('Image', 1)])
+    write_records(tmp_path / 'reports' / '20250102', [record('Image', 2)])
+    assert history(service, 'Image') == [('20250101', 1), ('20250102', 2)]
+
+    # 补录向较早的一天追加记录：目录 mtime 不变，只有文件变化
+    write_records(tmp_path / 'reports' / '20250101', [record('Image', 10)])
+    assert history(service, 'Image') == [('20250101', 10), ('20250102', 2)]
+
+
+def test_related_for_date_sees_appended_records(tmp_path):
+    store, service = make_service(tmp_path)
+    write_records(tmp_path / 'reports' / '20250101', [record('Image', 1)])
+    params = {'keyword': ['Image'], 'date': ['20250101']}
+    assert json.loads(service.handle('/v1/related', params).body)['record']['related_queries']['top'][0]['value'] == 1
+    write_records(tmp_path / 'reports' / '20250101', [record('Image', 5)])
+    assert json.loads(service.handle('/v1/related', params).body)['record']['related_queries']['top'][0]['value'] == 5
+
+
+def test_archive_indexes_parsed_once_and_reloaded_on_change(tmp_path, monkeypatch):
+    # 刚写入的目录默认视为仍在写入，这里立即压缩
+    monkeypatch.setattr(compaction, 'ACTIVE_WRITE_SECONDS', 0)
+    reports = tmp_path / 'reports'
+    write_records(reports / '20250101', [record('Image', 1)])
+    write_records(reports / '20250102', [record('Video', 2)])
+    compact_reports(str(reports) + '/', str(reports / 'archive'), compact_after_days=1, now=datetime(2025, 3, 1))
+    store, service = make_service(tmp_path)
+
+    loads = []
+    original_load = json.load
+    monkeypatch.setattr(json, 'load', lambda f, *a, **k: loads.append(f.name) or original_load(f, *a, **k))
+    assert history(service, 'Image') == [('20250101', 1)]
+    assert history(service, 'Video') == [('20250102', 2)]
+    assert store.find('Image', '20250101') is not None
+    assert len([name for name in loads if name.endswith('.index.json')]) == 1
+
+    # 新的归档改写索引后重新加载
+    write_records(reports / '20250103', [record('Image', 3)])
+    compact_reports(str(reports) + '/', str(reports / 'archive'), compact_after_days=1, now=datetime(2025, 3, 1))
+    loads.clear()
+    assert history(service, 'Image') == [('20250101', 1), ('20250103', 3)]
+    assert history(service, 'Video') == [('20250102', 2)]
+    assert len([name for name in loads if name.endswith('.index.json')]) == 1
+
+
+def test_cache_hits_reuse_the_signature_within_its_ttl(tmp_path, monkeypatch):
+    clock = FakeClock(start=0.0)
+    store = LocalStore(str(tmp_path / 'reports') + '/', str(tmp_path / 'reports' / 'archive'),
+                       signature_ttl=5, clock=clock)
+    service = QueryService(store)
+    write_records(tmp_path / 'reports' / '20250101', [record('Image', 1)])
+    assert history(service, 'Image') == [('20250101', 1)]
+
+    listed = []
+    original_listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda path='.': listed.append(path) or original_listdir(path))
+    write_records(tmp_path / 'reports' / '20250101', [record('Image', 2)])
+    # 签名有效期内命中缓存，不遍历数据目录
+    assert history(service, 'Image') == [('20250101', 1)]
+    assert listed == []
+    clock.sleep(5)
+    assert history(service, 'Image') == [('20250101', 2)]
+
+
+def test_tenant_data_served_with_tenant_parameter(tmp_path, monkeypatch):
+    monkeypatch.setattr(compaction, 'ACTIVE_WRITE_SECONDS', 0)
+    reports = tmp_path / 'reports'
+    write_records(reports / '20250101', [record('Image', 1)])
+    write_records(reports / 'growth' / '20250101', [record('Image', 5)])
+    write_records(reports / 'growth' / '20250102', [record('Image', 6)])
+    compact_reports(str(reports / 'growth') + '/', str(reports / 'archive' / 'growth'), compact_after_days=1,
+                    now=datetime(2025, 3, 1))
+    write_records(reports / 'growth' / '20250103', [record('Image', 7)])
+    store, service = make_service(tmp_path)
+
+    assert history(service, 'Image') == [('20250101', 1)]
+    response = service.handle('/v1/history', {'keyword': ['Image'], 'tenant': ['growth']})
+    assert [(item['date'], item['record']['related_queries']['top'][0]['value'])
+            for item in json.loads(response.body)['results']] == [('20250101', 5), ('20250102', 6), ('20250103', 7)]
+    for tenant in ('missing', '..', 'archive', 'growth/../..'):
+        assert service.handle('/v1/dates', {'tenant': [tenant]}).status == 404
@@ -0,0 +1,50 @@
+import os
+import time
+import pytest
+from clock import FakeClock, set_clock
+from raw_archive import RawArchiveWriter, finalize_parts, iter_archive
+
+
+def test_parts_moved_aside_are_never_overwritten(tmp_path):
+    previous = set_clock(FakeClock(start=0.0))
+    try:
+        part = tmp_path / 'related_queries.rqz.part'
+        for content in (b'first', b'second'):
+            # 编码设置不同（这里是无法识别的头部）的未完成文件被另存
+            part.write_bytes(content)
+            writer = RawArchiveWriter(str(tmp_path), 'related_queries.rqz')
+            writer.write_batch([{'keyword': content.decode()}])
+            writer.close()
+    finally:
+        set_clock(previous)
+
+    aside = sorted(name for name in os.listdir(tmp_path) if name.endswith('.old'))
+    assert len(aside) == 2
+    assert sorted((tmp_path / name).read_bytes() for name in aside) == [b'first', b'second']
+    assert [record['keyword'] for record in iter_archive(str(tmp_path / 'related_queries.rqz'))] == ['first', 'second']
+
+
+def test_final_file_with_other_settings_is_moved_aside(tmp_path):
+    with RawArchiveWriter(str(tmp_path), 'r.rqz') as writer:
+        writer.write_batch([{'keyword': 'a'}])
+    with RawArchiveWriter(str(tmp_path), 'r.rqz', dictionary=b'{"keyword": "b"}' * 10) as writer:
+        writer.write_batch([{'keyword': 'b'}])
+    aside, = [name for name in os.listdir(tmp_path) if name.endswith('.old')]
+    assert [record['keyword'] for record in iter_archive(str(tmp_path / aside))] == ['a']
+    assert [record['keyword'] for record in iter_archive(str(tmp_path / 'r.rqz'))] == ['b']
+
+
+def test_finalize_parts_keeps_settings_and_skips_recent_parts(tmp_path):
+    dictionary = b'{"keyword": "related"}' * 10
+    with RawArchiveWriter(str(tmp_path), 'r.rqz', dictionary=dictionary) as writer:
+        writer.write_batch([{'keyword': 'a'}])
+    writer = RawArchiveWriter(str(tmp_path), 'r.rqz', dictionary=dictionary)
+    writer.write_batch([{'keyword': 'b'}])
+    writer._file.close()  # 模拟崩溃：part 文件未关闭改名
+
+    assert finalize_parts(str(tmp_path), min_age=3600) == 0
+    past = time.time() - 7200
+    os.utime(tmp_path / 'r.rqz.part', (past, past))
+    assert finalize_parts(str(tmp_path), min_age=3600) == 1
+    assert sorted(os.listdir(tmp_path)) == ['r.rqz', f"raw_{writer._dict_id:08x}.dict"]
+    assert [record['keyword'] for record in iter_archive(str(tmp_path / 'r.rqz'))] == ['a', 'b']
@@ -0,0 +1,31 @@
+import os
+import trends_monitor
+import querytrends
+
+
+def test_redirect_outputs_moves_all_state(tmp_path, restore_config, monkeypatch):
+    monkeypatch.setattr(querytrends.single_flight, 'lock_dir', restore_config.COALESCING_CONFIG['lock_dir'])
+    monkeypatch.setattr(trends_monitor, 'notification_manager', trends_monitor.notification_manager)
+    monkeypatch.setattr(trends_monitor, '_tenant_managers', {})
+    output_dir = str(tmp_path)
+    trends_monitor.redirect_outputs(output_dir)
+
+    paths = [
+        restore_config.STORAGE_CONFIG['data_dir_prefix'],
+        restore_config.MONITOR_CONFIG['state_file'],
+        restore_config.MONITOR_CONFIG['alert_state_file'],
+        restore_config.SCHEDULE_CONFIG['state_file'],
+        restore_config.BACKFILL_CONFIG['checkpoint_file'],
+        restore_config.COMPACTION_CONFIG['archive_dir'],
+        restore_config.COALESCING_CONFIG['lock_dir'],
+        querytrends.single_flight.lock_dir,
+    ]
+    for path in paths:
+        assert os.path.commonpath([output_dir, os.path.abspath(path)]) == output_dir, path
+    assert [channel.type_name for channel in trends_monitor.notification_manager.channels] == ['outbox']
+
+
+def test_default_replay_directory_is_outside_tenant_namespace():
+    data_root = os.path.abspath(os.path.dirname(trends_monitor.STORAGE_CONFIG['data_dir_prefix']))
+    replay_root = os.path.abspath(trends_monitor.REPLAY_OUTPUT_DIR)
+    assert os.path.commonpath([data_root, replay_root]) != data_root
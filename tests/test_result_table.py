@@ -0,0 +1,56 @@
+import json
+import math
+import struct
+import pandas as pd
+import pytest
+from result_table import _MAGIC, ResultTable, StringTable
+
+
+def related(queries, values):
+    return {'rising': pd.DataFrame({'query': queries, 'value': values}), 'top': None}
+
+
+@pytest.mark.parametrize('strings', [[], [''], ['', 'a'], ['a', ''], ['a', 'b']])
+def test_string_table_round_trip(strings):
+    table = StringTable()
+    for text in strings:
+        table.intern(text)
+    assert list(StringTable.from_blob(table.to_blob(), len(table))) == strings
+
+
+def test_single_empty_query_survives_save_and_load(tmp_path):
+    results = ResultTable()
+    results.add('', related([''], [100]))
+    path = results.save(str(tmp_path / 'report.rtab'))
+    with ResultTable.load(path) as loaded:
+        assert list(loaded.keywords) == [''] and list(loaded.queries) == ['']
+        assert [(row.keyword, row.query, row.value) for row in loaded] == [('', '', 100.0)]
+
+
+def test_close_releases_the_mapping(tmp_path):
+    results = ResultTable()
+    results.add('Image', related(['cat', 'dog'], [100, 'Breakout']))
+    path = results.save(str(tmp_path / 'report.rtab'))
+    loaded = ResultTable.load(path)
+    assert len(loaded) == 2 and math.isnan(loaded.values[1])
+    loaded.close()
+    assert loaded._mmap is None and len(loaded) == 0
+    loaded.close()
+
+
+def test_tables_without_string_counts_still_load(tmp_path):
+    results = ResultTable()
+    results.add('Image', related(['cat'], [100]))
+    path = results.save(str(tmp_path / 'report.rtab'))
+    # 模拟旧版本文件：头部没有字符串数量
+    with open(path, 'rb') as f:
+        data = f.read()
+    length = struct.unpack('<I', data[8:12])[0]
+    header = json.loads(data[12:12 + length])
+    del header['keywords_count'], header['queries_count']
+    # 用空格补齐头部长度，保持各列的对齐
+    encoded = json.dumps(header).encode('utf-8').ljust(length)
+    with open(path, 'wb') as f:
+        f.write(_MAGIC + struct.pack('<I', length) + encoded + data[12 + length:])
+    with ResultTable.load(path) as loaded:
+        assert [(row.keyword, row.query) for row in loaded] == [('Image', 'cat')]
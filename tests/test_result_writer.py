@@ -0,0 +1,37 @@
+import os
+from result_writer import BatchResultWriter, iter_result_records
+
+
+def records(path):
+    return [record['n'] for record in iter_result_records(path)]
+
+
+def test_rerun_appends_while_final_file_stays_readable(tmp_path):
+    with BatchResultWriter(str(tmp_path), 'r.jsonl') as writer:
+        writer.write_batch([{'n': 1}, {'n': 2}])
+    final = str(tmp_path / 'r.jsonl')
+
+    writer = BatchResultWriter(str(tmp_path), 'r.jsonl')
+    writer.write_batch([{'n': 3}])
+    # 运行期间当天已完成的数据仍可读取
+    assert records(final) == [1, 2]
+    writer.close()
+    assert records(final) == [1, 2, 3]
+    assert os.listdir(tmp_path) == ['r.jsonl']
+
+
+def test_crash_mid_record_resumes_from_last_complete_line(tmp_path):
+    with BatchResultWriter(str(tmp_path), 'r.jsonl') as writer:
+        writer.write_batch([{'n': 1}])
+    writer = BatchResultWriter(str(tmp_path), 'r.jsonl')
+    writer.write_batch([{'n': 2}, {'n': 3}])
+    writer._file.close()
+    # 崩溃时最后一条记录只写了一半
+    part = tmp_path / 'r.jsonl.part'
+    part.write_bytes(part.read_bytes()[:-4])
+
+    with BatchResultWriter(str(tmp_path), 'r.jsonl') as resumed:
+        assert part.read_bytes() == b'{"n": 2}\n'
+        resumed.write_batch([{'n': 4}])
+    assert records(str(tmp_path / 'r.jsonl')) == [1, 2, 4]
+    assert not part.exists()
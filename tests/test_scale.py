@@ -0,0 +1,213 @@
+"""Large multi-geo collection runs on a fake clock against a local stub of the Trends endpoints
+
+Every request goes through the real pipeline (limiter, breaker, token cache,
+trendspy parsing, fair-share queue, result archive, reports, notifications);
+only the HTTP session is replaced by a stub and all waiting happens on a
+FakeClock. The default case is small; the 10k keyword case is marked slow:
+
+    python -m pytest tests/test_scale.py -m slow
+"""
+import json
+import math
+import random
+import time
+import tracemalloc
+from urllib.parse import urlparse
+import pytest
+import requests
+import querytrends
+import trends_monitor
+from clock import FakeClock, set_clock
+from querytrends import RequestLimiter, TokenCache
+from trends_errors import CircuitBreaker
+
+
+class StubTrendsServer:
+    """Answers trendspy's embed and widget requests with synthetic tokens and data
+
+    Installed like a cassette (querytrends.use_cassette): wrap() replaces the
+    session of every Trends client. Every HTTP call is recorded in calls on
+    the simulated clock; error_rate is the share of calls that fail with a
+    connection error, exercising the retry paths.
+    """
+
+    mode = 'stub'
+
+    def __init__(self, clock, rng, error_rate=0.0, related_count=10):
+        self.clock = clock
+        self.rng = rng
+        self.error_rate = error_rate
+        self.related_count = related_count
+        self.calls = []
+        self.errors = 0
+
+    def wrap(self, session):
+        return _StubSession(self)
+
+    @staticmethod
+    def _response(status, text, content_type):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = 'OK'
+        response.headers['Content-Type'] = content_type
+        response._content = text.encode('utf-8')
+        response.encoding = 'utf-8'
+        return response
+
+    def handle(self, url, params):
+        self.calls.append(self.clock.time())
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            raise requests.ConnectionError('Stub connection reset')
+
+        request = json.loads(params['req'])
+        path = urlparse(url).path
+        if '/embed/' in path:
+            return self._token_page(url, request)
+        if path.endswith('/relatedsearches'):
+            keyword = request['restriction']['complexKeywordsRestriction']['keyword'][0]['value']
+            data = {'default': {'rankedList': [
+                {'rankedKeyword': self._ranked(keyword, 'top', 100)},
+                {'rankedKeyword': self._ranked(keyword, 'rising', 1000)}
+            ]}}
+        else:
+            count = len(request['comparisonItem'])
+            now = int(self.clock.time())
+            data = {'default': {'timelineData': [
+                {'time': str(now - 3600 * (72 - i)), 'value': [self.rng.randint(0, 100) for _ in range(count)]}
+                for i in range(72)
+            ]}}
+        return self._response(200, ")]}'\n" + json.dumps(data), 'application/json')
+
+    def _token_page(self, url, request):
+        user_config = {'userType': 'USER_TYPE_SCRAPER'}
+        if url.endswith('RELATED_QUERIES'):
+            item = request['comparisonItem'][0]
+            token = {'token': 'stub', 'type': 'fe_related_searches', 'request': {
+                'restriction': {'geo': {'country': item.get('geo', '')},
+                                'time': item['time'],
+                                'complexKeywordsRestriction': {'keyword': [{'type': 'BROAD', 'value': item['keyword']}]}},
+                'userConfig': user_config}}
+        else:
+            token = {'token': 'stub', 'type': 'fe_line_chart', 'request': {
+                'comparisonItem': [{'geo': {'country': item.get('geo', '')}, 'time': item['time'],
+                                    'complexKeywordsRestriction': {'keyword': [{'type': 'BROAD', 'value': item['keyword']}]}}
+                                   for item in request['comparisonItem']],
+                'userConfig': user_config}}
+        page = "<script>JSON.parse('%s')</script>" % json.dumps(token).replace('"', '\\x22')
+        return self._response(200, page, 'text/html')
+
+    def _ranked(self, keyword, kind, max_value):
+        return [{'query': f"{keyword} {kind} {i}", 'value': self.rng.randint(1, max_value),
+                 'formattedValue': '', 'link': '', 'hasData': True}
+                for i in range(self.related_count)]
+
+
+class _StubSession:
+    def __init__(self, server):
+        self._server = server
+        self.proxies = {}
+        self.headers = {}
+
+    def get(self, url, params=None, **kwargs):
+        return self._server.handle(url, params)
+
+
+def max_in_window(times, window):
+    """Largest number of timestamps inside any half-open window of the given length"""
+    times = sorted(times)
+    best = start = 0
+    for end, current in enumerate(times):
+        while current - times[start] >= window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+def test_max_in_window():
+    assert max_in_window([], 60) == 0
+    assert max_in_window([0, 59.9, 60, 61], 60) == 3
+
+
+def run_simulation(monkeypatch, config, output_dir, keywords, geos, error_rate=0.01, seed=1):
+    """Collect keywords spread over one tenant per geo; returns (success, clock, stub, peak bytes)"""
+    per_geo = math.ceil(keywords / len(geos))
+    config.TENANTS.clear()
+    config.TENANTS.update({
+        geo: {'geo': geo, 'keywords': [f"{geo.lower()} keyword {i}" for i in range(per_geo)]}
+        for geo in geos
+    })
+    limits = config.RATE_LIMIT_CONFIG
+    clock = FakeClock(start=time.time())
+    stub = StubTrendsServer(clock, random.Random(seed), error_rate)
+
+    # 进程内的全局状态换成新的实例，测试结束后还原
+    monkeypatch.setattr(trends_monitor, 'request_limiter',
+                        RequestLimiter(limits['max_requests_per_minute'], limits['max_requests_per_hour']))
+    monkeypatch.setattr(trends_monitor, 'circuit_breaker', CircuitBreaker(
+        limits['breaker_failure_threshold'], limits['breaker_reset_timeout'], limits['breaker_max_reset_timeout']))
+    monkeypatch.setattr(trends_monitor, 'notification_manager', trends_monitor.notification_manager)
+    monkeypatch.setattr(trends_monitor, '_tenant_managers', {})
+    monkeypatch.setattr(trends_monitor, 'stage_timings', {})
+    monkeypatch.setattr(querytrends, 'token_cache', TokenCache(config.TRENDS_CONFIG.get('token_ttl', 300)))
+    monkeypatch.setattr(querytrends.single_flight, 'lock_dir', querytrends.single_flight.lock_dir)
+    trends_monitor.redirect_outputs(str(output_dir))
+
+    previous_clock = set_clock(clock)
+    querytrends.use_cassette(stub)
+    random.seed(seed)
+    tracemalloc.start()
+    try:
+        success = trends_monitor.process_trends()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        querytrends.use_cassette(None)
+        set_clock(previous_clock)
+    return success, clock, stub, peak
+
+
+def check_run(config, success, clock, stub, peak, max_memory_mb, max_report_seconds,
+              duration_tolerance=0.5, seed=1):
+    limits = config.RATE_LIMIT_CONFIG
+    assert success
+    assert stub.calls
+
+    # 限流按桩服务实际收到的 HTTP 请求（模拟时钟上的时间）检查
+    assert max_in_window(stub.calls, 60) <= limits['max_requests_per_minute']
+    assert max_in_window(stub.calls, 3600) <= limits['max_requests_per_hour']
+
+    # 下限：每小时配额和批次间隔各自决定的最短耗时，取较大者
+    total_keywords = sum(len(tenant['keywords']) for tenant in config.TENANTS.values())
+    hour_bound = (math.ceil(len(stub.calls) / limits['max_requests_per_hour']) - 1) * 3600
+    batch_bound = (math.ceil(total_keywords / limits['batch_size']) - 1) * limits['batch_interval']
+    lower_bound = max(hour_bound, batch_bound)
+    # 上限：与 dry-run 使用同样的模型
+    plan = trends_monitor.plan_run(
+        total_keywords,
+        simulations=5,
+        seed=seed,
+        batch_size=limits['batch_size'],
+        batch_interval=limits['batch_interval'],
+        min_delay=limits['min_delay_between_queries'],
+        max_delay=limits['max_delay_between_queries'],
+        max_per_minute=limits['max_requests_per_minute'],
+        max_per_hour=limits['max_requests_per_hour']
+    )
+    assert lower_bound <= clock.elapsed <= plan['p95_duration'] * (1 + duration_tolerance)
+
+    assert peak / 2 ** 20 <= max_memory_mb
+    assert trends_monitor.stage_timings.get('generate_daily_report', 0.0) <= max_report_seconds
+
+
+def test_small_multi_geo_run(monkeypatch, restore_config, tmp_path):
+    keywords = 200
+    result = run_simulation(monkeypatch, restore_config, tmp_path, keywords, ['US', 'GB', 'DE', 'JP'])
+    check_run(restore_config, *result, max_memory_mb=256, max_report_seconds=10)
+
+
+@pytest.mark.slow
+def test_10k_keyword_run(monkeypatch, restore_config, tmp_path):
+    keywords = 10000
+    result = run_simulation(monkeypatch, restore_config, tmp_path, keywords, ['US', 'GB', 'DE', 'JP'])
+    check_run(restore_config, *result, max_memory_mb=1024, max_report_seconds=60)
@@ -0,0 +1,118 @@
+import random
+from datetime import datetime, timedelta
+from clock import FakeClock
+from scheduler import EventScheduler, daily_at, every
+
+
+def timestamp(*args):
+    return datetime(*args).timestamp()
+
+
+def make_scheduler(start, state_file=None):
+    clock = FakeClock(start=start)
+    return clock, EventScheduler(clock=clock, sleep=clock.sleep, state_file=state_file)
+
+
+def test_daily_at_jitter_stays_in_window():
+    rng = random.Random(1)
+    trigger = daily_at(23, 5, random_delay_minutes=15, rng=rng)
+    after = timestamp(2025, 1, 1, 12, 0)
+    for day in range(50):
+        fired = datetime.fromtimestamp(trigger(after))
+        nominal = datetime(2025, 1, 1, 23, 5) + timedelta(days=day)
+        assert nominal <= fired <= nominal + timedelta(minutes=15)
+        after = fired.timestamp()
+
+
+def test_daily_at_jitter_across_midnight_fires_once_per_day():
+    trigger = daily_at(23, 55, random_delay_minutes=15, rng=random.Random(3))
+    fired = trigger(timestamp(2025, 1, 1, 12, 0))
+    # 延迟跨过零点时，下一次仍是当天 23:55 之后，而不是再跳过一天
+    assert trigger(timestamp(2025, 1, 2, 0, 5)) >= timestamp(2025, 1, 2, 23, 55)
+    assert trigger(fired) >= timestamp(2025, 1, 2, 23, 55)
+    assert trigger(fired) <= timestamp(2025, 1, 3, 0, 10)
+
+
+def test_runs_at_deadline_on_fake_clock():
+    clock, scheduler = make_scheduler(timestamp(2025, 1, 1, 22, 0))
+    runs = []
+    scheduler.add_job('collection', lambda: runs.append(clock()), daily_at(23, 5))
+    scheduler.add_job('compaction', lambda: runs.append(('c', clock())), every(7200))
+    scheduler.run_forever(max_iterations=2)
+    assert runs == [timestamp(2025, 1, 1, 23, 5), ('c', timestamp(2025, 1, 2, 0, 0))]
+
+
+def test_catch_up_after_downtime(tmp_path):
+    state_file = str(tmp_path / 'state.json')
+    clock, scheduler = make_scheduler(timestamp(2025, 1, 1, 22, 0), state_file)
+    runs = []
+    scheduler.add_job('collection', lambda: runs.append(clock()), daily_at(23, 5))
+    scheduler.run_forever(max_iterations=1)
+    assert runs == [timestamp(2025, 1, 1, 23, 5)]
+
+    # 重启时 trigger(last_run) 已经过去：立即补跑一次，之后回到正常计划
+    clock, scheduler = make_scheduler(timestamp(2025, 1, 4, 9, 0), state_file)
+    runs = []
+    job = scheduler.add_job('collection', lambda: runs.append(clock()), daily_at(23, 5))
+    assert job.last_run == timestamp(2025, 1, 1, 23, 5)
+    assert job.next_run == clock()
+    scheduler.run_forever(max_iterations=2)
+    assert runs == [timestamp(2025, 1, 4, 9, 0), timestamp(2025, 1, 4, 23, 5)]
+
+
+def test_no_catch_up_when_disabled_or_not_missed(tmp_path):
+    state_file = str(tmp_path / 'state.json')
+    clock, scheduler = make_scheduler(timestamp(2025, 1, 1, 23, 30), state_file)
+    scheduler._state['collection'] = timestamp(2025, 1, 1, 23, 5)
+    job = scheduler.add_job('collection', lambda: None, daily_at(23, 5))
+    assert job.next_run == timestamp(2025, 1, 2, 23, 5)
+
+    clock, scheduler = make_scheduler(timestamp(2025, 1, 4, 9, 0), state_file)
+    scheduler._state['collection'] = timestamp(2025, 1, 1, 23, 5)
+    job = scheduler.add_job('collection', lambda: None, daily_at(23, 5), catch_up=False)
+    assert job.next_run == timestamp(2025, 1, 4, 23, 5)
+
+
+def test_restart_inside_jitter_window_keeps_todays_run():
+    # 名义时间已过但随机延迟未到时重启，当天的运行不能被推到第二天
+    clock, scheduler = make_scheduler(timestamp(2025, 1, 2, 23, 6))
+    scheduler._state['collection'] = timestamp(2025, 1, 1, 23, 10)
+
+    class Late:
+        def randint(self, low, high):
+            return high
+
+    job = scheduler.add_job('collection', lambda: None, daily_at(23, 5, 15, rng=Late()))
+    assert job.next_run == timestamp(2025, 1, 2, 23, 20)
+
+
+def test_state_persisted_and_reloaded(tmp_path):
+    state_file = str(tmp_path / 'nested' / 'state.json')
+    clock, scheduler = make_scheduler(timestamp(2025, 1, 1, 0, 0), state_file)
+    scheduler.add_job('a', lambda: None, every(60))
+    scheduler.add_job('b', lambda: 1 / 0, every(90))
+    scheduler.run_forever(max_iterations=2)
+
+    _, reloaded = make_scheduler(clock(), state_file)
+    # 失败的任务也记录运行时间，不会在重启后反复补跑
+    assert reloaded._state == {'a': timestamp(2025, 1, 1, 0, 1), 'b': timestamp(2025, 1, 1, 0, 1, 30)}
+
+
+def test_corrupt_state_is_ignored(tmp_path):
+    state_file = tmp_path / 'state.json'
+    state_file.write_text('{not json')
+    _, scheduler = make_scheduler(timestamp(2025, 1, 1), str(state_file))
+    assert scheduler._state == {}
+
+
+def test_removed_and_rescheduled_jobs():
+    clock, scheduler = make_scheduler(timestamp(2025, 1, 1, 0, 0))
+    runs = []
+    scheduler.add_job('a', lambda: runs.append('a'), every(60))
+    scheduler.add_job('b', lambda: runs.append('b'), every(120))
+    scheduler.remove_job('a')
+    scheduler.reschedule_job('b', every(30))
+    assert scheduler.next_deadline() == clock() + 30
+    scheduler.run_forever(max_iterations=2)
+    assert runs == ['b', 'b']
+    assert clock.elapsed == 60
@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+import time
+import pandas as pd
+import querytrends
+from singleflight import SingleFlight
+
+
+def test_waiting_process_reuses_json_result(tmp_path):
+    # 两个实例各自打开锁文件，相当于同一台机器上的两个进程
+    first = SingleFlight(str(tmp_path), encode=querytrends._related_to_json, decode=querytrends._related_from_json)
+    second = SingleFlight(str(tmp_path), encode=querytrends._related_to_json, decode=querytrends._related_from_json)
+    started = threading.Event()
+    release = threading.Event()
+    data = {'top': pd.DataFrame({'query': ['a', 'b'], 'value': [100, 50]}), 'rising': None}
+
+    def slow_fetch():
+        started.set()
+        release.wait(5)
+        return data
+
+    results = {}
+    holder = threading.Thread(target=lambda: results.setdefault('first', first.do('key', slow_fetch)))
+    holder.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: results.setdefault('second', second.do('key', lambda: 1 / 0)))
+    waiter.start()
+    time.sleep(0.1)
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+
+    assert results['first'] is data
+    assert second.shared == 1
+    assert results['second']['rising'] is None
+    pd.testing.assert_frame_equal(results['second']['top'], data['top'])
+    # 结果以 JSON 保存，不使用 pickle
+    result_files = [name for name in os.listdir(tmp_path) if name.endswith('.result')]
+    with open(tmp_path / result_files[0], encoding='utf-8') as f:
+        assert json.load(f)['top']['data'] == [['a', 100], ['b', 50]]
+
+
+def test_old_lock_and_result_files_are_removed(tmp_path):
+    flight = SingleFlight(str(tmp_path), result_ttl=60)
+    assert flight.do('old', lambda: 1) == 1
+    old = time.time() - 120
+    for name in os.listdir(tmp_path):
+        os.utime(tmp_path / name, (old, old))
+    (tmp_path / 'stale.result.tmp').write_text('{')
+    os.utime(tmp_path / 'stale.result.tmp', (old, old))
+
+    # 清理每 result_ttl 秒最多执行一次
+    flight._last_sweep = old
+    assert flight.do('new', lambda: 2) == 2
+    lock_path, result_path = flight._paths('new')
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(lock_path), os.path.basename(result_path)])
+
+
+def test_held_lock_is_not_removed(tmp_path):
+    flight = SingleFlight(str(tmp_path), result_ttl=60)
+    lock_path, _ = flight._paths('busy')
+    holder = SingleFlight._open_lock(lock_path)
+    try:
+        old = time.time() - 120
+        os.utime(lock_path, (old, old))
+        flight._sweep()
+        assert os.path.exists(lock_path)
+    finally:
+        holder.close()
+
+
+def test_lock_removed_while_waiting_is_retaken(tmp_path):
+    lock_path = str(tmp_path / 'key.lock')
+    first = SingleFlight._open_lock(lock_path)
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(SingleFlight._open_lock(lock_path)))
+    waiter.start()
+    time.sleep(0.1)
+    # 持锁时删除锁文件：等待者拿到的是旧文件上的锁，必须在新文件上重新加锁
+    os.remove(lock_path)
+    first.close()
+    waiter.join(5)
+    assert os.path.samestat(os.fstat(acquired[0].fileno()), os.stat(lock_path))
+    acquired[0].close()
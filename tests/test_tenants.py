@@ -0,0 +1,37 @@
+import pytest
+import trends_monitor
+from tenants import load_tenants
+
+
+def load(restore_config, tenants):
+    return load_tenants(tenants, ['a'], restore_config.TRENDS_CONFIG, restore_config.MONITOR_CONFIG,
+                        restore_config.SCHEDULE_CONFIG, 'reports/')
+
+
+@pytest.mark.parametrize('name', ['archive', 'Replay', 'outbox', '20250101', '.hidden', 'a/b', ''])
+def test_reserved_tenant_names_rejected(restore_config, name):
+    with pytest.raises(ValueError):
+        load(restore_config, {name: {'keywords': ['a']}})
+
+
+def test_tenant_directories(restore_config):
+    tenants = load(restore_config, {'default': {}, 'growth': {'keywords': ['b']}})
+    assert [tenant.data_dir_prefix for tenant in tenants] == ['reports/', 'reports/growth/']
+
+
+def test_dry_run_plans_every_tenant_and_interest_groups(restore_config, monkeypatch, capsys):
+    monkeypatch.setattr(trends_monitor, 'KEYWORDS', ['a', 'b'])
+    monkeypatch.setattr(trends_monitor, 'TENANTS', {
+        'default': {},
+        'growth': {'keywords': ['A', 'c', 'd']},
+        'uk': {'keywords': ['a'], 'geo': 'GB'},
+    })
+    restore_config.INTEREST_CONFIG['enabled'] = False
+    # a/b + c/d（A 与默认租户共享）+ 英国的 a
+    assert trends_monitor.run_dry_run()['requests'] == 5
+    assert '3 tenants' in capsys.readouterr().out
+
+    restore_config.INTEREST_CONFIG['enabled'] = True
+    restore_config.INTEREST_CONFIG['group_size'] = 5
+    # 每个租户各一组热度趋势请求
+    assert trends_monitor.run_dry_run()['requests'] == 8
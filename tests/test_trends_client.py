@@ -0,0 +1,76 @@
+import json
+import pytest
+import requests
+from trends_client import CachingTrends, TokenCache
+from trends_errors import QuotaExceededError, classify_error
+
+URL = 'https://trends.google.com/trends/embed/explore/RELATED_QUERIES'
+PARAMS = {'keyword': 'Image', 'timeframe': 'now 7-d', 'geo': 'US'}
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def make_client(data_errors):
+    """Client whose data requests fail with data_errors in order, then succeed"""
+    client = CachingTrends(token_cache=TokenCache(ttl=300), request_delay=0)
+    fetched = []
+    errors = list(data_errors)
+
+    def fetch_token(url, params, headers, raise_quota_error, key):
+        token = {'token': f"fresh-{len(fetched)}", 'type': 'fe_related_searches', 'request': {}}
+        fetched.append(token)
+        client.token_cache.put(key, token)
+        return token
+
+    def token_to_data(token):
+        if errors:
+            raise errors.pop(0)
+        return {'token': token['token']}
+
+    client._fetch_token = fetch_token
+    client._token_to_data = token_to_data
+    return client, fetched
+
+
+def cache_token(client):
+    params = client._encode_request(dict(PARAMS))
+    client._fetch_token(URL, params, None, False, (URL, json.dumps(params, sort_keys=True)))
+
+
+@pytest.mark.parametrize('error', [http_error(400), http_error(401), http_error(403),
+                                   ValueError('Failed to parse JSON data'),
+                                   ValueError("Invalid response: status 401, content type 'text/html'")])
+def test_rejected_cached_token_is_renegotiated(error):
+    client, fetched = make_client([error])
+    cache_token(client)
+    token, data = client._get_token_data(URL, dict(PARAMS))
+    assert len(fetched) == 2
+    assert data == {'token': 'fresh-1'}
+
+
+@pytest.mark.parametrize('error', [http_error(429), http_error(503),
+                                   ValueError("Invalid response: status 429, content type 'text/html'")])
+def test_quota_and_server_errors_keep_cached_token(error):
+    client, fetched = make_client([error])
+    cache_token(client)
+    with pytest.raises((requests.HTTPError, ValueError)) as excinfo:
+        client._get_token_data(URL, dict(PARAMS))
+    # 不重新协商 token，错误原样抛出
+    assert len(fetched) == 1
+    assert client.token_cache.hits == 1
+    token, data = client._get_token_data(URL, dict(PARAMS))
+    assert data == {'token': 'fresh-0'}
+    if '429' in str(error):
+        assert isinstance(classify_error(excinfo.value), QuotaExceededError)
+
+
+def test_rejected_fresh_token_is_dropped():
+    client, fetched = make_client([http_error(403)])
+    with pytest.raises(requests.HTTPError):
+        client._get_token_data(URL, dict(PARAMS))
+    client._get_token_data(URL, dict(PARAMS))
+    assert len(fetched) == 2
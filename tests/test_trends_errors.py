@@ -0,0 +1,94 @@
+import threading
+import pytest
+from cassette import CassetteMissError
+from clock import FakeClock
+from querytrends import RequestLimiter
+from trends_errors import (
+    CircuitBreaker, CircuitOpenError, PermanentError, QuotaExceededError, TransientError
+)
+
+
+def open_breaker(clock):
+    breaker = CircuitBreaker(reset_timeout=300, clock=clock)
+    breaker.record_failure(QuotaExceededError('429'))
+    assert breaker.state == 'open'
+    clock.sleep(301)
+    assert breaker.state == 'half_open'
+    return breaker
+
+
+@pytest.mark.parametrize('error', [PermanentError('400'), CassetteMissError('miss')])
+def test_permanent_probe_failure_closes_breaker(error):
+    clock = FakeClock(start=0.0)
+    breaker = open_breaker(clock)
+    breaker.before_request()
+    breaker.record_failure(error)
+
+    assert breaker.state == 'closed'
+    clock.sleep(30000)
+    breaker.before_request()
+
+
+def test_retryable_probe_failure_reopens_with_backoff():
+    clock = FakeClock(start=0.0)
+    breaker = open_breaker(clock)
+    breaker.before_request()
+    breaker.record_failure(TransientError('reset'))
+
+    assert breaker.state == 'open'
+    assert breaker.retry_after() == pytest.approx(600)
+    clock.sleep(601)
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_only_one_probe_while_half_open():
+    clock = FakeClock(start=0.0)
+    breaker = open_breaker(clock)
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_unreported_probe_expires():
+    clock = FakeClock(start=0.0)
+    breaker = open_breaker(clock)
+    breaker.before_request()
+    clock.sleep(300)
+    breaker.before_request()
+
+
+def test_limiter_admits_at_most_the_limit_concurrently():
+    clock = FakeClock(start=0.0)
+    limiter = RequestLimiter(30, 200, clock=clock, sleep=clock.sleep)
+    admitted = []
+    barrier = threading.Barrier(16)
+
+    def worker():
+        barrier.wait()
+        for _ in range(10):
+            if limiter.try_acquire():
+                admitted.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(admitted) == 30
+    assert not limiter.can_make_request()
+    clock.sleep(60)
+    assert limiter.try_acquire()
+
+
+def test_limiter_hourly_limit():
+    clock = FakeClock(start=0.0)
+    limiter = RequestLimiter(30, 200, clock=clock, sleep=clock.sleep)
+    for _ in range(200):
+        limiter.wait_if_needed()
+    assert not limiter.can_make_request()
+    assert clock.elapsed < 3600
+    limiter.wait_if_needed()
+    assert clock.elapsed >= 3600
@@ -0,0 +1,170 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+import requests
+from trendspy import Trends
+from trendspy.client import TrendsQuotaExceededError
+from trends_errors import EmptyResponseError
+from clock import default_clock
+
+OVER_QUOTA_USER_TYPE = 'USER_TYPE_EMBED_OVER_QUOTA'
+
+
+class TokenCache:
+    """Thread-safe TTL cache of widget tokens keyed by (url, encoded request)
+
+    Args:
+        ttl (float): Seconds a token is reused; keep it below the token validity
+        max_entries (int): Oldest tokens are evicted beyond this size
+    """
+
+    def __init__(self, ttl=300, max_entries=1024, clock=default_clock.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None and self.clock() - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            self._tokens.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, token):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._tokens.pop(key, None)
+            self._tokens[key] = (self.clock(), token)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._tokens.pop(key, None)
+
+
+# 数据请求返回这些状态码时视为 token 被拒绝
+TOKEN_REJECTED_STATUSES = (400, 401, 403)
+
+
+def _token_rejected(error):
+    """Whether a failed data request means the widget token itself was rejected
+
+    True for 400/401/403 responses and unparseable bodies; False for quota
+    (429/302), server and other errors, which a new token would not fix.
+    """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in TOKEN_REJECTED_STATUSES
+    message = str(error)
+    if message.startswith('Invalid response: status '):
+        try:
+            return int(message.split()[3].rstrip(',')) in TOKEN_REJECTED_STATUSES
+        except (IndexError, ValueError):
+            return True
+    return True
+
+
+# 每次查询的 HTTP 调用数：token 页面和数据请求，各占一个限流名额
+CALLS_PER_REQUEST = 2
+
+
+class _LimitedSession:
+    """Session proxy taking a request-limiter slot before every HTTP call
+
+    Gating at the session counts what Google actually receives: the token
+    page and the data request of each query, trendspy's internal retries
+    and replayed calls alike.
+    """
+
+    def __init__(self, session, limiter):
+        self._session = session
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def get(self, *args, **kwargs):
+        self._limiter.wait_if_needed()
+        return self._session.get(*args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        self._limiter.wait_if_needed()
+        return self._session.post(*args, **kwargs)
+
+
+class CachingTrends(Trends):
+    """Trends client that reuses widget tokens instead of renegotiating them per request
+
+    Every data request first loads an explore/embed page to obtain a widget
+    token for the keyword, geo and timeframe. The token is cached for the
+    cache's TTL, so retries and repeated requests go straight to the data
+    endpoint. A token the data endpoint rejects is dropped, and over-quota
+    tokens are never cached. With a limiter, every HTTP call waits for a
+    slot of the shared request limiter.
+    """
+
+    def __init__(self, token_cache=None, cassette=None, limiter=None, **kwargs):
+        super().__init__(**kwargs)
+        self.token_cache = token_cache if token_cache is not None else TokenCache()
+        if cassette is not None:
+            # 录制或回放 HTTP 请求（见 cassette.py）
+            self.session = cassette.wrap(self.session)
+            if cassette.mode != 'record':
+                self.request_delay = 0  # 回放或模拟时不联网，节奏由录制的耗时和调用方决定
+        if limiter is not None:
+            self.session = _LimitedSession(self.session, limiter)
+
+    def _get_token_data(self, url, params=None, request_fix=None, headers=None, raise_quota_error=False):
+        params = self._encode_request(params)
+        key = (url, json.dumps(params, sort_keys=True))
+
+        token = self.token_cache.get(key)
+        if token is not None:
+            logging.debug(f"Reusing cached widget token for {url}")
+            try:
+                return token, self._token_to_data(self._fix_token(token, request_fix))
+            except (ValueError, requests.HTTPError) as e:
+                # 只有服务器拒绝了缓存的 token（过期或失效）才丢弃并重新获取；
+                # 限流等其他错误直接抛出，由调用方按配额超限处理
+                if not _token_rejected(e):
+                    raise
+                self.token_cache.invalidate(key)
+                logging.debug(f"Cached widget token rejected, renegotiating: {str(e)}")
+
+        token = self._fetch_token(url, params, headers, raise_quota_error, key)
+        try:
+            data = self._token_to_data(self._fix_token(token, request_fix))
+        except (ValueError, requests.HTTPError) as e:
+            if _token_rejected(e):
+                self.token_cache.invalidate(key)
+            raise
+        return token, data
+
+    @staticmethod
+    def _fix_token(token, request_fix):
+        if request_fix is None:
+            return token
+        return {**token, 'request': {**token['request'], **request_fix}}
+
+    def _fetch_token(self, url, params, headers, raise_quota_error, key):
+        req = self._get(url, params=params, headers=headers)
+        token = self._extract_embedded_data(req.text)
+        if token is None:
+            raise EmptyResponseError(f"No widget token in response from {url}")
+        user_type = token.get('request', {}).get('userConfig', {}).get('userType', '')
+        if user_type == OVER_QUOTA_USER_TYPE:
+            # 超配额的 token 不缓存
+            if raise_quota_error:
+                raise TrendsQuotaExceededError()
+        else:
+            self.token_cache.put(key, token)
+        return token
@@ -0,0 +1,164 @@
+import logging
+import threading
+import requests
+from trendspy.client import TrendsQuotaExceededError
+from clock import default_clock
+
+
+class TrendsError(Exception):
+    """Base class of classified Trends request failures"""
+    retryable = True
+
+
+class QuotaExceededError(TrendsError):
+    """Google is throttling us (embed quota or HTTP 429); all workers should back off"""
+
+
+class EmptyResponseError(TrendsError):
+    """The endpoint returned nothing usable (every attempt failed or no embedded token)"""
+
+
+class TransientError(TrendsError):
+    """Network errors, timeouts, 5xx and malformed responses; worth retrying soon"""
+
+
+class PermanentError(TrendsError):
+    """Bad input or a client error that will fail the same way again"""
+    retryable = False
+
+
+class CircuitOpenError(TrendsError):
+    """Raised without making a request while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _status_error(status):
+    if status in (429, 302):
+        return QuotaExceededError
+    if status >= 500:
+        return TransientError
+    return PermanentError
+
+
+def classify_error(exc):
+    """Map an exception raised by trendspy/requests to a TrendsError subclass instance"""
+    if isinstance(exc, TrendsError):
+        return exc
+    message = str(exc)
+    if isinstance(exc, TrendsQuotaExceededError):
+        error_type = QuotaExceededError
+    elif isinstance(exc, requests.HTTPError) and exc.response is not None:
+        error_type = _status_error(exc.response.status_code)
+    elif isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        error_type = TransientError
+    elif isinstance(exc, (AttributeError, TypeError)) and 'NoneType' in message:
+        # trendspy 在所有尝试都失败或页面中没有 token 时对 None 取属性
+        error_type = EmptyResponseError
+    elif isinstance(exc, ValueError) and message.startswith('Invalid response: status '):
+        try:
+            error_type = _status_error(int(message.split()[3].rstrip(',')))
+        except (IndexError, ValueError):
+            error_type = TransientError
+    elif isinstance(exc, ValueError) and ('Ambiguous input' in message or 'only supports' in message):
+        error_type = PermanentError
+    else:
+        error_type = TransientError
+    error = error_type(f"{type(exc).__name__}: {message}")
+    error.__cause__ = exc
+    return error
+
+
+class CircuitBreaker:
+    """Shared breaker that stops all fetches while the endpoint throttles us
+
+    A quota error opens the circuit at once; other retryable errors open it
+    after failure_threshold consecutive failures. While open, requests fail
+    fast with CircuitOpenError. After reset_timeout one probe request is
+    let through (half-open); success closes the circuit, failure reopens it
+    with the timeout doubled up to max_reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=300, max_reset_timeout=1800, clock=default_clock.time):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._timeout = reset_timeout
+        self._probing = False
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self.clock() - self._opened_at >= self._timeout:
+            return 'half_open'
+        return 'open'
+
+    def retry_after(self):
+        """Seconds until a request may be attempted again, 0 when closed"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self._timeout - self.clock())
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may be sent now"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return
+            # 探测请求的结果一直没有上报时（调用方异常退出），超时后允许新的探测
+            if state == 'half_open' and (not self._probing or self.clock() - self._probe_started >= self.reset_timeout):
+                self._probing = True
+                self._probe_started = self.clock()
+                return
+            remaining = max(1.0, self._opened_at + self._timeout - self.clock()) if state == 'open' \
+                else float(self.reset_timeout) / 10
+        raise CircuitOpenError(remaining)
+
+    def _close(self):
+        if self._opened_at is not None:
+            logging.info("Circuit breaker closed, Trends requests resumed")
+        self._failures = 0
+        self._opened_at = None
+        self._timeout = self.reset_timeout
+        self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._close()
+
+    def record_failure(self, error):
+        """Count a classified failure; permanent errors do not open the circuit
+
+        A failed half-open probe always ends the probe: a permanent error
+        means the endpoint answered, so the circuit closes; any other
+        failure reopens it.
+        """
+        if isinstance(error, CircuitOpenError):
+            return
+        with self._lock:
+            was_probe = self._probing
+            self._probing = False
+            if not error.retryable:
+                if was_probe:
+                    self._close()
+                return
+            self._failures += 1
+            if not (was_probe or isinstance(error, QuotaExceededError) or self._failures >= self.failure_threshold):
+                return
+            if was_probe:
+                self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+            self._opened_at = self.clock()
+            logging.warning(f"Circuit breaker opened for {self._timeout:.0f}s after {type(error).__name__}")
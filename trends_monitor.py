@@ -1,14 +1,40 @@
 import os
 import pandas as pd
-from datetime import datetime, timedelta
-import schedule
+from datetime import timedelta
 import time
 import random
-from querytrends import batch_get_queries, save_related_queries, RequestLimiter
+import threading
+import queue
+from contextlib import contextmanager
+from querytrends import (
+    batch_get_queries, build_related_record, get_interest_over_time, get_related_queries, token_cache, use_cassette,
+    RequestLimiter
+)
+import querytrends
+from trends_client import CALLS_PER_REQUEST
+from cassette import Cassette
+from clock import default_clock, set_clock
+from trends_errors import CircuitBreaker, CircuitOpenError, QuotaExceededError
+from scheduler import EventScheduler, daily_at
+from keyword_expansion import expand_keywords
+from keyword_index import KeywordIndex
+from result_table import ResultTable, table_path
+from anomaly_detector import EwmaDetector
+from alert_store import AlertSuppressor
+from cooccurrence import CooccurrenceGraph, load_history_tables
+from compaction import ACTIVE_WRITE_SECONDS, compact_reports, list_day_directories
+from result_writer import BatchResultWriter
+from raw_archive import ARCHIVE_SUFFIX, RawArchiveWriter, finalize_parts
+from interest import collect_interest, pack_groups, save_interest
+from tenants import FairShareQueue, TenantRun, load_tenants, tenant_archive_dir
+from config_reload import ConfigWatcher, config_lock
+import query_service
+from planner import plan_run, format_plan
+from backfill import Checkpoint, Progress, estimate_duration, job_key, plan_backfill, split_windows, window_day
 import json
 import logging
-import backoff
 import argparse
+import atexit
 from config import (
     EMAIL_CONFIG, 
     KEYWORDS, 
@@ -18,26 +44,56 @@ from config import (
     LOGGING_CONFIG,
     STORAGE_CONFIG,
     TRENDS_CONFIG,
-    NOTIFICATION_CONFIG
-)
-from notification import NotificationManager
-
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, LOGGING_CONFIG['level']),
-    format=LOGGING_CONFIG['format'],
-    handlers=[
-        logging.FileHandler(LOGGING_CONFIG['log_file']),
-        logging.StreamHandler()
-    ]
+    NOTIFICATION_CONFIG,
+    EXPANSION_CONFIG,
+    NORMALIZATION_CONFIG,
+    COOCCURRENCE_CONFIG,
+    COMPACTION_CONFIG,
+    SERVICE_CONFIG,
+    BACKFILL_CONFIG,
+    INTEREST_CONFIG,
+    COALESCING_CONFIG,
+    TENANTS
 )
+from notification import NotificationManager, build_channels
+from logging_setup import setup_logging
+
+# Configure logging: 所有日志经队列由后台线程写入，采集线程不会被 I/O 阻塞
+setup_logging(LOGGING_CONFIG)
 
 # 创建请求限制器实例
-request_limiter = RequestLimiter()
+request_limiter = RequestLimiter(
+    RATE_LIMIT_CONFIG.get('max_requests_per_minute', 30),
+    RATE_LIMIT_CONFIG.get('max_requests_per_hour', 200)
+)
+
+# 熔断器：Google 限流时让所有请求一起暂停，而不是各自等待
+circuit_breaker = CircuitBreaker(
+    failure_threshold=RATE_LIMIT_CONFIG.get('breaker_failure_threshold', 5),
+    reset_timeout=RATE_LIMIT_CONFIG.get('breaker_reset_timeout', 300),
+    max_reset_timeout=RATE_LIMIT_CONFIG.get('breaker_max_reset_timeout', 1800)
+)
 
 # 创建通知管理器实例
 notification_manager = NotificationManager()
 
+# 租户各自配置了通知渠道时使用的通知管理器
+_tenant_managers = {}
+
+# 各阶段累计耗时（秒），回放时输出，用于比较代码修改前后的性能
+stage_timings = {}
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_timings[stage] = stage_timings.get(stage, 0.0) + time.perf_counter() - start
+
+# 关键词规范化索引，用于抓取去重和跨关键词关联相关查询
+keyword_index = KeywordIndex(NORMALIZATION_CONFIG['synonyms'])
+
 def send_email(subject, body, attachments=None):
     """Send email with optional attachments"""
     try:
@@ -73,59 +129,157 @@ def send_email(subject, body, attachments=None):
         # 不要立即抛出异常，让程序继续运行
         return False
 
-def create_daily_directory():
+def result_filename(day=None, tag=''):
+    """Name of the file holding one day's raw results"""
+    day = day or default_clock.now().strftime('%Y%m%d')
+    suffix = ARCHIVE_SUFFIX if STORAGE_CONFIG.get('raw_format') == 'archive' else '.jsonl'
+    return f"{STORAGE_CONFIG['json_filename_prefix']}{day}{tag}{suffix}"
+
+def open_result_writer(directory, filename=None):
+    """Open the raw result writer configured in STORAGE_CONFIG"""
+    filename = filename or result_filename()
+    if STORAGE_CONFIG.get('raw_format') != 'archive':
+        return BatchResultWriter(directory, filename)
+
+    dictionary = None
+    if STORAGE_CONFIG.get('raw_dictionary'):
+        try:
+            with open(STORAGE_CONFIG['raw_dictionary'], 'rb') as f:
+                dictionary = f.read()
+        except OSError as e:
+            logging.warning(f"Failed to load raw archive dictionary, compressing without it: {str(e)}")
+    return RawArchiveWriter(
+        directory,
+        filename,
+        codec=STORAGE_CONFIG.get('raw_codec', 'zlib'),
+        dictionary=dictionary,
+        dict_dir=STORAGE_CONFIG['raw_dict_dir']
+    )
+
+def finalize_stale_parts(data_dir_prefix=None):
+    """Finalize raw result files of earlier days left as .part by interrupted runs
+
+    Today's part file is resumed by the writer itself; parts of other days
+    would otherwise stay hidden from the query service until compaction.
+    """
+    today = default_clock.now().strftime('%Y%m%d')
+    finalized = 0
+    for day, directory in list_day_directories(data_dir_prefix or STORAGE_CONFIG['data_dir_prefix']).items():
+        if day != today:
+            finalized += finalize_parts(directory, STORAGE_CONFIG['raw_dict_dir'], min_age=ACTIVE_WRITE_SECONDS)
+    return finalized
+
+def create_daily_directory(data_dir_prefix=None):
     """Create a directory for today's data"""
-    today = datetime.now().strftime('%Y%m%d')
-    directory = f"{STORAGE_CONFIG['data_dir_prefix']}{today}"
+    today = default_clock.now().strftime('%Y%m%d')
+    directory = f"{data_dir_prefix or STORAGE_CONFIG['data_dir_prefix']}{today}"
     if not os.path.exists(directory):
         os.makedirs(directory)
     return directory
 
-def check_rising_trends(data, keyword, threshold=MONITOR_CONFIG['rising_threshold']):
-    """Check if any rising trends exceed the threshold"""
-    if not data or 'rising' not in data or data['rising'] is None:
-        return []
-    
-    rising_trends = []
-    df = data['rising']
-    if isinstance(df, pd.DataFrame):
-        for _, row in df.iterrows():
-            if row['value'] > threshold:
-                rising_trends.append((row['query'], row['value']))
-    return rising_trends
+def check_rising_trends(results, threshold=MONITOR_CONFIG['rising_threshold']):
+    """Check if any rising trends exceed the threshold
+
+    Returns:
+        list: (keyword, related query, value) tuples above the threshold
+    """
+    return results.rising_above(threshold)
+
+def load_anomaly_detector(monitor=None, state_file=None):
+    """Load the history-based detector, or None when the static threshold is configured"""
+    monitor = monitor or MONITOR_CONFIG
+    if monitor.get('detector', 'threshold') != 'ewma':
+        return None
+    return EwmaDetector.load(
+        state_file or monitor['state_file'],
+        alpha=monitor['ewma_alpha'],
+        z_threshold=monitor['z_threshold'],
+        min_samples=monitor['min_samples'],
+        min_std=monitor['min_std'],
+        fallback_threshold=monitor['rising_threshold'],
+        normalize=keyword_index.normalize,
+        max_age_days=monitor.get('max_age_days', 90)
+    )
+
+def load_alert_suppressor(monitor=None, state_file=None):
+    """Load the store of already sent alerts used to suppress repeats"""
+    monitor = monitor or MONITOR_CONFIG
+    return AlertSuppressor.load(
+        state_file or monitor['alert_state_file'],
+        cooldown_hours=monitor['alert_cooldown_hours'],
+        realert_ratio=monitor['realert_ratio'],
+        retention_days=monitor['alert_retention_days'],
+        normalize=keyword_index.normalize
+    )
 
 def generate_daily_report(results, directory):
     """Generate a daily report in CSV format"""
-    report_data = []
-    
-    for keyword, data in results.items():
-        if data and isinstance(data.get('rising'), pd.DataFrame):
-            rising_df = data['rising']
-            for _, row in rising_df.iterrows():
-                report_data.append({
-                    'keyword': keyword,
-                    'related_keywords': row['query'],
-                    'value': row['value'],
-                    'type': 'rising'
-                })
-        
-        if data and isinstance(data.get('top'), pd.DataFrame):
-            top_df = data['top']
-            for _, row in top_df.iterrows():
-                report_data.append({
-                    'keyword': keyword,
-                    'related_keywords': row['query'],
-                    'value': row['value'],
-                    'type': 'top'
-                })
-    
-    if report_data:
-        df = pd.DataFrame(report_data)
-        filename = f"{STORAGE_CONFIG['report_filename_prefix']}{datetime.now().strftime('%Y%m%d')}.csv"
-        report_file = os.path.join(directory, filename)
-        df.to_csv(report_file, index=False)
-        return report_file
-    return None
+    if not len(results):
+        return None
+
+    df = results.to_dataframe()
+    canonical = {query: keyword_index.normalize(query) for query in results.queries}
+    df.insert(2, 'canonical_query', df['related_keywords'].map(canonical))
+    filename = f"{STORAGE_CONFIG['report_filename_prefix']}{default_clock.now().strftime('%Y%m%d')}.csv"
+    report_file = os.path.join(directory, filename)
+    df.to_csv(report_file, index=False)
+    # 同时保存列式文件，供通知等读取方内存映射加载
+    results.save(table_path(report_file))
+    return report_file
+
+def generate_cluster_report(results, directory, report_file, data_dir_prefix=None):
+    """Build co-occurrence clusters for this run and recent history
+
+    Returns:
+        tuple: (cluster CSV path or None, HTML summary for the report body)
+    """
+    min_seeds = COOCCURRENCE_CONFIG['min_shared_seeds']
+    history = load_history_tables(
+        data_dir_prefix or STORAGE_CONFIG['data_dir_prefix'],
+        STORAGE_CONFIG['report_filename_prefix'],
+        COOCCURRENCE_CONFIG['history_days'],
+        exclude=table_path(report_file)
+    )
+    try:
+        graphs = {
+            'run': CooccurrenceGraph.from_tables([results], keyword_index.normalize),
+            'history': CooccurrenceGraph.from_tables([results] + history, keyword_index.normalize)
+        }
+    finally:
+        for table in history:
+            table.close()
+
+    display = keyword_index.display_text
+
+    rows = []
+    clusters = {}
+    for scope, graph in graphs.items():
+        clusters[scope] = graph.clusters(min_seeds)
+        for number, cluster in enumerate(clusters[scope], 1):
+            rows.append({
+                'scope': scope,
+                'cluster': number,
+                'keywords': '; '.join(display(k) for k in cluster['keywords']),
+                'bridge_queries': '; '.join(display(q) for q in cluster['bridge_queries']),
+                'query_count': cluster['query_count']
+            })
+    if not rows:
+        return None, ''
+
+    filename = f"{COOCCURRENCE_CONFIG['filename_prefix']}{default_clock.now().strftime('%Y%m%d')}.csv"
+    cluster_file = os.path.join(directory, filename)
+    pd.DataFrame(rows).to_csv(cluster_file, index=False)
+
+    max_items = COOCCURRENCE_CONFIG['max_clusters_in_report']
+    html = "<p>Keyword Clusters:</p>\n<ul>\n"
+    for cluster in clusters['run'][:max_items]:
+        bridges = [display(q) for q in cluster['bridge_queries'][:5]]
+        html += (f"<li>{', '.join(display(k) for k in cluster['keywords'])} "
+                 f"({len(cluster['bridge_queries'])} shared queries): {', '.join(bridges)}</li>\n")
+    html += "</ul>\n"
+    html += (f"<p>Cross-seed queries over last {COOCCURRENCE_CONFIG['history_days']} days: "
+             f"{len(graphs['history'].bridges(min_seeds))}</p>\n")
+    return cluster_file, html
 
 def get_date_range_timeframe(timeframe):
     """Convert special timeframe formats to date range format
@@ -142,7 +296,7 @@ def get_date_range_timeframe(timeframe):
     try:
         # 解析天数
         days = int(timeframe.split('-')[1])
-        end_date = datetime.now()
+        end_date = default_clock.now()
         start_date = end_date - timedelta(days=days)
         # 格式化日期字符串
         return f"{start_date.strftime('%Y-%m-%d')} {end_date.strftime('%Y-%m-%d')}"
@@ -150,91 +304,172 @@ def get_date_range_timeframe(timeframe):
         logging.warning(f"Invalid timeframe format: {timeframe}, falling back to 'now 1-d'")
         return 'now 1-d'
 
-def process_keywords_batch(keywords_batch, directory, all_results, high_rising_trends, timeframe):
-    """处理一批关键词"""
-    try:
-        logging.info(f"Processing batch of {len(keywords_batch)} keywords")
-        logging.info(f"Query parameters: timeframe={timeframe}, geo={TRENDS_CONFIG['geo'] or 'Global'}")
-        
-        # 使用传入的 timeframe 参数
-        results = get_trends_with_retry(keywords_batch, timeframe)
-        
-        for keyword, data in results.items():
-            if data:
-                filename = save_related_queries(keyword, data)
-                if filename:
-                    os.rename(filename, os.path.join(directory, filename))
-                
-                rising_trends = check_rising_trends(data, keyword)
-                if rising_trends:
-                    high_rising_trends.extend([(keyword, related_keywords, value) 
-                                             for related_keywords, value in rising_trends])
-                
-                all_results[keyword] = data
-        
-        return True
-    except Exception as e:
-        logging.error(f"Error processing batch: {str(e)}")
-        return False
+def get_trends_with_retry(keywords_batch, timeframe, errors=None, geo=None):
+    """获取一批关键词的趋势数据
 
-@backoff.on_exception(
-    backoff.expo,
-    Exception,
-    max_tries=RATE_LIMIT_CONFIG['max_retries'],
-    jitter=backoff.full_jitter
-)
-def get_trends_with_retry(keywords_batch, timeframe):
-    """使用重试机制获取趋势数据"""
+    重试按关键词进行（见 get_related_queries），已成功的关键词不会被重复请求；
+    共享熔断器打开时本批剩余关键词直接失败并记录到 errors。
+    """
     return batch_get_queries(
         keywords_batch,
         timeframe=timeframe,  # 使用传入的 timeframe
-        geo=TRENDS_CONFIG['geo'],
+        geo=TRENDS_CONFIG['geo'] if geo is None else geo,
         delay_between_queries=random.uniform(
             RATE_LIMIT_CONFIG['min_delay_between_queries'],
             RATE_LIMIT_CONFIG['max_delay_between_queries']
-        )
+        ),
+        limiter=request_limiter,
+        breaker=circuit_breaker,
+        errors=errors
+    )
+
+def collect_interest_over_time(keywords, timeframe, directory, geo=None):
+    """Collect interest over time for the keywords in anchored groups of five and save it as CSV"""
+    if not keywords:
+        return None
+    geo = TRENDS_CONFIG['geo'] if geo is None else geo
+    anchor = INTEREST_CONFIG.get('anchor') or keywords[0]
+    table, _ = collect_interest(
+        keywords,
+        anchor,
+        lambda group: get_interest_over_time(group, geo, timeframe, request_limiter, circuit_breaker,
+                                             RATE_LIMIT_CONFIG['max_retries']),
+        group_size=INTEREST_CONFIG.get('group_size', 5),
+        delay_between_queries=random.uniform(
+            RATE_LIMIT_CONFIG['min_delay_between_queries'],
+            RATE_LIMIT_CONFIG['max_delay_between_queries']
+        ),
+        sleep=request_limiter.sleep
     )
+    if table.empty:
+        return None
+    filename = f"{STORAGE_CONFIG['interest_filename_prefix']}{default_clock.now().strftime('%Y%m%d')}.csv"
+    return save_interest(table, directory, filename)
+
+class InterestCollector:
+    """Background worker collecting interest over time after a tenant's reports are sent
+
+    The grouped requests share the global limiter with collection rounds
+    running at the same time, so they never delay a report or alert.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, tenant, keywords, timeframe, directory):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='interest', daemon=True)
+                self._thread.start()
+        self._queue.put((tenant, list(keywords), timeframe, directory))
 
-def process_trends():
-    """Main function to process trends data"""
+    def wait(self):
+        """Block until every submitted collection has finished"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            tenant, keywords, timeframe, directory = self._queue.get()
+            try:
+                interest_file = collect_interest_over_time(keywords, timeframe, directory, tenant.geo)
+                if interest_file:
+                    logging.info(f"[{tenant.name}] Interest over time saved to {interest_file}")
+            except Exception as e:
+                logging.warning(f"[{tenant.name}] Failed to collect interest over time: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+interest_collector = InterestCollector()
+
+def wait_before_next_batch():
+    """批次间隔，熔断器打开时至少等到可以重新探测"""
+    wait_time = max(RATE_LIMIT_CONFIG['batch_interval'] + random.uniform(0, 60), circuit_breaker.retry_after())
+    logging.info(f"Waiting {wait_time:.1f} seconds before processing next batch...")
+    request_limiter.sleep(wait_time)
+
+def tenant_notification_manager(tenant):
+    """Notification manager of a tenant: its own channels, or the shared manager"""
+    if not tenant.channels:
+        return notification_manager
+    if tenant.name not in _tenant_managers:
+        _tenant_managers[tenant.name] = NotificationManager(build_channels(tenant.channels))
+    return _tenant_managers[tenant.name]
+
+def current_tenants():
+    """Tenants from the current configuration, built from one consistent snapshot"""
+    with config_lock:
+        return load_tenants(TENANTS, KEYWORDS, TRENDS_CONFIG, MONITOR_CONFIG, SCHEDULE_CONFIG,
+                            STORAGE_CONFIG['data_dir_prefix'])
+
+def start_tenant_run(tenant):
+    """Prepare a tenant for a collection round"""
+    # 规范化后去重，同一关键词的不同写法只请求一次
+    keywords = keyword_index.dedupe(tenant.keywords)
+    if len(keywords) < len(tenant.keywords):
+        logging.info(f"[{tenant.name}] Removed {len(tenant.keywords) - len(keywords)} duplicate keywords after normalization")
+    # 处理特殊的 timeframe 格式
+    run = TenantRun(tenant, keywords, get_date_range_timeframe(tenant.timeframe))
+    finalize_stale_parts(tenant.data_dir_prefix)
+    run.directory = create_daily_directory(tenant.data_dir_prefix)
+    run.writer = open_result_writer(run.directory)
+    run.results = ResultTable()
+    run.delivered = 0
+    logging.info(f"[{tenant.name}] Starting trends processing: {len(keywords)} keywords, "
+                 f"timeframe={run.timeframe}, geo={tenant.geo or 'Global'}")
+    return run
+
+def flush_tenant_run(run):
+    """Write results received since the last flush as one batch"""
+    new = run.received[run.delivered:]
+    run.delivered = len(run.received)
+    records = []
+    for keyword, data in new:
+        if data:
+            records.append(build_related_record(keyword, data, run.tenant.geo, run.timeframe))
+            run.results.add(keyword, data)
+    # 整批写入一次并 fsync
+    run.writer.write_batch(records)
+
+def finish_tenant_run(run):
+    """Detect anomalies, write reports and send notifications for a finished tenant"""
+    tenant = run.tenant
+    results = run.results
+    directory = run.directory
+    manager = tenant_notification_manager(tenant)
+    title_suffix = '' if tenant.is_default else f" [{tenant.name}]"
     try:
-        logging.info("Starting daily trends processing")
-        
-        # 处理特殊的 timeframe 格式
-        timeframe = TRENDS_CONFIG['timeframe']
-        actual_timeframe = get_date_range_timeframe(timeframe)
-        
-        logging.info(f"Using configuration: timeframe={actual_timeframe}, geo={TRENDS_CONFIG['geo'] or 'Global'}")
-        directory = create_daily_directory()
-        
-        all_results = {}
-        high_rising_trends = []
-        
-        # 将关键词分批处理，使用实际的 timeframe
-        for i in range(0, len(KEYWORDS), RATE_LIMIT_CONFIG['batch_size']):
-            keywords_batch = KEYWORDS[i:i + RATE_LIMIT_CONFIG['batch_size']]
-            # 传递实际的 timeframe 到查询函数
-            success = process_keywords_batch(
-                keywords_batch, 
-                directory, 
-                all_results, 
-                high_rising_trends,
-                actual_timeframe
-            )
-            
-            if not success:
-                logging.error(f"Failed to process batch starting with keyword: {keywords_batch[0]}")
-                continue
-            
-            # 如果不是最后一批，等待一段时间再处理下一批
-            if i + RATE_LIMIT_CONFIG['batch_size'] < len(KEYWORDS):
-                wait_time = RATE_LIMIT_CONFIG['batch_interval'] + random.uniform(0, 60)
-                logging.info(f"Waiting {wait_time:.1f} seconds before processing next batch...")
-                time.sleep(wait_time)
+        flush_tenant_run(run)
+        run.writer.close()
+
+        detector = load_anomaly_detector(tenant.monitor, tenant.state_path(tenant.monitor['state_file']))
+        if detector is not None:
+            high_rising_trends = detector.detect(results)
+            detector.update(results)
+            try:
+                detector.save(tenant.state_path(tenant.monitor['state_file']))
+            except OSError as e:
+                logging.warning(f"Failed to save anomaly state: {str(e)}")
+        else:
+            high_rising_trends = check_rising_trends(results, tenant.monitor['rising_threshold'])
+
+        # 过滤冷却期内已经提醒过的查询
+        suppressor = load_alert_suppressor(tenant.monitor, tenant.state_path(tenant.monitor['alert_state_file']))
+        candidates = len(high_rising_trends)
+        high_rising_trends = suppressor.filter(high_rising_trends)
+        if candidates > len(high_rising_trends):
+            logging.info(f"Suppressed {candidates - len(high_rising_trends)} repeated alerts")
 
         # Generate and send daily report
-        report_file = generate_daily_report(all_results, directory)
+        with timed('generate_daily_report'):
+            report_file = generate_daily_report(results, directory)
         if report_file:
+            try:
+                cluster_file, cluster_html = generate_cluster_report(results, directory, report_file, tenant.data_dir_prefix)
+            except Exception as e:
+                logging.warning(f"Failed to build keyword clusters: {str(e)}")
+                cluster_file, cluster_html = None, ''
             report_body = """
             <h2>Daily Trends Report</h2>
             <p>Please find attached the daily trends report.</p>
@@ -249,20 +484,26 @@ def process_trends():
             <li>Successful queries: {}</li>
             <li>Failed queries: {}</li>
             </ul>
+            {}
             """.format(
-                TRENDS_CONFIG['timeframe'],
-                TRENDS_CONFIG['geo'] or 'Global',
-                len(KEYWORDS),
-                len(all_results),
-                len(KEYWORDS) - len(all_results)
+                tenant.timeframe,
+                tenant.geo or 'Global',
+                len(run.keywords),
+                len(results.keywords),
+                len(run.keywords) - len(results.keywords),
+                cluster_html
             )
-            if not notification_manager.send_notification(
-                subject=f"Daily Trends Report - {datetime.now().strftime('%Y-%m-%d')}",
-                body=report_body,
-                attachments=[report_file]
-            ):
+            attachments = [report_file] + ([cluster_file] if cluster_file else [])
+            with timed('notification'):
+                sent = manager.send_notification(
+                    subject=f"Daily Trends Report{title_suffix} - {default_clock.now().strftime('%Y-%m-%d')}",
+                    body=report_body,
+                    attachments=attachments,
+                    report_data=results
+                )
+            if not sent:
                 logging.warning("Failed to send daily report, but data collection completed")
-        
+    
         # Send alerts for high rising trends
         if high_rising_trends:
             # 将高趋势分批处理，每批最多10个趋势
@@ -271,14 +512,14 @@ def process_trends():
                 batch_trends = high_rising_trends[i:i + batch_size]
                 batch_number = i // batch_size + 1
                 total_batches = (len(high_rising_trends) + batch_size - 1) // batch_size
-                
+            
                 alert_body = f"""
                 <h2>📊 High Rising Trends Alert</h2>
                 <hr>
                 <h3>📌 Query Parameters:</h3>
                 <ul>
-                    <li>🕒 Time Range: {TRENDS_CONFIG['timeframe']}</li>
-                    <li>🌍 Region: {TRENDS_CONFIG['geo'] or 'Global'}</li>
+                    <li>🕒 Time Range: {tenant.timeframe}</li>
+                    <li>🌍 Region: {tenant.geo or 'Global'}</li>
                 </ul>
                 <h3>📈 Significant Growth Trends:</h3>
                 <table border="1" cellpadding="5" style="border-collapse: collapse;">
@@ -288,7 +529,7 @@ def process_trends():
                         <th>📈 Growth</th>
                     </tr>
                 """
-                
+            
                 for keyword, related_keywords, value in batch_trends:
                     alert_body += f"""
                     <tr>
@@ -297,23 +538,146 @@ def process_trends():
                         <td align="right" style="color: #28a745;">⬆️ {value}%</td>
                     </tr>
                     """
-                
+            
                 alert_body += "</table>"
-                
+            
                 if batch_number < total_batches:
                     alert_body += f"<p><i>This is batch {batch_number} of {total_batches}. More results will follow.</i></p>"
-                
-                if not notification_manager.send_notification(
-                    subject=f"📊 Rising Trends Alert ({batch_number}/{total_batches})",
-                    body=alert_body
-                ):
+            
+                with timed('notification'):
+                    sent = manager.send_notification(
+                        subject=f"📊 Rising Trends Alert{title_suffix} ({batch_number}/{total_batches})",
+                        body=alert_body
+                    )
+                if sent:
+                    suppressor.record(batch_trends)
+                else:
                     logging.warning(f"Failed to send alert notification for batch {batch_number}, but data collection completed")
-                
+            
                 # 添加短暂延迟，避免消息发送过快
-                time.sleep(2)
-        
-        logging.info("Daily trends processing completed successfully")
+                if batch_number < total_batches:
+                    request_limiter.sleep(2)
+
+            try:
+                suppressor.save(tenant.state_path(tenant.monitor['alert_state_file']))
+            except OSError as e:
+                logging.warning(f"Failed to save alert state: {str(e)}")
+
+        # 报告和提醒发出后再在后台采集热度趋势，不推迟通知，也不占用采集轮次
+        if INTEREST_CONFIG.get('enabled', False):
+            interest_collector.submit(tenant, run.keywords, run.timeframe, directory)
+    
+        logging.info(f"[{tenant.name}] Trends processing completed successfully")
         return True
+    except Exception as e:
+        logging.error(f"[{tenant.name}] Error in trends processing: {str(e)}")
+        manager.send_notification(
+            subject=f"❌ Error in Trends Processing{title_suffix}",
+            body=f"<p>An error occurred during trends processing:</p><pre>{str(e)}</pre>"
+        )
+        return False
+
+def update_tenant_runs(queue, tenants):
+    """Apply reloaded tenant keywords to the runs of a round in progress"""
+    tenants = {tenant.name: tenant for tenant in tenants}
+    for run in queue.runs:
+        tenant = tenants.get(run.tenant.name)
+        if tenant is None:
+            logging.warning(f"[{run.tenant.name}] Tenant removed from configuration, cancelling its pending keywords")
+        queue.update(run, keyword_index.dedupe(tenant.keywords) if tenant else [])
+
+def run_collection_round(tenants, poll=None, reload=None):
+    """Collect related queries for several tenants with fair sharing of the request budget
+
+    Keywords of all tenants are interleaved batch by batch (weighted round
+    robin) through the global request limiter; identical requests of
+    different tenants are fetched once. Each tenant is reported as soon as
+    all of its keywords are done.
+
+    Args:
+        tenants (list): Tenants to collect
+        poll (callable): Returns tenants that became due meanwhile; they join at the next batch
+        reload (callable): Returns the reconfigured tenants after a config reload, else None;
+            their keyword changes apply to the runs in progress at the next batch
+
+    Returns:
+        bool: True when every tenant finished successfully
+    """
+    queue = FairShareQueue(keyword_index.normalize, RATE_LIMIT_CONFIG['max_retries'])
+    success = True
+
+    def absorb(new_tenants):
+        for tenant in new_tenants:
+            try:
+                queue.add(start_tenant_run(tenant))
+            except Exception as e:
+                logging.error(f"[{tenant.name}] Failed to start trends processing: {str(e)}")
+
+    def finish_ready():
+        nonlocal success
+        for run in queue.pop_finished():
+            success = finish_tenant_run(run) and success
+
+    try:
+        absorb(tenants)
+        finish_ready()
+        first_batch = True
+        while queue.has_pending():
+            # 不是第一批时，等待一段时间再处理
+            if not first_batch:
+                wait_before_next_batch()
+            first_batch = False
+            if poll is not None:
+                absorb(poll())
+            if reload is not None:
+                tenants = reload()
+                if tenants is not None:
+                    update_tenant_runs(queue, tenants)
+
+            keys = queue.next_batch(RATE_LIMIT_CONFIG['batch_size'])
+            groups = {}
+            for key in keys:
+                keyword, geo, timeframe = queue.request(key)
+                groups.setdefault((geo, timeframe), []).append((key, keyword))
+
+            for (geo, timeframe), items in groups.items():
+                logging.info(f"Processing batch of {len(items)} keywords")
+                logging.info(f"Query parameters: timeframe={timeframe}, geo={geo or 'Global'}")
+                errors = {}
+                try:
+                    results = get_trends_with_retry([keyword for _, keyword in items], timeframe, errors, geo)
+                except Exception as e:
+                    logging.error(f"Error processing batch: {str(e)}")
+                    results = {}
+                for key, keyword in items:
+                    # 因限流失败的关键词放回队尾稍后重试
+                    if isinstance(errors.get(keyword), (QuotaExceededError, CircuitOpenError)):
+                        queue.defer(key)
+                    else:
+                        queue.complete(key, results.get(keyword))
+
+            for run in queue.runs:
+                flush_tenant_run(run)
+            finish_ready()
+    finally:
+        for run in queue.runs:
+            run.writer.close()
+    return success
+
+def process_trends(tenant_names=None):
+    """Main function to process trends data
+
+    Args:
+        tenant_names (list): Tenants to collect, default all configured tenants
+    """
+    try:
+        logging.info("Starting daily trends processing")
+        tenants = [tenant for tenant in current_tenants() if tenant_names is None or tenant.name in tenant_names]
+        success = run_collection_round(tenants)
+        # 单次运行时等待后台的热度趋势采集完成再退出
+        interest_collector.wait()
+        logging.info("Daily trends processing completed successfully")
+        return success
     except Exception as e:
         logging.error(f"Error in trends processing: {str(e)}")
         notification_manager.send_notification(
@@ -322,37 +686,387 @@ def process_trends():
         )
         return False
 
+class TenantRunner:
+    """Background worker running tenant collections as their schedules fire
+
+    Tenants that become due while a round is running join it at the next
+    batch, so all due tenants share the global limiter fairly instead of
+    waiting for each other's full runs.
+    """
+
+    def __init__(self):
+        self._due = []
+        self._reloaded = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='collection', daemon=True)
+        self._thread.start()
+
+    def submit(self, tenant_name):
+        with self._condition:
+            if tenant_name not in self._due:
+                self._due.append(tenant_name)
+            self._condition.notify()
+
+    def _take_due(self):
+        with self._condition:
+            names, self._due = self._due, []
+        tenants = {tenant.name: tenant for tenant in current_tenants()}
+        for name in names:
+            if name not in tenants:
+                logging.warning(f"Tenant {name} is no longer configured, skipping")
+        return [tenants[name] for name in names if name in tenants]
+
+    def config_changed(self):
+        """Apply reloaded keywords to the round in progress at its next batch"""
+        with self._condition:
+            self._reloaded = True
+
+    def _take_reload(self):
+        with self._condition:
+            reloaded, self._reloaded = self._reloaded, False
+        return current_tenants() if reloaded else None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._due:
+                    self._condition.wait()
+                self._reloaded = False
+            try:
+                run_collection_round(self._take_due(), poll=self._take_due, reload=self._take_reload)
+            except Exception as e:
+                logging.error(f"Error in trends processing: {str(e)}")
+
+def run_expansion(seeds, max_depth=None, max_requests=None):
+    """Crawl related queries from the seed keywords and save new candidates"""
+    max_depth = max_depth or EXPANSION_CONFIG['max_depth']
+    max_requests = max_requests or EXPANSION_CONFIG['max_requests']
+    timeframe = get_date_range_timeframe(TRENDS_CONFIG['timeframe'])
+
+    logging.info(f"Starting keyword expansion: seeds={len(seeds)}, depth={max_depth}, budget={max_requests}")
+    discovered = expand_keywords(
+        seeds,
+        geo=TRENDS_CONFIG['geo'],
+        timeframe=timeframe,
+        max_depth=max_depth,
+        max_requests=max_requests,
+        min_rising_value=EXPANSION_CONFIG['min_rising_value'],
+        capacity=EXPANSION_CONFIG['expected_queries'],
+        error_rate=EXPANSION_CONFIG['false_positive_rate'],
+        normalize=keyword_index.normalize,
+        delay_between_queries=(
+            RATE_LIMIT_CONFIG['min_delay_between_queries'],
+            RATE_LIMIT_CONFIG['max_delay_between_queries']
+        ),
+        max_pause=EXPANSION_CONFIG.get('max_pause_seconds', 3600),
+        # 与采集共用同一个限流器和熔断器，扩展请求计入同一份配额
+        fetch=lambda query, geo, timeframe: get_related_queries(
+            query, geo, timeframe, request_limiter, circuit_breaker, RATE_LIMIT_CONFIG['max_retries'])
+    )
+    if not discovered:
+        logging.info("Keyword expansion found no new queries")
+        return None
+
+    directory = create_daily_directory()
+    filename = f"{EXPANSION_CONFIG['filename_prefix']}{default_clock.now().strftime('%Y%m%d')}.csv"
+    expansion_file = os.path.join(directory, filename)
+    pd.DataFrame(discovered).to_csv(expansion_file, index=False)
+    logging.info(f"Saved {len(discovered)} expansion candidates to {expansion_file}")
+    return expansion_file
+
+def run_compaction():
+    """Roll old daily report directories into monthly archives"""
+    result = {'compacted_days': 0, 'deleted_archives': 0}
+    for tenant in current_tenants():
+        # 各租户的数据目录分别归档到 archive_dir/<租户名>
+        archive_dir = tenant_archive_dir(COMPACTION_CONFIG['archive_dir'], tenant.name)
+        tenant_result = compact_reports(
+            tenant.data_dir_prefix,
+            archive_dir,
+            compact_after_days=COMPACTION_CONFIG['compact_after_days'],
+            retention_months=COMPACTION_CONFIG['retention_months'],
+            dict_dir=STORAGE_CONFIG['raw_dict_dir']
+        )
+        for key in result:
+            result[key] += tenant_result[key]
+    logging.info(f"Compaction finished: {result['compacted_days']} days compacted, "
+                 f"{result['deleted_archives']} archives deleted")
+    return result
+
+def run_backfill(start, end, keywords=None, window_days=None):
+    """Collect related queries for past date windows
+
+    Splits [start, end] into windows, skips (keyword, window) jobs already
+    in the local store or the checkpoint, and fetches the rest through the
+    normal batch path. Each window is stored under the day it ends.
+    """
+    window_days = window_days or BACKFILL_CONFIG['window_days']
+    geo = TRENDS_CONFIG['geo']
+    keywords = keyword_index.dedupe(keywords or KEYWORDS)
+    windows = split_windows(start, end, window_days)
+    with Checkpoint(BACKFILL_CONFIG['checkpoint_file']) as checkpoint:
+        return _run_backfill(keywords, windows, geo, checkpoint)
+
+def _run_backfill(keywords, windows, geo, checkpoint):
+    store = query_service.LocalStore(
+        STORAGE_CONFIG['data_dir_prefix'],
+        COMPACTION_CONFIG['archive_dir'],
+        STORAGE_CONFIG.get('raw_dict_dir'),
+        STORAGE_CONFIG['json_filename_prefix']
+    )
+    jobs, skipped = plan_backfill(keywords, windows, geo, checkpoint, store,
+                                  BACKFILL_CONFIG['max_requests_per_run'])
+
+    batch_size = RATE_LIMIT_CONFIG['batch_size']
+    avg_delay = ((RATE_LIMIT_CONFIG['min_delay_between_queries'] + RATE_LIMIT_CONFIG['max_delay_between_queries']) / 2
+                 + 3 + (RATE_LIMIT_CONFIG['batch_interval'] + 30) / batch_size)
+    estimate = estimate_duration(len(jobs), avg_delay, request_limiter.max_requests_per_hour,
+                                 CALLS_PER_REQUEST)
+    logging.info(f"Backfill plan: {len(windows)} windows x {len(keywords)} keywords, "
+                 f"{len(jobs)} requests to make, {skipped} already stored, "
+                 f"estimated {timedelta(seconds=int(estimate))}")
+    if not jobs:
+        return {'completed': 0, 'failed': 0, 'skipped': skipped}
+
+    by_window = {}
+    for keyword, timeframe in jobs:
+        by_window.setdefault(timeframe, []).append(keyword)
+
+    progress = Progress(len(jobs), estimate=estimate)
+    run_tag = f"_backfill_{default_clock.now().strftime('%Y%m%d%H%M%S')}"
+    first_batch = True
+    for timeframe, window_keywords in by_window.items():
+        day = window_day(timeframe)
+        directory = f"{STORAGE_CONFIG['data_dir_prefix']}{day}"
+        # 补录数据单独成文件，避免与当天的定时采集或已归档的文件重名
+        with open_result_writer(directory, result_filename(day, run_tag)) as writer:
+            for i in range(0, len(window_keywords), batch_size):
+                keywords_batch = window_keywords[i:i + batch_size]
+                if not first_batch:
+                    wait_before_next_batch()
+                first_batch = False
+
+                logging.info(f"Backfilling {timeframe}: {len(keywords_batch)} keywords")
+                try:
+                    results = get_trends_with_retry(keywords_batch, timeframe)
+                except Exception as e:
+                    logging.error(f"Backfill batch for {timeframe} failed: {str(e)}")
+                    results = {}
+
+                records = [build_related_record(keyword, results[keyword], geo, timeframe)
+                           for keyword in keywords_batch if results.get(keyword)]
+                writer.write_batch(records)
+                # 先落盘再记录断点，中断后不会漏掉已完成但未保存的任务
+                for keyword in keywords_batch:
+                    if results.get(keyword):
+                        checkpoint.mark_done(job_key(keyword, geo, timeframe))
+                    progress.update(bool(results.get(keyword)))
+
+    logging.info(f"Backfill finished: {progress.done} completed, {progress.failed} failed, {skipped} skipped")
+    return {'completed': progress.done, 'failed': progress.failed, 'skipped': skipped}
+
+def count_round_requests(tenants):
+    """Number of Trends requests one collection round makes for the tenants
+
+    A keyword shared by several tenants (same normalized keyword, geo and
+    timeframe) is fetched once, as in FairShareQueue; interest over time
+    is requested in groups per tenant.
+    """
+    keys = set()
+    interest_groups = 0
+    for tenant in tenants:
+        keywords = keyword_index.dedupe(tenant.keywords)
+        timeframe = get_date_range_timeframe(tenant.timeframe)
+        keys.update((keyword_index.normalize(keyword), tenant.geo, timeframe) for keyword in keywords)
+        if INTEREST_CONFIG.get('enabled', False) and keywords:
+            # 热度趋势按组请求，与相关查询共用同一个请求限制器
+            interest_groups += len(pack_groups(keywords, INTEREST_CONFIG.get('anchor') or keywords[0],
+                                               INTEREST_CONFIG.get('group_size', 5)))
+    return len(keys) + interest_groups
+
+def run_dry_run(keywords=None):
+    """Print the simulated duration and batch timeline of a collection round over all tenants"""
+    with config_lock:
+        tenants = load_tenants(TENANTS, keywords or KEYWORDS, TRENDS_CONFIG, MONITOR_CONFIG, SCHEDULE_CONFIG,
+                               STORAGE_CONFIG['data_dir_prefix'])
+    requests = count_round_requests(tenants)
+    if len(tenants) > 1:
+        print(f"{len(tenants)} tenants: {', '.join(tenant.name for tenant in tenants)}")
+    plan = plan_run(
+        requests,
+        window_hours=SCHEDULE_CONFIG.get('run_window_hours'),
+        batch_size=RATE_LIMIT_CONFIG['batch_size'],
+        batch_interval=RATE_LIMIT_CONFIG['batch_interval'],
+        min_delay=RATE_LIMIT_CONFIG['min_delay_between_queries'],
+        max_delay=RATE_LIMIT_CONFIG['max_delay_between_queries'],
+        max_per_minute=request_limiter.max_requests_per_min,
+        max_per_hour=request_limiter.max_requests_per_hour
+    )
+    print(format_plan(plan))
+    return plan
+
+def redirect_outputs(output_dir):
+    """Send data, state files and notifications of this process to output_dir
+
+    Used by replays and simulations so production data is untouched and
+    nothing is shared with a production process on the same host (request
+    coalescing results, scheduler, backfill and detector state);
+    notifications are written as .eml files to output_dir/outbox.
+    """
+    global notification_manager
+    STORAGE_CONFIG['data_dir_prefix'] = os.path.join(output_dir, '')
+    for settings, key in ((MONITOR_CONFIG, 'state_file'), (MONITOR_CONFIG, 'alert_state_file'),
+                          (SCHEDULE_CONFIG, 'state_file'), (BACKFILL_CONFIG, 'checkpoint_file'),
+                          (COMPACTION_CONFIG, 'archive_dir'), (COALESCING_CONFIG, 'lock_dir')):
+        if settings.get(key):
+            settings[key] = os.path.join(output_dir, os.path.basename(settings[key]))
+    if querytrends.single_flight.lock_dir:
+        querytrends.single_flight.lock_dir = COALESCING_CONFIG['lock_dir']
+    retired = [notification_manager] + list(_tenant_managers.values())
+    notification_manager = NotificationManager(
+        build_channels([{'type': 'outbox', 'recipients': [os.path.join(output_dir, 'outbox')]}]))
+    for manager in retired:
+        manager.shutdown()
+    _tenant_managers.clear()
+    for tenant in current_tenants():
+        _tenant_managers[tenant.name] = notification_manager
+
+# 回放默认输出目录
+REPLAY_OUTPUT_DIR = 'replay_output/'
+
+def run_replay(path, speed=0, output_dir=None):
+    """Run one collection offline against a recorded cassette and print stage timings
+
+    Requests are answered from the cassette and all pacing runs on a
+    simulated clock (speed 0: no real waiting, 1: original pacing). Data,
+    detector state and notifications go to output_dir, notifications as
+    .eml files, so production data is untouched and nothing is sent.
+    """
+    # 不放在数据目录下，避免与租户目录 reports/<租户名>/ 冲突
+    output_dir = output_dir or REPLAY_OUTPUT_DIR
+    cassette = Cassette.replay_from(path, speed)
+    use_cassette(cassette)
+    previous_clock = set_clock(cassette.clock)
+    redirect_outputs(output_dir)
+
+    stage_timings.clear()
+    try:
+        with timed('process_trends'):
+            success = process_trends()
+    finally:
+        use_cassette(None)
+        set_clock(previous_clock)
+
+    print(f"Replayed {cassette.replayed} requests ({cassette.misses} missing) from {path}")
+    print(f"Simulated duration: {timedelta(seconds=int(cassette.clock.elapsed))}")
+    print("Stage timings:")
+    for stage, seconds in sorted(stage_timings.items(), key=lambda item: -item[1]):
+        print(f"  {stage:<24}{seconds:>10.3f}s")
+    return {
+        'success': success,
+        'requests': cassette.replayed,
+        'misses': cassette.misses,
+        'simulated_duration': cassette.clock.elapsed,
+        'timings': dict(stage_timings)
+    }
+
+def collection_trigger(schedule):
+    return daily_at(
+        schedule['hour'],
+        schedule.get('minute', 0),  # 默认为0分钟
+        schedule.get('random_delay_minutes', 0)
+    )
+
+def compaction_trigger():
+    return daily_at(COMPACTION_CONFIG['hour'], COMPACTION_CONFIG.get('minute', 0))
+
+def sync_scheduled_jobs(scheduler, runner, scheduled):
+    """Add, remove and reschedule jobs so they match the current configuration
+
+    Args:
+        scheduled (dict): Job name -> schedule settings it was registered with; updated in place
+    """
+    catch_up = SCHEDULE_CONFIG.get('catch_up', True)
+    wanted = {}
+    for tenant in current_tenants():
+        wanted[tenant.job_name] = (tenant.name, tenant.schedule)
+    if COMPACTION_CONFIG.get('enabled', False):
+        wanted['compaction'] = (None, dict(COMPACTION_CONFIG))
+
+    for job_name in [job_name for job_name in scheduled if job_name not in wanted]:
+        scheduler.remove_job(job_name)
+        del scheduled[job_name]
+        logging.info(f"Job '{job_name}' removed")
+
+    for job_name, (tenant_name, settings) in wanted.items():
+        # 只比较影响触发时间的设置，其他修改不重新计算下一次运行时间
+        timing = {key: settings.get(key) for key in ('hour', 'minute', 'random_delay_minutes')}
+        if scheduled.get(job_name) == timing:
+            continue
+        trigger = compaction_trigger() if tenant_name is None else collection_trigger(settings)
+        if job_name in scheduled:
+            scheduler.reschedule_job(job_name, trigger)
+        elif tenant_name is None:
+            scheduler.add_job(job_name, run_compaction, trigger, catch_up=catch_up)
+        else:
+            # 各租户按自己的计划提交采集，由同一个后台线程公平共享请求配额
+            scheduler.add_job(job_name, lambda name=tenant_name: runner.submit(name), trigger, catch_up=catch_up)
+        scheduled[job_name] = timing
+
+def apply_config_changes(changed, scheduler, runner, scheduled):
+    """Bring the long-lived objects of a running scheduler in line with a reloaded config"""
+    global notification_manager, keyword_index
+
+    if 'RATE_LIMIT_CONFIG' in changed:
+        # 只修改上限，保留已有的请求记录，重新加载不会放开刚用掉的配额
+        request_limiter.max_requests_per_min = RATE_LIMIT_CONFIG.get('max_requests_per_minute', 30)
+        request_limiter.max_requests_per_hour = RATE_LIMIT_CONFIG.get('max_requests_per_hour', 200)
+        circuit_breaker.failure_threshold = RATE_LIMIT_CONFIG.get('breaker_failure_threshold', 5)
+        circuit_breaker.reset_timeout = RATE_LIMIT_CONFIG.get('breaker_reset_timeout', 300)
+        circuit_breaker.max_reset_timeout = RATE_LIMIT_CONFIG.get('breaker_max_reset_timeout', 1800)
+
+    if 'TRENDS_CONFIG' in changed:
+        token_cache.ttl = TRENDS_CONFIG.get('token_ttl', 300)
+
+    if changed & {'NOTIFICATION_CONFIG', 'EMAIL_CONFIG', 'TENANTS'}:
+        retired = [notification_manager] + list(_tenant_managers.values())
+        notification_manager = NotificationManager()
+        _tenant_managers.clear()
+        # 旧的管理器在进行中的发送完成后释放线程
+        for manager in retired:
+            manager.shutdown()
+
+    if 'NORMALIZATION_CONFIG' in changed:
+        keyword_index = KeywordIndex(NORMALIZATION_CONFIG['synonyms'])
+
+    if changed & {'KEYWORDS', 'TENANTS', 'TRENDS_CONFIG', 'NORMALIZATION_CONFIG'}:
+        runner.config_changed()
+
+    if changed & {'SCHEDULE_CONFIG', 'TENANTS', 'COMPACTION_CONFIG'}:
+        sync_scheduled_jobs(scheduler, runner, scheduled)
+
 def run_scheduler():
     """Run the scheduler"""
-    # 从配置中获取小时和分钟
-    schedule_hour = SCHEDULE_CONFIG['hour']
-    schedule_minute = SCHEDULE_CONFIG.get('minute', 0)  # 默认为0分钟
-    
-    # 添加随机延迟（如果配置了的话）
-    if SCHEDULE_CONFIG.get('random_delay_minutes', 0) > 0:
-        random_minutes = random.randint(0, SCHEDULE_CONFIG['random_delay_minutes'])
-        schedule_minute = (schedule_minute + random_minutes) % 60
-        # 如果分钟数超过59，需要调整小时数
-        schedule_hour = (schedule_hour + (schedule_minute + random_minutes) // 60) % 24
-    
-    schedule_time = f"{schedule_hour:02d}:{schedule_minute:02d}"
-    
-    schedule.every().day.at(schedule_time).do(process_trends)
-    
-    logging.info(f"Scheduler started. Will run daily at {schedule_time}")
-    
-    # 如果启动时间接近计划执行时间，等待到下一天
-    now = datetime.now()
-    scheduled_time = now.replace(hour=schedule_hour, minute=schedule_minute, second=0, microsecond=0)
-    
-    if now >= scheduled_time:
-        logging.info("Current time is past scheduled time, waiting for tomorrow")
-        next_run = scheduled_time + timedelta(days=1)
-        time.sleep((next_run - now).total_seconds())
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
+    scheduler = EventScheduler(state_file=SCHEDULE_CONFIG.get('state_file'))
+    runner = TenantRunner()
+    scheduled = {}
+    sync_scheduled_jobs(scheduler, runner, scheduled)
+
+    if SERVICE_CONFIG.get('enabled', False):
+        query_service.start_in_background()
+
+    # 定期检查 config.py，修改在下一次唤醒时生效，不打断正在进行的采集
+    reload_interval = SCHEDULE_CONFIG.get('reload_interval', 0)
+    watcher = ConfigWatcher()
+
+    def reload_config():
+        changed = watcher.check()
+        if changed:
+            apply_config_changes(changed, scheduler, runner, scheduled)
+
+    logging.info(f"Scheduler started with jobs: {', '.join(scheduler.jobs)}")
+    scheduler.run_forever(max_sleep=reload_interval or None,
+                          on_tick=reload_config if reload_interval > 0 else None)
 
 if __name__ == "__main__":
     # 创建命令行参数解析器
@@ -361,8 +1075,57 @@ if __name__ == "__main__":
                       help='立即运行一次数据收集，而不是等待计划时间')
     parser.add_argument('--keywords', nargs='+',
                       help='测试时要查询的关键词列表，如果不指定则使用配置文件中的关键词')
+    parser.add_argument('--serve', action='store_true',
+                      help='只启动本地查询服务，从本地数据提供查询，不发起任何 Google 请求')
+    parser.add_argument('--compact', action='store_true',
+                      help='立即将旧的每日数据目录压缩归档，并按保留期限清理')
+    parser.add_argument('--dry-run', action='store_true',
+                      help='只模拟一次采集，输出预计耗时、请求数和每批时间线，不发起任何请求')
+    parser.add_argument('--backfill', nargs=2, metavar=('START', 'END'),
+                      help='补录历史数据，日期格式 YYYY-MM-DD，例如 --backfill 2024-01-01 2024-03-31')
+    parser.add_argument('--window-days', type=int,
+                      help='补录时每个窗口的天数，默认使用配置文件中的值')
+    parser.add_argument('--record', metavar='CASSETTE',
+                      help='将本次运行的所有 Trends 请求和响应录制到文件（.jsonl.gz）')
+    parser.add_argument('--replay', metavar='CASSETTE',
+                      help='离线回放录制的请求完成一次采集，输出各阶段耗时，不发起请求也不发送通知')
+    parser.add_argument('--replay-speed', type=float, default=0,
+                      help='回放速度，1 为原始节奏，0（默认）为不等待')
+    parser.add_argument('--expand', action='store_true',
+                      help='从关键词出发按相关查询扩展，发现新的候选关键词')
+    parser.add_argument('--expand-depth', type=int,
+                      help='扩展的最大深度，默认使用配置文件中的值')
+    parser.add_argument('--expand-budget', type=int,
+                      help='扩展允许的最大请求数，默认使用配置文件中的值')
     args = parser.parse_args()
 
+    # 查询服务模式只读本地数据，不需要邮件配置
+    if args.serve:
+        server = query_service.create_server()
+        logging.info(f"Query service listening on {server.server_address[0]}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        exit(0)
+
+    if args.dry_run:
+        run_dry_run(args.keywords)
+        exit(0)
+
+    # 回放模式不联网、不发送通知，不需要邮件配置
+    if args.replay:
+        result = run_replay(args.replay, args.replay_speed)
+        exit(0 if result['success'] and not result['misses'] else 1)
+
+    if args.record:
+        recorder = Cassette.record(args.record)
+        use_cassette(recorder)
+        atexit.register(recorder.close)
+        logging.info(f"Recording Trends requests to {args.record}")
+
     # 检查邮件配置
     if not all([
         EMAIL_CONFIG['sender_email'],
@@ -372,12 +1135,20 @@ if __name__ == "__main__":
         logging.error("Please configure email settings in config.py before running")
         exit(1)
     
+    # 归档压缩模式
+    if args.compact:
+        run_compaction()
+    # 历史数据补录模式
+    elif args.backfill:
+        run_backfill(args.backfill[0], args.backfill[1], args.keywords, args.window_days)
+    # 关键词扩展模式
+    elif args.expand:
+        run_expansion(args.keywords or KEYWORDS, args.expand_depth, args.expand_budget)
     # 如果是测试模式
-    if args.test:
+    elif args.test:
         logging.info("Running in test mode...")
         if args.keywords:
             # 临时替换配置文件中的关键词
-            global KEYWORDS
             KEYWORDS = args.keywords
             logging.info(f"Using test keywords: {KEYWORDS}")
         process_trends()
@@ -30,7 +30,11 @@ class WeChatManager:
         self._is_shutting_down = False
         
         # 检查是否需要微信功能
-        self._need_wechat = NOTIFICATION_CONFIG['method'] in ['wechat', 'both']
+        channels = NOTIFICATION_CONFIG.get('channels')
+        if channels:
+            self._need_wechat = any(channel.get('type') == 'wechat' for channel in channels)
+        else:
+            self._need_wechat = NOTIFICATION_CONFIG['method'] in ['wechat', 'both']
         
         # 只有在需要微信功能时才检查itchat是否可用
         self._has_wechat = self._need_wechat and self._check_wechat_available()
@@ -42,6 +46,21 @@ class WeChatManager:
         if self._has_wechat:
             self._try_load_login_status()
     
+    def require(self):
+        """Mark WeChat as needed by a channel that was actually built
+
+        The configuration checked in __init__ only covers the global
+        channels; tenant channels and channels added by a config reload
+        call this when they are created.
+        """
+        with self._login_lock:
+            if self._need_wechat:
+                return
+            self._need_wechat = True
+            self._has_wechat = self._check_wechat_available()
+        if self._has_wechat:
+            self._try_load_login_status()
+
     def _setup_logging(self):
         """设置日志配置"""
         try: